@@ -0,0 +1,227 @@
+###############################################################################
+# bitsets.py - Sets of non-negative integers stored as packed bitsets.
+###############################################################################
+#
+# BitSet is a drop-in replacement of set for the elements of a hierarchy once
+# they are interned (see NestedPartition.interned in hierpart.py), i.e. once
+# they are dense integer ids. The membership is stored in NumPy uint64 words,
+# so intersections, unions and differences are word-wise AND, OR and AND NOT,
+# and sizes come from a popcount table, whatever the number of elements.
+#
+###############################################################################
+
+import numpy as np
+
+# The number of bits set in each 16-bit word.
+_POPCOUNT16 = np.zeros( 1 << 16 , dtype = np.uint8 )
+for _b in xrange( 16 ):
+    _POPCOUNT16 += ( ( np.arange( 1 << 16 ) >> _b ) & 1 ).astype( np.uint8 )
+del _b
+
+_NO_WORDS = np.zeros( 0 , dtype = np.uint64 )
+
+def _popcount( words ):
+    return int( _POPCOUNT16[ words.view( np.uint16 ) ].sum() )
+
+def _as_bitset( elements ):
+    if isinstance( elements , BitSet ):
+        return elements
+    return BitSet( elements )
+
+def _trimmed( offset , words ):
+    """
+    Returns <BitSet> : the set of the words "words" starting at word "offset", without its leading and trailing empty words.
+    """
+    nonzero = np.flatnonzero( words )
+    s = BitSet()
+    if len( nonzero ) > 0:
+        s._offset = offset + int( nonzero[ 0 ] )
+        s._words  = words[ nonzero[ 0 ] : nonzero[ -1 ] + 1 ].copy()
+    return s
+
+class BitSet( object ):
+    """
+    A set of non-negative integers, with the interface of set used by hierpart.NestedPartition. Only the words between the first and the last non-empty ones are stored, from word "_offset" on, so that a set spanning a narrow range of integers is small whatever its largest element. The words are never modified in place, hence they are shared by copies. The other operand of the operations may be any iterable of integers, e.g. a set. Notice that, in Python 2, set() == BitSet() is always False, since set does not defer the comparison; compare with the BitSet on the left.
+
+    >>> a = BitSet( [ 1 , 5 , 64 , 200 ] )
+    >>> b = BitSet( set( [ 5 , 200 , 300 ] ) )
+    >>> len( a ) , list( a & b ) , list( a - b ) , list( a | b )
+    (4, [5, 200], [1, 64], [1, 5, 64, 200, 300])
+    >>> a.intersection_size( b ) , a.isdisjoint( b ) , 64 in a , 65 in a
+    (2, False, True, False)
+    >>> a & b <= a , a <= b , a == set( [ 200 , 64 , 5 , 1 ] ) , a - a == BitSet()
+    (True, False, True, True)
+    >>> c = a.copy()
+    >>> c |= [ 7 ]
+    >>> c -= b
+    >>> c , a
+    (BitSet([1, 7, 64]), BitSet([1, 5, 64, 200]))
+    >>> set( [ 5 , 6 ] ) & a , set( [ 5 , 6 ] ) - a
+    (BitSet([5]), BitSet([6]))
+    """
+    __slots__ = ( '_offset' , '_words' , '_len' )
+
+    def __init__( self , elements = () ):
+        self._len = None
+        if isinstance( elements , BitSet ):
+            self._offset = elements._offset
+            self._words  = elements._words
+            self._len    = elements._len
+            return
+        self._offset = 0
+        self._words  = _NO_WORDS
+        if isinstance( elements , np.ndarray ):
+            ids = elements.astype( np.int64 )
+        else:
+            ids = np.fromiter( elements , dtype = np.int64 )
+        if len( ids ) == 0:
+            return
+        assert ids.min() >= 0 , 'ERROR @ BitSet(...) : the elements must be non-negative integers.'
+        lo = int( ids.min() ) >> 6
+        hi = ( int( ids.max() ) >> 6 ) + 1
+        mask = np.zeros( ( hi - lo ) << 6 , dtype = bool )
+        mask[ ids - ( lo << 6 ) ] = True
+        self._offset = lo
+        self._words  = np.packbits( mask ).view( np.uint64 )
+
+    def _end( self ):
+        return self._offset + len( self._words )
+
+    def _overlap( self , other ):
+        """
+        Returns the words of self and of other over the range of words of both, and the first word of that range, or None if the ranges do not overlap.
+        """
+        lo = max( self._offset , other._offset )
+        hi = min( self._end() , other._end() )
+        if hi <= lo:
+            return None
+        return self._words[ lo - self._offset : hi - self._offset ] , other._words[ lo - other._offset : hi - other._offset ] , lo
+
+    def __len__( self ):
+        if self._len is None:
+            self._len = _popcount( self._words )
+        return self._len
+
+    def __iter__( self ):
+        return iter( ( np.flatnonzero( np.unpackbits( self._words.view( np.uint8 ) ) ) + ( self._offset << 6 ) ).tolist() )
+
+    def __contains__( self , e ):
+        if not isinstance( e , ( int , long , np.integer ) ):
+            return False
+        k = e - ( self._offset << 6 )
+        if k < 0 or k >= len( self._words ) << 6:
+            return False
+        return bool( ( self._words.view( np.uint8 )[ k >> 3 ] >> ( 7 - ( k & 7 ) ) ) & 1 )
+
+    def copy( self ):
+        return BitSet( self )
+
+    def intersection_size( self , other ):
+        """
+        Returns <int> : len( self & other ), without building the intersection.
+        """
+        overlap = self._overlap( _as_bitset( other ) )
+        if overlap is None:
+            return 0
+        w1 , w2 , _ = overlap
+        return _popcount( w1 & w2 )
+
+    def __and__( self , other ):
+        overlap = self._overlap( _as_bitset( other ) )
+        if overlap is None:
+            return BitSet()
+        w1 , w2 , lo = overlap
+        return _trimmed( lo , w1 & w2 )
+
+    def __or__( self , other ):
+        other = _as_bitset( other )
+        if len( other._words ) == 0:
+            return self.copy()
+        if len( self._words ) == 0:
+            return other.copy()
+        lo = min( self._offset , other._offset )
+        words = np.zeros( max( self._end() , other._end() ) - lo , dtype = np.uint64 )
+        words[ self._offset - lo : self._end() - lo ] = self._words
+        words[ other._offset - lo : other._end() - lo ] |= other._words
+        s = BitSet()
+        s._offset = lo
+        s._words  = words
+        return s
+
+    def __sub__( self , other ):
+        overlap = self._overlap( _as_bitset( other ) )
+        if overlap is None:
+            return self.copy()
+        w1 , w2 , lo = overlap
+        words = self._words.copy()
+        words[ lo - self._offset : lo - self._offset + len( w1 ) ] &= ~w2
+        return _trimmed( self._offset , words )
+
+    def __rand__( self , other ):
+        return self & other
+
+    def __ror__( self , other ):
+        return self | other
+
+    def __rsub__( self , other ):
+        return BitSet( other ) - self
+
+    def __ior__( self , other ):
+        s = self | other
+        self._offset , self._words , self._len = s._offset , s._words , s._len
+        return self
+
+    def __isub__( self , other ):
+        s = self - other
+        self._offset , self._words , self._len = s._offset , s._words , s._len
+        return self
+
+    def intersection( self , *others ):
+        s = self
+        for other in others:
+            s = s & other
+        return s
+
+    def union( self , *others ):
+        s = self
+        for other in others:
+            s = s | other
+        return s
+
+    def difference( self , *others ):
+        s = self
+        for other in others:
+            s = s - other
+        return s
+
+    def isdisjoint( self , other ):
+        return self.intersection_size( other ) == 0
+
+    def issubset( self , other ):
+        return len( self - other ) == 0
+
+    def issuperset( self , other ):
+        return len( _as_bitset( other ) - self ) == 0
+
+    def __le__( self , other ):
+        return self.issubset( other )
+
+    def __ge__( self , other ):
+        return self.issuperset( other )
+
+    def __eq__( self , other ):
+        if not isinstance( other , ( BitSet , set , frozenset ) ):
+            return NotImplemented
+        other = _as_bitset( other )
+        return self._offset == other._offset and np.array_equal( self._words , other._words )
+
+    def __ne__( self , other ):
+        equal = self.__eq__( other )
+        if equal is NotImplemented:
+            return equal
+        return not equal
+
+    __hash__ = None
+
+    def __repr__( self ):
+        return 'BitSet(' + str( list( self ) ) + ')'
@@ -6,8 +6,44 @@ from operator import itemgetter
 import networkx as nx
 import itertools
 import contextlib
+import os
+import struct
+import hashlib
+import cPickle
+import inspect
+import types
+import functools
+import math
 import labelings as lbls
 import nxtikz
+import profiling
+import bitsets
+
+def _cached_measure( name ):
+    """
+    Makes a measure method, taking ( self , nsp , ... ), go through the on-disk cache when it is enabled (see enable_cache). The key is made of "name", the digests of self and nsp (see nsp_digest) and the normalization "calc_NMI", if any. Measures that are generators are stored as lists. On a hit, the consistency checks are still run if "run_checks" is True.
+    """
+    def decorate( method ):
+        @functools.wraps( method )
+        def cached_method( self , nsp , *args , **kwargs ):
+            if _cache is None:
+                return method( self , nsp , *args , **kwargs )
+            callargs = inspect.getcallargs( method , self , nsp , *args , **kwargs )
+            key = cache_key( name , nsp_digest( self ) , nsp_digest( nsp ) , callargs.get( 'calc_NMI' ) )
+            value = _cache.get( key )
+            if value is None:
+                value = method( self , nsp , *args , **kwargs )
+                if isinstance( value , types.GeneratorType ):
+                    value = list( value )
+                _cache.put( key , value )
+            elif callargs.get( 'run_checks' , False ):
+                self.check_consistency()
+                nsp.check_consistency()
+            if inspect.isgeneratorfunction( method ):
+                return iter( value )
+            return value
+        return cached_method
+    return decorate
 
 # Hierarchical Partition
 #-----------------------
@@ -16,27 +52,80 @@ class NestedPartition:
     """
     >>>
     """
-    def __init__( self , elements ):
-        if len( elements ) == 0:
+    def __init__( self , elements , labels = None , lazy = False , element_set = None ):
+        if elements is not None and len( elements ) == 0:
             return None
-        self._elements = set( elements )
+        # The elements are kept in a set or, for the 'bitset' backend (see interned), in a bitsets.BitSet; "_element_set" is the type of the sets of elements of the hierarchy. In a lazy hierarchy (see below), "elements" is None for an internal node, whose type of sets is then given by "element_set".
+        if elements is None:
+            assert lazy , 'ERROR @ NestedPartition(...) : only the internal nodes of a lazy hierarchy may have no elements of their own.'
+            self._elements = None
+            self._element_set = set if element_set is None else element_set
+        elif isinstance( elements , bitsets.BitSet ):
+            self._elements = elements.copy()
+            self._element_set = bitsets.BitSet
+        else:
+            self._elements = set( elements )
+            self._element_set = set
+        # The lbls.Enumerate of the labels of the elements if they are interned (see interned), in which case the elements are the dense integer ids of their labels, or None. It is shared by all the nodes of the hierarchy.
+        self._labels = labels
+        # The storage mode of the hierarchy (see copy). If False, every node owns the set of its elements. Otherwise, only the leaves do, and the size and the elements of an internal node are derived from its leaves when needed (see size and elements); the size is cached, and so are the elements if "_lazy" is 'cached'. Both caches are valid while "_cache_version" equals "_version".
+        self._lazy = lazy
+        self._cached_size = None
+        self._cached_elements = None
+        self._cache_version = None
         self._children = set( [] )
+        self._covered  = None if lazy else self._element_set() # The union of the elements of the children, kept up to date by _add_child and _release_child. It is not kept in a lazy hierarchy.
         self._ancestor = None
+        # The number of nodes with one child in the branch spawned by self, kept up to date by _add_child and _release_child, so that the in-place moves find them without visiting the whole branch (see _shrink_inplace).
+        self._one_child_nodes = 0
+        # Structural bookkeeping for check_consistency: "_version" changes whenever the branch spawned by self is modified (see _touch), and "_verified_version" is the version at which that branch was last found consistent.
+        self._version = _newversion()
+        # Changes whenever the set of elements of self is modified in place (see _add_elements), so that IncrementalHMI tells it from a modification of the branch below.
+        self._elements_version = self._version
+        self._verified_version = None
+        self._verified_informative = False
+        # The canonical hashes of the branch spawned by self, the default and the strict one (see canonical_hash), valid while "_hash_version" equals "_version".
+        self._hash = None
+        self._strict_hash = None
+        self._hash_version = None
 
     def __del__( self ):
         self._ancestor = None
         for c in self._children:
             del c
         del self._children
+        del self._covered
         del self._elements
 
     def check_consistency( self , assert_not_non_informative_branches = False ):
         """
-        >>>
+        Checks the whole hierarchy to which self belongs. Branches that were already found consistent, and were not modified since then through _add_child or _release_child (on which splits and merges rely), are not checked again. Hence, on an unchanged hierarchy this costs next to nothing.
+
+        >>> nsp = NestedPartition( [ 0 , 1 , 2 , 3 ] )
+        >>> a = NestedPartition( [ 0 , 1 ] )
+        >>> nsp._add_child( a )
+        >>> try:
+        ...     nsp.check_consistency()
+        ... except AssertionError:
+        ...     print 'inconsistent'
+        inconsistent
+        >>> nsp._add_child( NestedPartition( [ 2 , 3 ] ) )
+        >>> nsp.check_consistency()
+        >>> nsp._is_verified()
+        True
+        >>> a.create_children( [ [ 0 ] , [ 1 ] ] )
+        >>> nsp._is_verified() , a._is_verified()
+        (False, False)
+        >>> nsp.check_consistency( assert_not_non_informative_branches = True )
+        >>> nsp._is_verified( assert_not_non_informative_branches = True )
+        True
         """
         r = self.root()
-        for n in r.DFS():
+        unverified = []
+        for n in r._iter_unverified( assert_not_non_informative_branches ):
+            unverified.append( n )
             assert n.size() > 0 , 'ERROR @ NestedPartition.check_consistency() : the hierarchy contains empty community.' 
+            assert n._one_child_nodes == ( n.degree() == 1 ) + sum( c._one_child_nodes for c in n._children ) , 'ERROR @ NestedPartition.check_consistency() : the count of the nodes with one child is wrong.'
             if n.degree() > 0:
                 if assert_not_non_informative_branches: 
                     assert n.degree() != 1 , 'ERROR @ NestedPartition.check_consistency() : the hierarchy contains a non-informative branch, i.e. a community with one child community, only.'
@@ -44,7 +133,13 @@ class NestedPartition:
                 #assert n.elements() == n.children_union() , 'ERROR @ NestedPartition.check_consistency() : the hierarchy contains a community with a set of elements different from the union of the set of elements of its children communities.'
                 # Improved version of the previous error message.
                 try:
-		            assert n.elements() == n.children_union()
+                    if n._lazy:
+                        # The overlaps are only checked here, since the union of the elements of the children is not kept.
+                        covered = n.children_union( run_checks = False )
+                        assert len( covered ) == sum( c.size() for c in n ) , 'ERROR @ NestedPartition.check_consistency() : the hierarchy contains overlapping sibling communities.'
+                        assert n._elements is None , 'ERROR @ NestedPartition.check_consistency() : an internal node of a lazy hierarchy owns a set of elements.'
+                    else:
+                        assert n._elements == n._covered
                 except AssertionError as error:
                     err_message  = "ERROR @ NestedPartition.check_consistency() : the hierarchy contains a community with a set of elements different from the union of the set of elements of its children communities."
                     err_message += "\n n.degree() = " + str( n.degree() )
@@ -53,6 +148,40 @@ class NestedPartition:
                     err_message += "\n n.children_union() = " + str( sorted( n.children_union() ) )
                     error.args += ( err_message , ) # wrap it up in new tuple
                     raise
+        for n in unverified:
+            n._verified_version = n._version
+            n._verified_informative = assert_not_non_informative_branches
+
+    def _is_verified( self , assert_not_non_informative_branches = False ):
+        """
+        Returns <bool> : True if the branch spawned by self was found consistent (see check_consistency) and was not modified since then.
+        """
+        if self._verified_version != self._version:
+            return False
+        return self._verified_informative or not assert_not_non_informative_branches
+
+    def _iter_unverified( self , assert_not_non_informative_branches = False ):
+        """
+        Iterates over the nodes of the branch spawned by self, skipping the branches that are verified (see _is_verified).
+        """
+        stack = [ self ]
+        while stack:
+            n = stack.pop()
+            if n._is_verified( assert_not_non_informative_branches ):
+                continue
+            yield n
+            stack.extend( n._children )
+
+    def _touch( self , one_child_nodes = 0 ):
+        """
+        Records a structural modification of the branch spawned by self, by giving a new version to self and to all its ancestors, and by adding "one_child_nodes" to their counts of nodes with one child.
+        """
+        version = _newversion()
+        n = self
+        while n is not None:
+            n._version = version
+            n._one_child_nodes += one_child_nodes
+            n = n._ancestor
 
     def iter_partition( self ):
         """
@@ -65,8 +194,34 @@ class NestedPartition:
         """
         >>>
         """
-        for e in self._elements:
-            yield e
+        if self._elements is not None:
+            for e in self._elements:
+                yield e
+        else:
+            for n in self._iter_owners():
+                for e in n._elements:
+                    yield e
+
+    def _iter_owners( self ):
+        """
+        Iterates over the topmost nodes of the branch spawned by self that own the set of their elements, i.e. over its leaves in a lazy hierarchy (see copy), or over self otherwise. Their sets of elements partition the elements of self.
+        """
+        stack = [ self ]
+        while stack:
+            n = stack.pop()
+            if n._elements is not None:
+                yield n
+            else:
+                stack.extend( n._children )
+
+    def _valid_cache( self ):
+        """
+        Clears the caches of a node of a lazy hierarchy if its branch was modified since they were filled.
+        """
+        if self._cache_version != self._version:
+            self._cache_version = self._version
+            self._cached_size = None
+            self._cached_elements = None
             
     def partition( self ):
         """
@@ -81,9 +236,19 @@ class NestedPartition:
         """
         >>>
         """
-        return NestedPartition( set( self.elements() ) )
+        return self._new_node( self.elements() )
+
+    def _new_node( self , elements , lazy = None ):
+        """
+        Returns <NestedPartition> : a new node of the elements "elements", with the labels, the element-set backend (see interned) and, unless "lazy" is not None, the storage mode (see copy) of self. "elements" is None for an internal node of a lazy hierarchy.
+        """
+        if lazy is None:
+            lazy = self._lazy
+        if elements is not None and self._element_set is bitsets.BitSet:
+            elements = bitsets.BitSet( elements )
+        return NestedPartition( elements , self._labels , lazy , self._element_set )
         
-    def copy( self ):
+    def copy( self , lazy = None ):
         """
         >>> k2n = toy()
         >>> nsp = k2n[ 'root' ]
@@ -98,13 +263,160 @@ class NestedPartition:
         nsp[[3, 4, 5, 6], [[7], [8, 9]]]
         >>> cnsp
         nsp[[3, 4, 5, 6], [[0, 1], [2]], [[7], [8, 9]]]
+
+        A lazy copy only stores the elements of the leaves, so a hierarchy of depth D takes O( N ) memory instead of O( N * D ), and splits and merges do not copy the sets of the internal nodes:
+
+        >>> nsp = toy()[ 'root' ]
+        >>> lnsp = nsp.copy( lazy = True )
+        >>> lnsp , lnsp.size() , sorted( lnsp.elements() ) , lnsp.equivalent( nsp )
+        (nsp[[3, 4, 5, 6], [[0, 1], [2]], [[7], [8, 9]]], 10, [0, 1, 2, 3, 4, 5, 6, 7, 8, 9], True)
+        >>> lnsp._elements , sum( n._elements is None for n in lnsp.DFS() )
+        (None, 3)
+        >>> half1 , half2 = lnsp.split_branch( set( [ 1 , 3 , 8 ] ) )
+        >>> half1 , half2 , half2.size() , half1._elements
+        (nsp[[4, 5, 6], [[0], [2]], [[7], [9]]], nsp[[1], [3], [8]], 3, None)
+        >>> a1 , a2 = [ c for c in lnsp if 0 in c.elements() ][ 0 ] , [ c for c in lnsp if 3 in c.elements() ][ 0 ]
+        >>> lnsp.merge_siblings_here( a1 , a2 )
+        >>> lnsp , lnsp.size()
+        (nsp[[[0, 1], [2], [3, 4, 5, 6]], [[7], [8, 9]]], 10)
+        >>> b4 = [ n for n in lnsp.DFS() if n.is_leaf() and 8 in n.elements() ][ 0 ]
+        >>> b4.create_children( [ [ 8 ] , [ 9 ] ] )
+        >>> b4._elements , sorted( b4.elements() ) , lnsp.size()
+        (None, [8, 9], 10)
+        >>> lnsp.check_consistency()
+        >>> lnsp.copy( lazy = False )._covered == set( range( 10 ) )
+        True
+
+        lazy <bool|str=None> : the storage mode of the copy. If False, every node owns the set of its elements. If True, only the leaves do, and an internal node derives its size, which is cached, and its elements, when needed, from its leaves. If 'cached', the elements derived for an internal node are also cached, until its branch is modified. If None, the copy has the storage mode of self.
         """
-        nsp = self.copy_node()
-        for c in self:
-            st = c.copy()
-            nsp._add_child( st )
+        if lazy is None:
+            lazy = self._lazy
+        return self._copy_branch( lambda n : n._branch_node( lazy ) )
+
+    def _branch_node( self , lazy ):
+        """
+        Returns <NestedPartition> : the copy of self, without its children, as a node of a copied branch with the storage mode "lazy" (see copy).
+        """
+        if lazy and not self.is_leaf():
+            return self._new_node( None , lazy )
+        return self._new_node( self.elements() , lazy )
+
+    def _copy_branch( self , copy_node ):
+        """
+        Returns <NestedPartition> : a copy of the branch spawned by self, where copy_node( n ) is the copy of node n without its children.
+        """
+        nsp = copy_node( self )
+        # Explicit-stack traversal: each frame holds the children left to copy and the copy of its node, to which the copy of a child is added once complete, as the recursive version did.
+        stack = [ ( iter( self._children ) , nsp ) ]
+        while stack:
+            children , copy = stack[ -1 ]
+            for c in children:
+                stack.append( ( iter( c._children ) , copy_node( c ) ) )
+                break
+            else:
+                stack.pop()
+                if stack:
+                    stack[ -1 ][ 1 ]._add_child( copy )
         return nsp
+
+    def interned( self , labels = None , backend = 'set' ):
+        """
+        Returns <NestedPartition> : a copy of the branch spawned by self whose elements are interned, namely replaced by the dense integer ids given to their labels by "labels". Hence, the set operations of the measures hash small integers instead of, e.g., strings, or, with the 'bitset' backend, they become word-wise operations on packed bitsets. The elements of an interned hierarchy (see elements, iter_elements, partition) are these ids, including those expected by split_branch and the like, while newick, save, canonical_hash and to_tikz map them back to their labels (see element_labels). Two hierarchies can only be compared if they share the same "labels".
+
+        labels <lbls.Enumerate=None> : the mapping from labels to ids, extended with the labels not in it yet. If None, a new one is used.
+
+        backend <str='set'> : how the elements of each node are stored, either 'set' or 'bitset'. With 'bitset', they are a bitsets.BitSet over the ids, so the size of an intersection costs an AND and a popcount per 64 ids of the range spanned by the nodes, instead of a hash lookup per element. This pays off for hierarchies with large communities, up to a few hundred thousand elements. Hierarchies with different backends can still be compared.
+
+
+        >>> labels = lbls.Enumerate()
+        >>> nsp1 = old_toy_1()[ 'root' ].interned( labels )
+        >>> nsp2 = old_toy_2()[ 'root' ].interned( labels )
+        >>> sorted( nsp1.elements() ) , nsp1
+        ([0, 1, 2, 3, 4, 5], nsp[[['a'], ['b', 'c']], ['d', 'e', 'f']])
+        >>> "%.7f" % nsp1.hierarchical_mutual_information( nsp2 )
+        '0.6931472'
+        >>> nsp1.canonical_hash() == old_toy_1()[ 'root' ].canonical_hash() , nsp1.uninterned().equivalent( old_toy_1()[ 'root' ] )
+        (True, True)
+        >>> try:
+        ...     nsp1.hierarchical_mutual_information( old_toy_2()[ 'root' ] )
+        ... except AssertionError:
+        ...     print 'different labels'
+        different labels
+        >>> nsp1b = old_toy_1()[ 'root' ].interned( labels , backend = 'bitset' )
+        >>> nsp1b.elements() , nsp1b
+        (BitSet([0, 1, 2, 3, 4, 5]), nsp[[['a'], ['b', 'c']], ['d', 'e', 'f']])
+        >>> [ "%.7f" % nsp1b.hierarchical_mutual_information( nsp , engine = engine ) for nsp in [ nsp1b , nsp2 ] for engine in [ 'contingency' , 'recursive' ] ]
+        ['1.0114043', '1.0114043', '0.6931472', '0.6931472']
+        >>> half1 , half2 = nsp1b.split_branch( set( [ labels[ 'a' ] , labels[ 'd' ] ] ) )
+        >>> half1 , half2 , sorted( labels.i2l( e ) for e in half1.elements() )
+        (nsp[['b', 'c'], ['e', 'f']], nsp[['a'], ['d']], ['b', 'c', 'e', 'f'])
+        """
+        if labels is None:
+            labels = lbls.Enumerate()
+        # The new labels are given ids leaf by leaf, in post-order, so that the ids of every community are contiguous, and a bitset spans no more words than needed.
+        for n in self.DFS():
+            if n.is_leaf():
+                for l in n.element_labels():
+                    labels[ l ]
+        element_set = _element_set_backend( backend )
+        def copy_node( n ):
+            if n._elements is None:
+                return NestedPartition( None , labels , n._lazy , element_set )
+            return NestedPartition( element_set( [ labels[ l ] for l in n.element_labels() ] ) , labels , n._lazy )
+        return self._copy_branch( copy_node )
+
+    def uninterned( self ):
+        """
+        Returns <NestedPartition> : a copy of the branch spawned by self whose elements are the labels of its interned elements (see interned).
+        """
+        return self._copy_branch( lambda n : NestedPartition( None if n._elements is None else set( n.element_labels() ) , None , n._lazy ) )
+
+    def labels( self ):
+        """
+        Returns <lbls.Enumerate> : the labels of the interned elements (see interned), or None if the elements are not interned.
+        """
+        return self._labels
+
+    def element_labels( self ):
+        """
+        Returns <list> : the elements of self, mapped back to their labels if they are interned (see interned).
+        """
+        if self._labels is None:
+            return list( self.iter_elements() )
+        i2l = self._labels.i2l
+        return [ i2l( e ) for e in self.iter_elements() ]
                           
+    def compact( self ):
+        """
+        Returns <CompactNestedPartition> : the branch spawned by self stored as NumPy arrays.
+
+        >>> nsp = toy()[ 'root' ]
+        >>> nsp.compact()
+        nsp[[3, 4, 5, 6], [[0, 1], [2]], [[7], [8, 9]]]
+        >>> toy()[ 'a3' ].compact()
+        nsp[[7], [8, 9]]
+        >>> old_toy_1()[ 'root' ].compact()
+        nsp[[['a'], ['b', 'c']], ['d', 'e', 'f']]
+        """
+        parent = []
+        start  = []
+        end    = []
+        perm   = []
+        stack = [ ( self , -1 ) ]
+        while stack:
+            n , p = stack.pop()
+            i = len( parent )
+            parent.append( p )
+            start.append( len( perm ) )
+            end.append( len( perm ) )
+            if n.is_leaf():
+                perm.extend( n.iter_elements() )
+                end[ i ] = len( perm )
+            else:
+                for c in n:
+                    stack.append( ( c , i ) )
+        return CompactNestedPartition( _compact_arrays( parent , start , end , perm , self._labels ) )
+
     def _copy( self , nsp_reference ):
         """
         This special copyier will return the copy, plus a reference to the copy of the node "nsp_reference". The node "nsp_reference" should be a node of the tree of root "self".
@@ -112,15 +424,20 @@ class NestedPartition:
         >>>
         """
         nsp_to_ret = None
-        nsp_copy = self.copy_node()
-        #if self._id == nsp_reference._id:
-        if self == nsp_reference:        
-            nsp_to_ret = nsp_copy
-        for c in self:
-            st , _nsp = c._copy( nsp_reference )
-            if _nsp is not None:
-                nsp_to_ret = _nsp
-            nsp_copy._add_child( st )
+        nsp_copy = self._branch_node( self._lazy )
+        stack = [ ( self , iter( self._children ) , nsp_copy ) ]
+        while stack:
+            n , children , copy = stack[ -1 ]
+            for c in children:
+                stack.append( ( c , iter( c._children ) , c._branch_node( self._lazy ) ) )
+                break
+            else:
+                stack.pop()
+                #if n._id == nsp_reference._id:
+                if n == nsp_reference:
+                    nsp_to_ret = copy
+                if stack:
+                    stack[ -1 ][ 2 ]._add_child( copy )
         return nsp_copy , nsp_to_ret
                              
     def _shrink( self ):
@@ -128,21 +445,30 @@ class NestedPartition:
         
         >>>
         """
-        # Shrink its children.
-        for cnsp in self:
-            cnsp._shrink()
-        # Shrink locally.
-        if self.is_leaf():
-            return
-        if self.degree() == 1:
-            child = self._pop_child()
-            assert self.degree() == 0
-            child_degree = child.degree()
-            ch_ch = child._pop_child()
-            while ch_ch is not None:
-                self._add_child( ch_ch )
-                ch_ch = child._pop_child()                
-            assert self.degree() == child_degree                             
+        # Post-order traversal with an explicit stack: the children of a node are shrunk before the node itself.
+        stack = [ ( self , iter( self._children ) ) ]
+        while stack:
+            n , children = stack[ -1 ]
+            for c in children:
+                stack.append( ( c , iter( c._children ) ) )
+                break
+            else:
+                stack.pop()
+                # Shrink locally.
+                if n.is_leaf():
+                    continue
+                if n.degree() == 1:
+                    child = n._pop_child()
+                    assert n.degree() == 0
+                    child_degree = child.degree()
+                    if child.is_leaf() and n._elements is None:
+                        # In a lazy hierarchy, n becomes a leaf, so it takes over the elements of its only child.
+                        n._elements = child._elements
+                    ch_ch = child._pop_child()
+                    while ch_ch is not None:
+                        n._add_child( ch_ch )
+                        ch_ch = child._pop_child()
+                    assert n.degree() == child_degree
                              
     def _split_node( self , splitter_set ):
         """
@@ -155,32 +481,45 @@ class NestedPartition:
         if len( e1 ) == 0:
             nsp1 = None
         else:
-            nsp1 = NestedPartition( e1 )
+            nsp1 = self._new_node( e1 )
         if len( e2 ) == 0:
             nsp2 = None
         else:
-            nsp2 = NestedPartition( e2 )
+            nsp2 = self._new_node( e2 )
         return nsp1 , nsp2
             
     def _recursive_split( self , splitter_set ):
         """
         >>>
         """
-        nsp1 , nsp2 = self._split_node( splitter_set )
-        if nsp1 is None and nsp2 is None:
-            assert False
-        if self.is_leaf():
-            return nsp1 , nsp2
-        else:
-            for ch in self:
-                ch_nsp1 , ch_nsp2 = ch._recursive_split( splitter_set )
-                if ch_nsp1 is not None:
-                    assert nsp1 is not None
-                    nsp1._add_child( ch_nsp1 )
-                if ch_nsp2 is not None:
-                    assert nsp2 is not None            
-                    nsp2._add_child( ch_nsp2 )                    
-            return nsp1 , nsp2                 
+        lazy = self._lazy
+        def split( n ):
+            if lazy and not n.is_leaf():
+                # The halves of an internal node of a lazy hierarchy hold no elements, and are only created when the first half of a child is added to them.
+                return [ iter( n._children ) , None , None ]
+            nsp1 , nsp2 = n._split_node( splitter_set )
+            if nsp1 is None and nsp2 is None:
+                assert False
+            return [ iter( n._children ) , nsp1 , nsp2 ]
+        # Each frame holds the children left to split and the two halves of its node, to which the halves of a child are added once complete.
+        top = split( self )
+        stack = [ top ]
+        while stack:
+            children , nsp1 , nsp2 = stack[ -1 ]
+            for ch in children:
+                stack.append( split( ch ) )
+                break
+            else:
+                stack.pop()
+                if stack:
+                    parent = stack[ -1 ]
+                    for k , nsp in [ ( 1 , nsp1 ) , ( 2 , nsp2 ) ]:
+                        if nsp is not None:
+                            if lazy and parent[ k ] is None:
+                                parent[ k ] = self._new_node( None )
+                            assert parent[ k ] is not None
+                            parent[ k ]._add_child( nsp )
+        return top[ 1 ] , top[ 2 ]
         
     def split_branch( self , splitter_set ):
         """
@@ -272,7 +611,9 @@ class NestedPartition:
         >>> mnsp
         nsp[[0, 1], [2], [3, 4, 5, 6]]
         """
-        mnsp = NestedPartition( nsp1.elements().union( nsp2.elements() ) )
+        assert nsp1._labels is nsp2._labels , 'ERROR @ merge_branchs(...) : the elements of both branches must be interned with the same labels.'
+        assert nsp1._lazy == nsp2._lazy , 'ERROR @ merge_branchs(...) : the branches must have the same storage mode.'
+        mnsp = nsp1._new_node( None if nsp1._lazy else nsp1.elements().union( nsp2.elements() ) )
         if nsp1.is_leaf():
             mnsp._add_child( nsp1.copy() )
         else:
@@ -315,6 +656,191 @@ class NestedPartition:
         self._release_child( nsp1 )
         self._release_child( nsp2 )        
         self._add_child( self.merge_branchs( nsp1 , nsp2 ) )
+
+    def split_here_inplace( self , splitter_set ):
+        """
+        Same as split_here, but the existing nodes are reused instead of copied: the nodes of the branch spawned by self that lie on one side of the split are moved as they are, and only those that straddle it are split, the elements of the other side going to a new node. The sets of elements of the straddling nodes are updated in place, so a split costs O( n ) time for the n elements that change sides, plus the intersection of splitter_set with the children of the straddling nodes, instead of creating new nodes and sets for the whole branch. A side of a straddling node that is left with one child is replaced by that child, and so is every node with one child of the resulting branches (see _shrink_inplace), since split_here runs _shrink over them, so that both give the same hierarchy. Returns <Move> : the record of the modification, which reverts it (see Move.undo).
+
+        >>> k2n = toy()
+        >>> nsp = k2n[ 'root' ]
+        >>> a1 = k2n[ 'a1' ]
+        >>> move = a1.split_here_inplace( set( [ 1 , 3 , 8 ] ) )
+        >>> nsp
+        nsp[[1], [3, 4, 5, 6], [[0], [2]], [[7], [8, 9]]]
+        >>> a1 , nsp.is_child( a1 )
+        (..nsp[[0], [2]], True)
+        >>> nsp.check_consistency()
+        >>> move.undo()
+        >>> nsp , a1
+        (nsp[[3, 4, 5, 6], [[0, 1], [2]], [[7], [8, 9]]], ..nsp[[0, 1], [2]])
+        >>> nsp.check_consistency()
+        >>> move = k2n[ 'a3' ].split_here_inplace( set( [ 8 , 9 ] ) )
+        >>> nsp , k2n[ 'b4' ].ancestor() is nsp
+        (nsp[[3, 4, 5, 6], [7], [8, 9], [[0, 1], [2]]], True)
+        >>> move.undo()
+        >>> k2n2 = toy()
+        >>> for k in ( k2n , k2n2 ):
+        ...     k[ 'b1' ]._add_child( NestedPartition( [ 0 , 1 ] ) )
+        >>> nsp
+        nsp[[3, 4, 5, 6], [[2], [[0, 1]]], [[7], [8, 9]]]
+        >>> move = a1.split_here_inplace( set( [ 2 ] ) )
+        >>> k2n2[ 'a1' ].split_here( set( [ 2 ] ) )
+        >>> nsp , k2n2[ 'root' ]
+        (nsp[[0, 1], [2], [3, 4, 5, 6], [[7], [8, 9]]], nsp[[0, 1], [2], [3, 4, 5, 6], [[7], [8, 9]]])
+        >>> move.undo()
+        >>> nsp
+        nsp[[3, 4, 5, 6], [[2], [[0, 1]]], [[7], [8, 9]]]
+        >>> nsp.check_consistency()
+        """
+        assert not self.is_root()
+        assert isinstance( splitter_set , set )
+        move = Move()
+        ansp = self.ancestor()
+        def classify( c ):
+            # Returns the elements of c in splitter_set, or None if c holds no elements to tell.
+            if c._elements is None:
+                return None
+            return c._elements & splitter_set
+        def place( c , sides , targets ):
+            # Detaches c if it is not one of its sides, and attaches the sides of c to their targets.
+            if c not in sides and c._ancestor is not None:
+                move._release_child( c._ancestor , c )
+            for s , target in zip( sides , targets ):
+                if s is None or s._ancestor is target:
+                    continue
+                if s._ancestor is not None:
+                    move._release_child( s._ancestor , s )
+                move._add_child( target , s )
+        def split_internal( n , removed , results ):
+            if all( s2 is None for _ , _ , s2 in results ):
+                return n , None
+            if all( s1 is None for _ , s1 , _ in results ):
+                return None , n
+            n2 = n._new_node( removed )
+            for c , s1 , s2 in results:
+                place( c , ( s1 , s2 ) , ( n , n2 ) )
+            # The elements in splitter_set leave n once its children did, and before n2 gets attached, so that the steps can be undone in reverse order.
+            if removed is not None:
+                move._remove_elements( n , removed )
+            sides = [ n , n2 ]
+            for k , s in enumerate( sides ):
+                if s.degree() == 1:
+                    c = s.random_child()
+                    move._release_child( s , c )
+                    sides[ k ] = c
+            return tuple( sides )
+        def sides_of( c , removed ):
+            # Returns the sides of c if it needs no traversal, or None after pushing its frame.
+            if removed is not None:
+                if len( removed ) == 0:
+                    return c , None
+                if len( removed ) == len( c._elements ):
+                    return None , c
+                if c.is_leaf():
+                    move._remove_elements( c , removed )
+                    return c , c._new_node( removed )
+            stack.append( ( c , removed , iter( list( c._children ) ) , [] ) )
+            return None
+        # Each frame holds the node being split, its elements in splitter_set (if it holds elements), its children left to split and the sides of those already done.
+        stack = []
+        top = sides_of( self , classify( self ) )
+        while stack:
+            n , removed , children , results = stack[ -1 ]
+            for c in children:
+                sides = sides_of( c , classify( c ) )
+                if sides is None:
+                    break
+                results.append( ( c , ) + sides )
+            else:
+                stack.pop()
+                sides = split_internal( n , removed , results )
+                if stack:
+                    stack[ -1 ][ 3 ].append( ( n , ) + sides )
+                else:
+                    top = sides
+        place( self , top , ( ansp , ansp ) )
+        for s in top:
+            if s is not None:
+                s._shrink_inplace( move )
+        return move
+
+    def merge_siblings_here_inplace( self , nsp1 , nsp2 ):
+        """
+        Same as merge_siblings_here, but the existing nodes are reused instead of copied: the largest sibling that is not a leaf becomes the merged community, and only the children of the other one, or the other one itself if it is a leaf, are moved into it. Hence, a merge costs O( n ) time for the n elements of the other sibling. Since merge_siblings_here runs _shrink over the merged branch, the nodes with one child of that branch are replaced by their children (see _shrink_inplace), so that both give the same hierarchy. Returns <Move> : the record of the modification, which reverts it (see Move.undo).
+
+        >>> k2n = toy()
+        >>> nsp = k2n[ 'root' ]
+        >>> a1 , a2 , a3 = k2n[ 'a1' ] , k2n[ 'a2' ] , k2n[ 'a3' ]
+        >>> move = nsp.merge_siblings_here_inplace( a1 , a2 )
+        >>> nsp , a1.ancestor() is nsp , a2.ancestor() is a1
+        (nsp[[[0, 1], [2], [3, 4, 5, 6]], [[7], [8, 9]]], True, True)
+        >>> move.undo()
+        >>> nsp
+        nsp[[3, 4, 5, 6], [[0, 1], [2]], [[7], [8, 9]]]
+        >>> move = nsp.merge_siblings_here_inplace( a1 , a3 )
+        >>> nsp , nsp.degree()
+        (nsp[[3, 4, 5, 6], [[0, 1], [2], [7], [8, 9]]], 2)
+        >>> nsp.check_consistency()
+        >>> move.undo()
+        >>> nsp.check_consistency()
+        >>> k2n[ 'b4' ]._add_child( NestedPartition( [ 8 , 9 ] ) )
+        >>> move = nsp.merge_siblings_here_inplace( a2 , a3 )
+        >>> nsp
+        nsp[[[0, 1], [2]], [[3, 4, 5, 6], [7], [8, 9]]]
+        >>> move.undo()
+        >>> nsp
+        nsp[[3, 4, 5, 6], [[0, 1], [2]], [[7], [[8, 9]]]]
+        >>> try:
+        ...     nsp.merge_siblings_here_inplace( k2n[ 'b3' ] , k2n[ 'b4' ] )
+        ... except AssertionError:
+        ...     print 'not siblings of nsp'
+        not siblings of nsp
+        """
+        assert nsp1.ancestor() == self
+        assert nsp2.ancestor() == self
+        assert nsp1 is not nsp2
+        move = Move()
+        # The merged community is an internal sibling, the largest one, which stays attached; the elements of the other sibling are added to its set in place.
+        if nsp1.is_leaf() or ( not nsp2.is_leaf() and nsp2.size() > nsp1.size() ):
+            nsp1 , nsp2 = nsp2 , nsp1
+        move._release_child( self , nsp2 )
+        if nsp1.is_leaf():
+            move._release_child( self , nsp1 )
+            mnsp = nsp1._new_node( None if nsp1._lazy else nsp1._elements | nsp2._elements )
+            move._add_child( mnsp , nsp1 )
+            move._add_child( mnsp , nsp2 )
+            move._add_child( self , mnsp )
+            return move
+        if nsp1._elements is not None:
+            move._add_elements( nsp1 , nsp2.elements() )
+        if nsp2.is_leaf():
+            move._add_child( nsp1 , nsp2 )
+        else:
+            for c in list( nsp2._children ):
+                move._release_child( nsp2 , c )
+                move._add_child( nsp1 , c )
+        nsp1._shrink_inplace( move )
+        return move
+
+    def _shrink_inplace( self , move ):
+        """
+        Same as _shrink, through the steps of "move" (see Move): every node with one child of the branch spawned by self is replaced by its first descendant whose degree is not one. Only the branches that hold such nodes are visited (see _one_child_nodes). self must not be the top of the hierarchy.
+        """
+        stack = [ self ]
+        while stack:
+            n = stack.pop()
+            if n._one_child_nodes == 0:
+                continue
+            if n.degree() == 1:
+                d = n
+                while d.degree() == 1:
+                    d = next( iter( d._children ) )
+                a = n._ancestor
+                move._release_child( a , n )
+                move._release_child( d._ancestor , d )
+                move._add_child( a , d )
+                n = d
+            stack.extend( n._children )
       
     def replace( self , nsp ):
         """Replace self with nsp.
@@ -338,7 +864,23 @@ class NestedPartition:
         a._add_child( nsp )
      
     def size( self ):
-        return len( self._elements )
+        if self._elements is not None:
+            return len( self._elements )
+        # An internal node of a lazy hierarchy: the sizes of the nodes of its branch whose cache is not valid are summed bottom-up.
+        stack = [ ( self , False ) ]
+        while stack:
+            n , expanded = stack.pop()
+            if n._elements is not None:
+                continue
+            n._valid_cache()
+            if n._cached_size is not None:
+                continue
+            if expanded:
+                n._cached_size = sum( c.size() for c in n._children )
+            else:
+                stack.append( ( n , True ) )
+                stack.extend( ( c , False ) for c in n._children )
+        return self._cached_size
         
     def degree( self ):
         return len( self._children )
@@ -398,6 +940,8 @@ class NestedPartition:
         
     def equivalent( self , nsp ):
         """
+        Returns <bool> : True if the branches spawned by self and nsp, a NestedPartition or a CompactNestedPartition, are the same nested partition, up to the chains of nodes with one child that end in a leaf, i.e. if their NHMI is 1. It compares their canonical hashes (see canonical_hash), so it takes linear time, and no time at all if both hashes are already known.
+
         >>> k2n = toy()
         >>> nsp = k2n[ 'root' ]
         >>> cnsp = nsp.copy()
@@ -407,23 +951,39 @@ class NestedPartition:
         False
         >>> nsp.equivalent( cnsp )
         True
+        >>> nsp.equivalent( cnsp.compact() )
+        True
+        >>> nsp.equivalent( toy2()[ 'root' ] )
+        False
+        >>> b1 = k2n[ 'b1' ]
+        >>> b1._add_child( NestedPartition( b1.elements() ) )
+        >>> nsp
+        nsp[[3, 4, 5, 6], [[2], [[0, 1]]], [[7], [8, 9]]]
+        >>> nsp.equivalent( cnsp ) , nsp.compact().equivalent( cnsp ) , nsp.normalized_hierarchical_mutual_information( cnsp )
+        (True, True, 1.0)
         """
-        assert isinstance( nsp , NestedPartition )    
+        assert isinstance( nsp , ( NestedPartition , CompactNestedPartition ) )
         if self == nsp:
             return True
         if self.size() != nsp.size():
             return False
-        if self._elements != nsp._elements:
-            return False
-        if abs( self.normalized_hierarchical_mutual_information( nsp , calc_NMI = 'arithmetic' ) - 1. ) > 0.0000001:
-            return False
-        return True
+        return self.canonical_hash() == nsp.canonical_hash()
  
 #    def __ne__( self , nsp ):
 #        return not self.__eq__( nsp )
         
     def elements( self ):
-        return self._elements
+        """
+        Returns <set> : the elements of self (a bitsets.BitSet for the 'bitset' backend, see interned). For an internal node of a lazy hierarchy (see copy), they are the union of the elements of its leaves, which is built at every call unless the hierarchy is lazy 'cached'; do not modify it.
+        """
+        if self._elements is not None:
+            return self._elements
+        if self._lazy == 'cached':
+            self._valid_cache()
+            if self._cached_elements is None:
+                self._cached_elements = self._element_set().union( *[ n._elements for n in self._iter_owners() ] )
+            return self._cached_elements
+        return self._element_set().union( *[ n._elements for n in self._iter_owners() ] )
         
     def create_children( self , partition , allow_one_child = False ):
         """
@@ -433,28 +993,50 @@ class NestedPartition:
         if ( not allow_one_child ) and len( partition ) == 1:
             return self
         if isinstance( partition , dict ):
-            assert set([]).union( *partition.values() ) == self.elements()
+            assert self.elements() == set([]).union( *partition.values() )
             for key , part in partition.items():
-                nsp = NestedPartition( part )
+                nsp = self._new_node( part )
                 partition[ key ] = nsp                
                 self._add_child( nsp )
             return partition
         else:
             for part in partition:
-                self._add_child( NestedPartition( part ) )
+                self._add_child( self._new_node( part ) )
                 
     def _add_child( self , nsp ):
         """
         This is an internal function for the incorporation of child communities. It allows the incorporation of one child community at a time. The function "create_children" is the one that should be used by the end user, since it asserts the correct creation of the children communities of a community. Namely, "create_children" asserts that the union of elements of the newly created children equals the set of elements of the parent community "self".
 
-        >>>
+        The overlap with the children already incorporated is detected against the union of their elements, which self keeps up to date, so it costs O( nsp.size() ).
+
+        >>> nsp = NestedPartition( [ 0 , 1 , 2 , 3 ] )
+        >>> nsp._add_child( NestedPartition( [ 0 , 1 ] ) )
+        >>> try:
+        ...     nsp._add_child( NestedPartition( [ 1 , 2 ] ) )
+        ... except AssertionError:
+        ...     print 'overlap'
+        overlap
+        >>> nsp._add_child( NestedPartition( [ 2 ] ) )
+        >>> sorted( nsp.children_union() )
+        [0, 1, 2]
         """
         assert isinstance( nsp , NestedPartition )
-        assert nsp.elements() <= self._elements
-        for c in self:
-            assert len( c._elements & nsp.elements() ) == 0 , 'ERROR @ NestedPartition._add_child(...) : Attempting to incorporate a child which share elements with another already incorporated child.'
+        assert nsp._labels is self._labels , 'ERROR @ NestedPartition._add_child(...) : Attempting to incorporate a child whose elements are interned with other labels.'
+        assert nsp._element_set is self._element_set , 'ERROR @ NestedPartition._add_child(...) : Attempting to incorporate a child whose elements are stored with another backend.'
+        assert nsp._lazy == self._lazy , 'ERROR @ NestedPartition._add_child(...) : Attempting to incorporate a child with another storage mode.'
+        if self._lazy:
+            # The overlaps are only checked by check_consistency, since the union of the elements of the children is not kept. A leaf that gets its first child becomes internal, so it drops the set of its elements, which are derived from its leaves from then on.
+            assert self._elements is None or nsp.elements() <= self._elements
+            self._elements = None
+        else:
+            assert nsp.elements() <= self._elements
+            assert self._covered.isdisjoint( nsp.elements() ) , 'ERROR @ NestedPartition._add_child(...) : Attempting to incorporate a child which share elements with another already incorporated child.'
+            self._covered |= nsp.elements()
         nsp._ancestor = self
         self._children.add( nsp )
+        # self gets one child, or a second one.
+        degree = len( self._children )
+        self._touch( nsp._one_child_nodes + ( degree == 1 ) - ( degree == 2 ) )
         
     def _pop_child( self ):
         """
@@ -496,7 +1078,33 @@ class NestedPartition:
         assert isinstance( nsp , NestedPartition )
         assert self.is_child( nsp )
         self._children.remove( nsp )
+        if not self._lazy:
+            self._covered -= nsp.elements()
         nsp._ancestor = None
+        # self is left with one child, or none.
+        degree = len( self._children )
+        self._touch( ( degree == 1 ) - ( degree == 0 ) - nsp._one_child_nodes )
+
+    def _add_elements( self , elements ):
+        """
+        Adds the elements "elements", which are not in the hierarchy yet, to the set of elements of self in place, and to the union of the elements of the children of its ancestor (see _add_child), so that self may stay attached. It is the inverse of _remove_elements.
+        """
+        self._elements |= elements
+        if self._ancestor is not None and not self._lazy:
+            assert self._ancestor._covered.isdisjoint( elements )
+            self._ancestor._covered |= elements
+        self._touch()
+        self._elements_version = self._version
+
+    def _remove_elements( self , elements ):
+        """
+        Removes the elements "elements", all of which are in self, from the set of elements of self in place, and from the union of the elements of the children of its ancestor.
+        """
+        self._elements -= elements
+        if self._ancestor is not None and not self._lazy:
+            self._ancestor._covered -= elements
+        self._touch()
+        self._elements_version = self._version
         
     def random_child( self ):
         """
@@ -527,7 +1135,7 @@ class NestedPartition:
         >>>
         """
         if sort:
-            for c in sorted( self._children ):
+            for c in sorted( self._children , key = _nsp_key ):
                 yield c
         else:
             for c in self._children:
@@ -541,15 +1149,15 @@ class NestedPartition:
 
         >>>
         """
-        union_u = []
-        for u in self:
-            union_u += u.elements()
-        union_u = set( union_u )
+        if self._lazy:
+            union_u = self._element_set().union( *[ c.elements() for c in self ] )
+        else:
+            union_u = set( self._covered )
 
         # CHECK
         if run_checks and self.degree() > 0:
             try:
-                assert union_u == self.elements()
+                assert self.elements() == union_u
             except AssertionError as error:
                 err_message  = "ERROR @ children_union( self )."
                 err_message += "\n v.degree = " + str( self.degree() )
@@ -598,15 +1206,13 @@ class NestedPartition:
         cH = 0.
         v1 = self.elements()
         v2 = nsp.elements()
-        v1Nv2 = v1 & v2
-        deno = float( len( v1Nv2 ) )
+        deno = float( _intersection_size( v1 , v2 ) )
         if deno == 0.:
             return 0.
         sum_nume = 0.
         for c in self:
             u1 = c.elements()
-            u1Nv2 = u1 & v2
-            nume = float( len( u1Nv2 ) )
+            nume = float( _intersection_size( u1 , v2 ) )
             frac = nume / deno
             cH -= _xlnx( frac )
             sum_nume += nume                        
@@ -627,8 +1233,7 @@ class NestedPartition:
             return 0.
         v1 = self.elements()
         v2 = nsp.elements()
-        v1Nv2 = v1 & v2
-        deno = float( len( v1Nv2 ) )
+        deno = float( _intersection_size( v1 , v2 ) )
         if deno == 0.:
             return 0.
         sum_nume = 0.
@@ -636,8 +1241,7 @@ class NestedPartition:
             u1 = c1.elements()
             for c2 in nsp:
                 u2 = c2.elements()
-                u1Nu2 = u1 & u2
-                nume = float( len( u1Nu2 ) )
+                nume = float( _intersection_size( u1 , u2 ) )
                 frac = nume / deno
                 cjH -= _xlnx( frac )
                 sum_nume += nume
@@ -686,13 +1290,20 @@ class NestedPartition:
     #            SMI += c1.subtree_mutual_information( c2 )
     #    return SMI
         
-    def hierarchical_mutual_information( self , nsp , run_checks = True ):
+    @_cached_measure( 'HMI' )
+    def hierarchical_mutual_information( self , nsp , run_checks = True , engine = 'contingency' , processes = 1 , parallel_depth = 1 ):
         """
         HMI( T1 ; T2 ) = ...
         
         CHECKS
         ------
          - Compared with the OLD_hierpart.py --- YES       
+
+        engine <str='contingency'> : one of 'contingency' or 'recursive'. The 'contingency' engine counts the intersections between the nodes of both hierarchies in a single pass over the elements and skips every pair of nodes with an empty intersection (see _contingency_hierarchical_mutual_information). The 'recursive' engine is the original implementation, which intersects the sets of elements of every pair of children at every level.
+
+        processes <int=1> : if not 1, the 'contingency' engine evaluates the pairs of nodes with a non-empty intersection at depth "parallel_depth" of both hierarchies in a pool of that many processes (None for one per cpu), and combines them here (see _parallel_hierarchical_mutual_information). The result is exactly the one of the sequential evaluation.
+
+        parallel_depth <int=1> : the depth of the pairs of nodes spread across the pool; 1 means the pairs of top-level communities.
         
         >>> k2n_toy1 = old_toy_1()
         >>> k2n_toy2 = old_toy_2()
@@ -712,59 +1323,94 @@ class NestedPartition:
         '0.6931472'
         >>> "%.7f" % root2.hierarchical_mutual_information( root1 )
         '0.6931472'
+        >>> "%.7f" % root1.hierarchical_mutual_information( root2 , engine = 'recursive' )
+        '0.6931472'
+        >>> root1.hierarchical_mutual_information( root2 , processes = 2 ) == root1.hierarchical_mutual_information( root2 )
+        True
         """
         assert isinstance( nsp , NestedPartition )
+        assert self._labels is nsp._labels , 'ERROR @ NestedPartition.hierarchical_mutual_information(...) : the elements of both hierarchies must be interned with the same labels (see interned).'
 
         if run_checks:
             self.check_consistency()
             nsp.check_consistency()
 
-        if self.is_leaf( ) or nsp.is_leaf():
-            return 0.
-        v1 = self.elements()
-        v2 = nsp.elements()
-        v1Nv2 = v1 & v2
-        deno = float( len( v1Nv2 ) )
-        if deno == 0.:
+        if engine == 'contingency':
+            if processes != 1:
+                return _parallel_hierarchical_mutual_information( self , nsp , processes = processes , depth = parallel_depth )
+            return _contingency_hierarchical_mutual_information( self , nsp )
+        elif engine == 'recursive':
+            return self._recursive_hierarchical_mutual_information( nsp )
+        else:
+            assert False , 'ERROR @ NestPartitionm.hierarchical_mutual_information(...) : "engine" specifies unknown engine.'
+
+    def _recursive_hierarchical_mutual_information( self , nsp ):
+        """
+        The original implementation of the HMI recursion, evaluated on an explicit stack so that the depth of the hierarchies is not bounded by the recursion limit. The consistency of the hierarchies is not checked here; see hierarchical_mutual_information.
+
+        >>>
+        """
+        def enter( n1 , n2 , deno ):
+            # The frame of the pair ( n1 , n2 ) of intersection size "deno": [ n1 , n2 , deno , pairs of children left , cjH , crH , sum_nume , ( frac , nume ) of the pair of children being evaluated ], or None if the term is 0.
+            if n1.is_leaf() or n2.is_leaf() or deno == 0.:
+                return None
+            return [ n1 , n2 , deno , itertools.product( list( n1 ) , list( n2 ) ) , 0. , 0. , 0. , None ]
+        def leave( frame ):
+            n1 , n2 , deno , _ , cjH , crH , sum_nume , _ = frame
+            try:
+                assert _feq( sum_nume , deno )
+            except AssertionError as error:
+                v1 = n1.elements()
+                v2 = n2.elements()
+                err_message  = "ERROR @ hierarchical_mutual_information( self , nsp ): assert _feq( sum_nume , deno ) fails for sum_nume = " + str( sum_nume ) + " and deno = " + str( deno ) + "."
+                err_message += "\n v1 = " + str( sorted( v1 ) )
+                err_message += "\n v2 = " + str( sorted( v2 ) )
+                list_u1 = sorted( [ c1.elements() for c1 in n1 ] )
+                list_u2 = sorted( [ c2.elements() for c2 in n2 ] )
+                err_message += "\n [ u1 ] = " + str( list_u1 )
+                err_message += "\n [ u2 ] = " + str( list_u2 )
+                union_u1 = set( [] )
+                union_u2 = set( [] )
+                for u1 in list_u1:
+                    for e1 in u1:
+                        union_u1.add( e1 )
+                for u2 in list_u2:
+                    for e2 in u2:
+                        union_u2.add( e2 )
+                err_message += "\n U u1 = " + str( union_u1 )
+                err_message += "\n U u2 = " + str( union_u2 )
+                error.args += ( err_message , ) # wrap it up in new tuple
+                raise
+            cH1 = n1.node_conditional_entropy( n2 )
+            cH2 = n2.node_conditional_entropy( n1 )
+            return cH1 + cH2 - cjH + crH
+        # The recursion over the pairs of children runs on an explicit stack of frames, with the sums accumulated in the same order as the recursive version, hence with the same result.
+        top = enter( self , nsp , float( _intersection_size( self.elements() , nsp.elements() ) ) )
+        if top is None:
             return 0.
-        cjH = 0.
-        crH = 0.
-        sum_nume = 0.
-        for c1 in self:
-            for c2 in nsp:
-                u1 = c1.elements()
-                u2 = c2.elements()
-                u1Nu2 = u1 & u2
-                nume = float( len( u1Nu2 ) )
-                frac = nume / deno
-                cjH -= _xlnx( frac )
-                crH += frac * c1.hierarchical_mutual_information( c2 )
-                sum_nume += nume
-        try:
-            assert _feq( sum_nume , deno )
-        except AssertionError as error:
-            err_message  = "ERROR @ hierarchical_mutual_information( self , nsp ): assert _feq( sum_nume , deno ) fails for sum_nume = " + str( sum_nume ) + " and deno = " + str( deno ) + "."
-            err_message += "\n v1 = " + str( sorted( v1 ) )
-            err_message += "\n v2 = " + str( sorted( v2 ) )
-            list_u1 = sorted( [ c1.elements() for c1 in self ] )
-            list_u2 = sorted( [ c2.elements() for c2 in nsp ] )
-            err_message += "\n [ u1 ] = " + str( list_u1 )
-            err_message += "\n [ u2 ] = " + str( list_u2 )
-            union_u1 = set( [] )
-            union_u2 = set( [] )
-            for u1 in list_u1:
-                for e1 in u1:
-                    union_u1.add( e1 )
-            for u2 in list_u2:
-                for e2 in u2:
-                    union_u2.add( e2 )
-            err_message += "\n U u1 = " + str( union_u1 )
-            err_message += "\n U u2 = " + str( union_u2 )
-            error.args += ( err_message , ) # wrap it up in new tuple
-            raise                        
-        cH1 = self.node_conditional_entropy( nsp )
-        cH2 = nsp.node_conditional_entropy( self )
-        return cH1 + cH2 - cjH + crH
+        stack = [ top ]
+        while True:
+            frame = stack[ -1 ]
+            for c1 , c2 in frame[ 3 ]:
+                nume = float( _intersection_size( c1.elements() , c2.elements() ) )
+                frac = nume / frame[ 2 ]
+                frame[ 4 ] -= _xlnx( frac )
+                child = enter( c1 , c2 , nume )
+                if child is not None:
+                    frame[ 7 ] = ( frac , nume )
+                    stack.append( child )
+                    break
+                frame[ 5 ] += frac * 0.
+                frame[ 6 ] += nume
+            else:
+                stack.pop()
+                HMI = leave( frame )
+                if not stack:
+                    return HMI
+                frame = stack[ -1 ]
+                frac , nume = frame[ 7 ]
+                frame[ 5 ] += frac * HMI
+                frame[ 6 ] += nume
         
     #def subtree_entropy( self ):
     #    """
@@ -775,14 +1421,14 @@ class NestedPartition:
     #    """
     #    return self.subtree_mutual_information( self )
         
-    def hierarchical_entropy( self , run_checks = True ):
+    def hierarchical_entropy( self , run_checks = True , engine = 'contingency' , processes = 1 ):
         """
         TODO...
         
         >>> k2n_toy1 = old_toy_1()
         >>> k2n_toy2 = old_toy_2()        
         """
-        return self.hierarchical_mutual_information( self , run_checks = run_checks )
+        return self.hierarchical_mutual_information( self , run_checks = run_checks , engine = engine , processes = processes )
         
     #def normalized_subtree_mutual_information( self , nsp , calc_NMI = 'arithmetic' ):
     #    """
@@ -803,7 +1449,8 @@ class NestedPartition:
     #    SMI12 = self.subtree_mutual_information( nsp )
     #    return calc_NMI( SMI1 , SMI2 , SMI12 )
 
-    def normalized_hierarchical_mutual_information( self , nsp , calc_NMI = 'arithmetic' , run_checks = True ):
+    @_cached_measure( 'NHMI' )
+    def normalized_hierarchical_mutual_information( self , nsp , calc_NMI = 'arithmetic' , run_checks = True , engine = 'contingency' , processes = 1 ):
         """
         NHMI( T1 ; T2 ) = ...
         
@@ -823,9 +1470,9 @@ class NestedPartition:
         else:
             assert False , 'ERROR @ NestPartitionm.normalized_hierarchical_mutual_information(...) : "calc_NMI" specifies unknown normalization method.'
         assert isinstance( nsp , NestedPartition )
-        HMI1  = self.hierarchical_entropy( run_checks = run_checks )
-        HMI2  = nsp.hierarchical_entropy( run_checks = run_checks )
-        HMI12 = self.hierarchical_mutual_information( nsp , run_checks = run_checks )
+        HMI1  = self.hierarchical_entropy( run_checks = run_checks , engine = engine , processes = processes )
+        HMI2  = nsp.hierarchical_entropy( run_checks = run_checks , engine = engine , processes = processes )
+        HMI12 = self.hierarchical_mutual_information( nsp , run_checks = run_checks , engine = engine , processes = processes )
         return calc_NMI( HMI1 , HMI2 , HMI12 )
 
     #def subtree_variation_information( self , nsp ):
@@ -880,6 +1527,7 @@ class NestedPartition:
         '0.6730117'
         """
         assert isinstance( nsp , NestedPartition )
+        assert self._labels is nsp._labels , 'ERROR @ root_mutual_information : the elements of both hierarchies must be interned with the same labels (see interned).'
         assert( self.is_root() ) , 'ERROR @ root_mutual_information : assert( self.is_root() )'
         assert( nsp.is_root() ) , 'ERROR @ root_mutual_information : assert( nsp.is_root() )'
         if run_checks:
@@ -918,6 +1566,7 @@ class NestedPartition:
         '0.6180656'
         """
         assert isinstance( nsp , NestedPartition )
+        assert self._labels is nsp._labels , 'ERROR @ root_normalized_mutual_information : the elements of both hierarchies must be interned with the same labels (see interned).'
         assert( self.is_root() ) , 'ERROR @ root_normalized_mutual_information : assert( self.is_root() )'
         assert( nsp.is_root() ) , 'ERROR @ root_normalized_mutual_information : assert( nsp.is_root() )'
         if run_checks:
@@ -937,7 +1586,8 @@ class NestedPartition:
         MI = S1 + S2 - S12 
         return calc_NMI( S1 , S2 , MI )
 
-    def iter_layer_mutual_information( self , nsp , calc_NMI = 'arithmetic' , run_checks = True , verbose = False ):
+    @_cached_measure( 'layer_MI' )
+    def iter_layer_mutual_information( self , nsp , calc_NMI = 'arithmetic' , run_checks = True , verbose = False , engine = 'vectorized' ):
         """
         This function iterates over the layers of the "self" hierarchy and the "nsp" hierarchy and returns the corresponding layer_mutual_information.
  
@@ -949,6 +1599,8 @@ class NestedPartition:
 
         run_checks <bool=True> : if True checks are run. Otherwise, checks are avoided. This can be used to speed-up the computations.
 
+        engine <str='vectorized'> : one of 'vectorized' or 'pairwise'. The 'vectorized' engine turns each layer of both hierarchies into an array of integer labels over a common index of the elements, so the joint entropy of a layer is obtained with a single np.unique over the combined labels and the whole sweep costs O(N*L). The 'pairwise' engine is the original implementation, which intersects every pair of parts of the two layers. The 'pairwise' engine is the only one printing the layer partitions when verbose is True.
+
         Yields
         ------
         a tuple ( layer_number , MI , NMI ) where:
@@ -1008,8 +1660,16 @@ class NestedPartition:
         0 0.0 0.0
         1 0.673011667009 0.618065646292
         2 1.24587441847 0.847067744395
+        >>>
+        >>> for _nsp1 , _nsp2 in [ ( root4 , root5 ) , ( root5 , root6 ) , ( root1 , root3 ) , ( root3 , root3 ) ]:
+        ...     layers_v = list( _nsp1.iter_layer_mutual_information( _nsp2 , engine = 'vectorized' ) )
+        ...     layers_p = list( _nsp1.iter_layer_mutual_information( _nsp2 , engine = 'pairwise' ) )
+        ...     assert len( layers_v ) == len( layers_p )
+        ...     for ( l_v , mi_v , nmi_v ) , ( l_p , mi_p , nmi_p ) in zip( layers_v , layers_p ):
+        ...         assert l_v == l_p and _feq( mi_v , mi_p ) and _feq( nmi_v , nmi_p )
         """
         assert isinstance( nsp , NestedPartition )
+        assert self._labels is nsp._labels , 'ERROR @ root_normalized_mutual_information : the elements of both hierarchies must be interned with the same labels (see interned).'
         assert( self.is_root() ) , 'ERROR @ root_normalized_mutual_information : assert( self.is_root() )'
         assert( nsp.is_root() ) , 'ERROR @ root_normalized_mutual_information : assert( nsp.is_root() )'
 
@@ -1064,6 +1724,14 @@ class NestedPartition:
             print '# self =' , self
             print '# nsp =' , nsp
 
+        if engine == 'vectorized':
+            A_self , A_nsp = self.compact()._shared_layers( nsp.compact() )
+            for layer , layer_MI , layer_NMI in _iter_filled_layers_mutual_information( _fill_layers( A_self ) , _fill_layers( A_nsp ) , calc_NMI ):
+                yield layer , layer_MI , layer_NMI
+            return
+        elif engine != 'pairwise':
+            assert False , 'ERROR @ NestPartitionm.iter_layer_mutual_information(...) : "engine" specifies unknown engine.'
+
         nsp_pool_self = [ self.root() ]
         nsp_pool_nsp  = [ nsp.root() ]
         continue_self = True
@@ -1117,16 +1785,31 @@ class NestedPartition:
         ..nsp[[0, 1], [2]]
         ..nsp[[7], [8, 9]]
         nsp[[3, 4, 5, 6], [[0, 1], [2]], [[7], [8, 9]]]
+
+        The traversals run on an explicit stack, so they are not bounded by the recursion limit:
+
+        >>> deep = NestedPartition( [ 0 ] )
+        >>> for i in xrange( 1 , 3000 ):
+        ...     nsp = NestedPartition( deep.elements() | set( [ i ] ) )
+        ...     nsp._add_child( deep )
+        ...     nsp._add_child( NestedPartition( [ i ] ) )
+        ...     deep = nsp
+        >>> len( list( deep.DFS() ) ) , len( list( deep.iter_leaves_path() ) ) , deep.copy().equivalent( deep )
+        (5999, 3000, True)
+        >>> half1 , half2 = deep.split_branch( set( xrange( 0 , 3000 , 2 ) ) )
+        >>> len( list( half1.DFS() ) ) , _feq( half1.hierarchical_mutual_information( half1 , engine = 'recursive' ) , half1.hierarchical_entropy() )
+        (2999, True)
         """
-        if sort:
-            for c in sorted( self , cmp = _nsp_cmp ):
-                for cc in c.DFS():
-                    yield cc
-        else:
-            for c in self:
-                for cc in c.DFS():
-                    yield cc
-        yield self
+        # Post-order traversal with an explicit stack, each frame holding the children left to visit, so that every node is yielded in O( 1 ) amortized time. As in the recursive version, only the children of self are sorted.
+        stack = [ ( self , iter( sorted( self._children , key = _nsp_key ) if sort else self._children ) ) ]
+        while stack:
+            n , children = stack[ -1 ]
+            for c in children:
+                stack.append( ( c , iter( c._children ) ) )
+                break
+            else:
+                stack.pop()
+                yield n
         
     def root( self ):
         """
@@ -1150,14 +1833,64 @@ class NestedPartition:
         """
         >>>
         """
-        if self.is_leaf():
-            if sort:
-                return sorted( self.elements() )
-            return list( self.elements() )
-        else:
-            if sort:
-                return sorted( [ c.newick() for c in self ] )
-            return list( [ c.newick() for c in self ] )            
+        return _newick( self , NestedPartition.element_labels , sort )
+
+    def canonical_hash( self , strict = False ):
+        """
+        Returns <str> : a Merkle-style hash of the branch spawned by self, namely the SHA-1 hex digest of the sorted elements of a leaf, or of the sorted hashes of the children of an internal node. A chain of nodes with one child that ends in a leaf has the hash of that leaf, since the HMI does not tell them apart (contrary to a node with one child that is not a leaf, which shifts the depths of the branch below it). Hence two branches have the same hash if and only if they are the same nested partition up to those chains (barring SHA-1 collisions), i.e. if their NHMI is 1, whatever the order in which their communities were created. If "strict" is True, no chain is collapsed, so two branches have the same strict hash if and only if they are the same tree of communities, which the measures that depend on the depths, e.g. iter_layer_mutual_information, require (see nsp_digest); it equals the default hash of the branches without nodes with one child (see _one_child_nodes). The hashes are computed bottom-up in one traversal and kept in each node until its branch is modified (see _touch), so that later calls only visit the modified branches.
+
+        >>> k2n = toy()
+        >>> nsp = k2n[ 'root' ]
+        >>> h = nsp.canonical_hash()
+        >>> h == nsp.copy().canonical_hash() == nsp.compact().canonical_hash()
+        True
+        >>> a3 = k2n[ 'a3' ]
+        >>> nsp._release_child( a3 )
+        >>> nsp.canonical_hash() == h
+        False
+        >>> nsp._add_child( a3 )
+        >>> nsp.canonical_hash() == h
+        True
+        >>> a2 = k2n[ 'a2' ]
+        >>> nsp._release_child( a2 )
+        >>> chain = NestedPartition( a2.elements() )
+        >>> chain._add_child( a2 )
+        >>> nsp._add_child( chain )
+        >>> nsp.canonical_hash() == h , nsp.canonical_hash( strict = True ) == h , nsp.normalized_hierarchical_mutual_information( toy()[ 'root' ] )
+        (True, False, 1.0)
+        >>> a1 = k2n[ 'a1' ]
+        >>> nsp._release_child( a1 )
+        >>> chain = NestedPartition( a1.elements() )
+        >>> chain._add_child( a1 )
+        >>> nsp._add_child( chain )
+        >>> nsp.canonical_hash() == h , nsp.normalized_hierarchical_mutual_information( toy()[ 'root' ] ) < 1.
+        (False, True)
+        """
+        stack = [ ( self , False ) ]
+        while stack:
+            n , expanded = stack.pop()
+            if n._hash_version == n._version:
+                continue
+            if n.is_leaf():
+                n._hash = n._strict_hash = _leaf_hash( n.element_labels() )
+            elif expanded:
+                if len( n._children ) == 1:
+                    c = next( iter( n._children ) )
+                    n._hash = _one_child_hash( c._hash , c.is_leaf() or ( len( c._children ) == 1 and c._hash == next( iter( c._children ) )._hash ) )
+                else:
+                    n._hash = _internal_hash( [ c._hash for c in n._children ] )
+                if n._one_child_nodes == 0:
+                    n._strict_hash = n._hash
+                else:
+                    n._strict_hash = _internal_hash( [ c._strict_hash for c in n._children ] )
+            else:
+                stack.append( ( n , True ) )
+                stack.extend( ( c , False ) for c in n._children )
+                continue
+            n._hash_version = n._version
+        if strict:
+            return self._strict_hash
+        return self._hash
             
     def __repr__( self ):
         """
@@ -1180,7 +1913,7 @@ class NestedPartition:
         1 ..nsp[3, 4, 5, 6]
         2 ..nsp[[7], [8, 9]]
         """
-        for i , c in enumerate( sorted( self._children , cmp = _nsp_cmp ) ):
+        for i , c in enumerate( sorted( self._children , key = _nsp_key ) ):
             yield i , c
         
     def iter_leaves_path( self ):
@@ -1197,10 +1930,22 @@ class NestedPartition:
         """
         if self.is_leaf():
             yield [ self.elements() ]
-        else:       
-            for i , c in self.enumerate_children():
-                for path_elem in c.iter_leaves_path():
-                    yield [ i ] + path_elem
+            return
+        # Explicit stack of the children left to visit at each level of "path", the indexes of the children leading to the current node.
+        path = []
+        stack = [ self.enumerate_children() ]
+        while stack:
+            for i , c in stack[ -1 ]:
+                if c.is_leaf():
+                    yield path + [ i , c.elements() ]
+                else:
+                    path.append( i )
+                    stack.append( c.enumerate_children() )
+                break
+            else:
+                stack.pop()
+                if stack:
+                    path.pop()
         
     def save( self , filename = None ):
         """
@@ -1214,8 +1959,19 @@ class NestedPartition:
             #with open( filename , 'w' ) as fhw:
             with smart_streamout( filename ) as fhw:
                 for path_elem in self.iter_leaves_path():
-                    print >>fhw , ':'.join( [ str( p ) for p in path_elem[:-1] ] ) + ' #%$ ' + ','.join( [ '"' + str(e) + '"' for e in path_elem[-1] ] )
+                    elements = path_elem[-1] if self._labels is None else [ self._labels.i2l( e ) for e in path_elem[-1] ]
+                    print >>fhw , ':'.join( [ str( p ) for p in path_elem[:-1] ] ) + ' #%$ ' + ','.join( [ '"' + str(e) + '"' for e in elements ] )
        
+    def save_binary( self , filename ):
+        """
+        Saves the hierarchy in the binary .nspb file-format (see load_binary_NestedPartition).
+
+        >>> old_toy_1()[ 'root' ].save_binary( 'old_toy_1.nspb' )
+        >>> load_NestedPartition( 'old_toy_1.nspb' )
+        nsp[[['a'], ['b', 'c']], ['d', 'e', 'f']]
+        """
+        self.root().compact().save_binary( filename )
+
     def iter_dendrogram_layout( self , sort = True , _leaves_xpos = None , run_checks = True ):
         """
         >>> k2n = toy()
@@ -1225,14 +1981,15 @@ class NestedPartition:
         0.0 0.0 ..nsp[0, 1] (..nsp[[0, 1], [2]], ..nsp[0, 1])
         1.0 0.0 ..nsp[2] (..nsp[[0, 1], [2]], ..nsp[2])
         0.5 1.0 ..nsp[[0, 1], [2]] (nsp[[3, 4, 5, 6], [[0, 1], [2]], [[7], [8, 9]]], ..nsp[[0, 1], [2]])
-        2.0 0.0 ..nsp[8, 9] (..nsp[[7], [8, 9]], ..nsp[8, 9])
+        2.0 0.0 ..nsp[3, 4, 5, 6] (nsp[[3, 4, 5, 6], [[0, 1], [2]], [[7], [8, 9]]], ..nsp[3, 4, 5, 6])
         3.0 0.0 ..nsp[7] (..nsp[[7], [8, 9]], ..nsp[7])
-        2.5 1.0 ..nsp[[7], [8, 9]] (nsp[[3, 4, 5, 6], [[0, 1], [2]], [[7], [8, 9]]], ..nsp[[7], [8, 9]])
-        4.0 0.0 ..nsp[3, 4, 5, 6] (nsp[[3, 4, 5, 6], [[0, 1], [2]], [[7], [8, 9]]], ..nsp[3, 4, 5, 6])
-        1.85714285714 2.0 nsp[[3, 4, 5, 6], [[0, 1], [2]], [[7], [8, 9]]] None
+        4.0 0.0 ..nsp[8, 9] (..nsp[[7], [8, 9]], ..nsp[8, 9])
+        3.5 1.0 ..nsp[[7], [8, 9]] (nsp[[3, 4, 5, 6], [[0, 1], [2]], [[7], [8, 9]]], ..nsp[[7], [8, 9]])
+        2.0 2.0 nsp[[3, 4, 5, 6], [[0, 1], [2]], [[7], [8, 9]]] None
         """
-        if _leaves_xpos is None and run_checks:
-            self.check_consistency()
+        if _leaves_xpos is None:
+            if run_checks:
+                self.check_consistency()
             _leaves_xpos = lbls.Enumerate()
         if self.is_root():
             edge = None
@@ -1241,15 +1998,31 @@ class NestedPartition:
         if self.is_leaf():
             x = float( _leaves_xpos[ self ] )            
             yield x , 0. , self , edge
-        else:
-            list_x = []
-            list_y = []
-            for c in self.iter_children( sort = True ):
-                for _x , _y , _nsp , _edge in c.iter_dendrogram_layout( sort = sort , _leaves_xpos = _leaves_xpos ):
-                    yield _x , _y , _nsp , _edge
-                    list_x.append( _x )    
-                    list_y.append( _y )
-            yield avrg( list_x ) , max( list_y ) + 1. , self , edge
+            return
+        # Post-order traversal with an explicit stack. "list_x" holds the x of every node yielded so far, so the x of a node is the average of the slice of its descendants, summed in the same order as the recursive version. Each frame is [ node , children left , start of its slice , max y of its children ].
+        list_x = []
+        stack = [ [ self , self.iter_children( sort = True ) , 0 , 0. ] ]
+        while stack:
+            frame = stack[ -1 ]
+            for c in frame[ 1 ]:
+                if c.is_leaf():
+                    x = float( _leaves_xpos[ c ] )
+                    list_x.append( x )
+                    yield x , 0. , c , ( frame[ 0 ] , c )
+                else:
+                    stack.append( [ c , c.iter_children( sort = True ) , len( list_x ) , 0. ] )
+                break
+            else:
+                stack.pop()
+                n , _ , start , max_y = frame
+                x = avrg( list_x[ start: ] )
+                y = max_y + 1.
+                list_x.append( x )
+                if stack:
+                    stack[ -1 ][ 3 ] = max( stack[ -1 ][ 3 ] , y )
+                    yield x , y , n , ( stack[ -1 ][ 0 ] , n )
+                else:
+                    yield x , y , n , edge
         
     def to_tikz( self             ,
                  filename       = None , 
@@ -1311,7 +2084,7 @@ class NestedPartition:
             node_labels = {}
             for nsp in node_positions.keys():
                 if nsp.is_leaf():
-                    node_labels[ nsp ] = '{' + ','.join( str( e ) for e in sorted( nsp.elements() ) ) + '}'
+                    node_labels[ nsp ] = '{' + ','.join( str( e ) for e in sorted( nsp.element_labels() ) ) + '}'
                 else:
                     node_labels[ nsp ] = ''
         else:
@@ -1439,47 +2212,1331 @@ _tikz_dendrogram_doc = """%#####################################################
 \end{document}
 """        
         
-def _nsp_cmp( nsp1 , nsp2 ):
-    for e1 , e2 in zip( sorted( nsp1._elements ) , sorted( nsp2._elements ) ):
-        if e1 < e2:
-            return -1
-        elif e1 > e2:
-            return 1
-    return 0
-        
-def load_NestedPartition( filename , nodes_as_int = False , run_checks = True ):
-    """
-    The .nsp file-format is how a Hierarchical Partition is saved into a file. An example of how a .nsp file looks like is:
-
-    0:0 #%$ "0"
-    0:1 #%$ "1","2","3"
-    1:0 #%$ "4","5"
-    1:1:0 #%$ "6"
-    1:1:1 #%$ "7","8","9"
-
-    which corresponds to the tree whose root contains the elemtns "0","1",...,"9" and whose hierarchy is formed by the tree:
+# In-place moves
+#---------------
 
-    root ---> 0 ---> 0 : "0"
-        |      \---> 1 : "1","2","3"
-        |
-        \---> 1 ---> 0 : "4","5"
-               \---> 1 ---> 0 : "6"
-                      \---> 1 : "7","8","9"
-
-    filename <str> : the path and filename of the .nsp file that should be loaded.
-
-    node_as_int <bool=False> : If true, all nodes names (i.e. the names of the elements inside the communities of the hierarchical partition) are considered to be integers instead of strings. This option is provided because, for some network packages, nodes are not represented as integers---which is usually computationally faster---but as strings. For safety reasons, the default is set to False.
-
-    check <bool=False> : If True, it checks for consistency.
+class Move:
+    """
+    The record of an in-place modification of a hierarchy (see NestedPartition.split_here_inplace and NestedPartition.merge_siblings_here_inplace): the sequence of the elementary steps it made, namely attaching or detaching a child, and adding elements to or removing elements from a node. Hence, undo restores the hierarchy as it was, with the same node objects, in time proportional to the modification. Moves must be undone in the reverse order of their application.
 
-    >>> nsp = load_NestedPartition( 'toy.nsp' , nodes_as_int = True )
-    >>> nsp
-    nsp[[3, 4, 5, 6], [[0, 1], [2]], [[7], [8, 9]]]
     >>> k2n = toy()
     >>> nsp = k2n[ 'root' ]
+    >>> moves = [ k2n[ 'a1' ].split_here_inplace( set( [ 0 , 2 ] ) ) , nsp.merge_siblings_here_inplace( k2n[ 'a2' ] , k2n[ 'a3' ] ) ]
+    >>> nsp , len( moves[ 0 ] ) , len( moves[ 1 ] )
+    (nsp[[1], [[0], [2]], [[3, 4, 5, 6], [7], [8, 9]]], 9, 3)
+    >>> while moves:
+    ...     moves.pop().undo()
     >>> nsp
     nsp[[3, 4, 5, 6], [[0, 1], [2]], [[7], [8, 9]]]
     """
+    def __init__( self ):
+        self._steps = []
+
+    def __len__( self ):
+        return len( self._steps )
+
+    def _add_child( self , nsp , child ):
+        nsp._add_child( child )
+        self._steps.append( ( 'add' , nsp , child ) )
+
+    def _release_child( self , nsp , child ):
+        nsp._release_child( child )
+        self._steps.append( ( 'release' , nsp , child ) )
+
+    def _add_elements( self , nsp , elements ):
+        nsp._add_elements( elements )
+        self._steps.append( ( 'add_elements' , nsp , elements ) )
+
+    def _remove_elements( self , nsp , elements ):
+        nsp._remove_elements( elements )
+        self._steps.append( ( 'remove_elements' , nsp , elements ) )
+
+    def undo( self ):
+        """
+        Reverts the modification. The hierarchy must not have been modified since, other than by moves undone already.
+        """
+        while self._steps:
+            step , nsp , x = self._steps.pop()
+            if step == 'add':
+                nsp._release_child( x )
+            elif step == 'release':
+                nsp._add_child( x )
+            elif step == 'add_elements':
+                nsp._remove_elements( x )
+            else:
+                nsp._add_elements( x )
+
+# Incremental HMI
+#----------------
+
+class _HMITerms:
+    """
+    The terms of the HMI recursion between an internal node n1 of the evaluated hierarchy, at depth "depth", and the nodes n2 of the reference at the same depth (see IncrementalHMI). With x the size of the intersection of a child c1 of n1 and a child c2 of n2, a = |c1 int. n2|, b = |n1 int. c2| and m = |n1 int. n2|, the HMI of the branches of n1 and n2 is
+
+        I( n1 , n2 ) = ln m + ( J - A - B + R ) / m , with J = sum x ln x , A = sum a ln a , B = sum b ln b and R = sum x I( c1 , c2 ) ,
+
+    which is the sum of the conditional entropies and of the weighted HMI of the pairs of children of the recursive engine. Every sum is kept by n2 and updated child by child. The nodes of the reference are given by their index (see IncrementalHMI), and a pair ( n2 , c2 ) by the index of c2.
+    """
+    def __init__( self , depth ):
+        self.depth    = depth
+        self.version  = None
+        self.children = {} # c1 -> ( version , elements version ) of c1 when its terms were added.
+        self.counts   = {} # c1 -> { c2 : x }
+        self.a        = {} # c1 -> { n2 : a }
+        self.used     = {} # c1 -> { c2 : the I( c1 , c2 ) added to R }
+        self.b        = defaultdict( int )
+        self.m        = defaultdict( int )
+        self.A        = defaultdict( float )
+        self.B        = defaultdict( float )
+        self.J        = defaultdict( float )
+        self.R        = defaultdict( float )
+        self.values   = {} # n2 -> I( n1 , n2 ), for the n2 such that m > 0.
+        # The version of n1 before the last update, and the nodes n2 whose value changed then, so that the ancestor of n1 only updates the pairs of those.
+        self.previous_version = None
+        self.changed  = set( [] )
+
+class IncrementalHMI:
+    """
+    Evaluates the HMI, and the NHMI, between a hierarchy and a fixed reference hierarchy, and keeps the terms of the HMI recursion of every internal node of the hierarchy (see _HMITerms) until its branch is modified (see NestedPartition._touch). Hence, after a modification of the hierarchy, only the terms of the new nodes and of the nodes on the paths from the modified nodes to the top are recomputed, and for the latter only the terms of their modified children. Namely, an evaluation costs O( n ) time for the n elements of the new nodes and of the nodes whose elements changed, plus the degrees of the nodes on those paths. With the in-place moves (see NestedPartition.split_here_inplace and NestedPartition.merge_siblings_here_inplace), those are the nodes of the move, so a local search can evaluate thousands of moves per second, undoing the rejected ones (see Move.undo), whatever the size of the hierarchy. The evaluated hierarchy cannot be lazy (see NestedPartition.copy), and the reference must not be modified. The values agree with those of NestedPartition.hierarchical_mutual_information up to rounding.
+
+    >>> k2n = toy()
+    >>> nsp , reference = k2n[ 'root' ] , toy3()[ 'root' ]
+    >>> evaluator = IncrementalHMI( nsp , reference )
+    >>> HMI = evaluator.hierarchical_mutual_information()
+    >>> _feq( HMI , nsp.hierarchical_mutual_information( reference ) )
+    True
+    >>> move = k2n[ 'a1' ].split_here_inplace( set( [ 0 , 1 ] ) )
+    >>> nsp
+    nsp[[0, 1], [2], [3, 4, 5, 6], [[7], [8, 9]]]
+    >>> _feq( evaluator.hierarchical_mutual_information() , nsp.hierarchical_mutual_information( reference ) )
+    True
+    >>> _feq( evaluator.normalized_hierarchical_mutual_information() , nsp.normalized_hierarchical_mutual_information( reference ) )
+    True
+    >>> move.undo()
+    >>> _feq( evaluator.hierarchical_mutual_information() , HMI ) , _feq( evaluator.hierarchical_entropy() , nsp.hierarchical_entropy() )
+    (True, True)
+    """
+    def __init__( self , nsp , reference , run_checks = True ):
+        assert isinstance( nsp , NestedPartition ) and isinstance( reference , NestedPartition )
+        assert nsp._labels is reference._labels , 'ERROR @ IncrementalHMI(...) : the elements of both hierarchies must be interned with the same labels (see interned).'
+        assert not nsp._lazy , 'ERROR @ IncrementalHMI(...) : the evaluated hierarchy cannot be lazy, since the modifications of the sets of elements of its internal nodes are not tracked.'
+        if run_checks:
+            nsp.check_consistency()
+            reference.check_consistency()
+        self._nsp = nsp
+        self._reference = reference
+        self._reference_version = reference._version
+        # The nodes of the reference are given by their index in pre-order, which is hashed much faster than the node, the top being 0. "_parents" holds the index of the ancestor of each node, and "_pairs" the indexes of the nodes of the reference that hold each element from depth 1 on, shared by the elements of a leaf. Hence, the pair ( n2 , c2 ) of nodes at depths d and d + 1 that hold element e is given by c2 = _pairs[ e ][ d ], with n2 = _parents[ c2 ].
+        self._parents = []
+        self._pairs = {}
+        stack = [ ( reference , -1 , () ) ]
+        while stack:
+            n , parent , pairs = stack.pop()
+            index = len( self._parents )
+            self._parents.append( parent )
+            if parent >= 0:
+                pairs += ( index , )
+            if n.is_leaf():
+                for e in n.iter_elements():
+                    self._pairs[ e ] = pairs
+            else:
+                stack.extend( ( c , index , pairs ) for c in n._children )
+        self._terms = {}     # node of nsp -> _HMITerms
+        self._counts = {}    # node c1 of nsp -> ( elements version , depth , { c2 : x } , { n2 : a } ) of c1 as a child at depth "depth" (see _HMITerms), which does not depend on its parent.
+        self._entropies = {} # node -> ( version , hierarchical entropy of its branch )
+        # The nodes that left the hierarchy during the last evaluation. Their terms are only dropped at the end of the next one if they did not come back, so that undoing a move (see Move.undo) does not evaluate them again.
+        self._detached = []
+        self._reference_entropy = self._entropy( reference )
+
+    def hierarchical_mutual_information( self ):
+        """
+        Returns <float> : the HMI between the hierarchy and the reference, in their current state.
+        """
+        assert self._reference._version == self._reference_version , 'ERROR @ IncrementalHMI.hierarchical_mutual_information() : the reference hierarchy was modified.'
+        if self._nsp.is_leaf():
+            return 0.
+        # Post-order traversal of the nodes whose terms are not valid: the children of a node are updated before the node itself.
+        stale = []
+        stack = [ ( self._nsp , 0 ) ]
+        while stack:
+            n , depth = stack.pop()
+            if n.is_leaf():
+                continue
+            terms = self._terms.get( n )
+            if terms is not None and terms.version == n._version and terms.depth == depth:
+                continue
+            stale.append( ( n , depth ) )
+            stack.extend( ( c , depth + 1 ) for c in n._children )
+        detached , self._detached = self._detached , []
+        for n , depth in reversed( stale ):
+            self._update( n , depth )
+        for n in detached:
+            if n._ancestor is None and n is not self._nsp:
+                self._forget( n )
+        return self._terms[ self._nsp ].values.get( 0 , 0. )
+
+    def hierarchical_entropy( self ):
+        """
+        Returns <float> : the hierarchical entropy of the hierarchy, in its current state (see NestedPartition.hierarchical_entropy).
+        """
+        return self._entropy( self._nsp )
+
+    def normalized_hierarchical_mutual_information( self , calc_NMI = 'arithmetic' ):
+        """
+        Returns <float> : the NHMI between the hierarchy and the reference, in their current state (see NestedPartition.normalized_hierarchical_mutual_information).
+        """
+        if calc_NMI == 'arithmetic':
+            calc_NMI = _arithmetic_NMI
+        elif calc_NMI == 'geometric':
+            calc_NMI = _geometric_NMI
+        elif calc_NMI == 'max':
+            calc_NMI = _max_NMI
+        else:
+            assert False , 'ERROR @ IncrementalHMI.normalized_hierarchical_mutual_information(...) : "calc_NMI" specifies unknown normalization method.'
+        HMI12 = self.hierarchical_mutual_information()
+        return calc_NMI( self.hierarchical_entropy() , self._reference_entropy , HMI12 )
+
+    def _entropy( self , nsp ):
+        """
+        Returns <float> : the hierarchical entropy of the branch spawned by nsp, namely H( n ) = ln |n| - sum_c ( |c| ln |c| - |c| H( c ) ) / |n| over the children c of each node n, where only the nodes whose branch was modified since their last evaluation are evaluated again.
+        """
+        stale = []
+        stack = [ nsp ]
+        while stack:
+            n = stack.pop()
+            if n.is_leaf():
+                continue
+            entropy = self._entropies.get( n )
+            if entropy is not None and entropy[ 0 ] == n._version:
+                continue
+            stale.append( n )
+            stack.extend( n._children )
+        for n in reversed( stale ):
+            size = float( n.size() )
+            H = _nlnn( size )
+            for c in n:
+                H -= _nlnn( float( c.size() ) )
+                if not c.is_leaf():
+                    H += c.size() * self._entropies[ c ][ 1 ]
+            self._entropies[ n ] = ( n._version , H / size )
+        if nsp.is_leaf():
+            return 0.
+        return self._entropies[ nsp ][ 1 ]
+
+    def _update( self , n1 , depth ):
+        """
+        Brings the terms of n1, at depth "depth", up to date, given that those of its children are.
+        """
+        terms = self._terms.get( n1 )
+        if terms is None or terms.depth != depth:
+            terms = self._terms[ n1 ] = _HMITerms( depth )
+        touched = set( [] )
+        children = n1._children
+        parents = self._parents
+        for c1 , ( version , elements_version ) in terms.children.items():
+            if c1 not in children or c1._elements_version != elements_version:
+                self._remove_child_terms( terms , c1 , touched )
+                if c1._ancestor is None:
+                    self._detached.append( c1 )
+            elif c1._version != version:
+                # Only the branch of c1 changed, so the intersections are the same and only the HMI of its pairs is updated, or only of those that changed if they are known.
+                counts = terms.counts[ c1 ]
+                used = terms.used[ c1 ]
+                c1_terms = None if c1.is_leaf() else self._terms[ c1 ]
+                c1_values = {} if c1_terms is None else c1_terms.values
+                if c1_terms is not None and c1_terms.previous_version == version:
+                    pairs = [ c2 for c2 in c1_terms.changed if c2 in counts ]
+                else:
+                    pairs = counts
+                for c2 in pairs:
+                    I = c1_values.get( c2 , 0. )
+                    n2 = parents[ c2 ]
+                    terms.R[ n2 ] += counts[ c2 ] * ( I - used[ c2 ] )
+                    used[ c2 ] = I
+                    touched.add( n2 )
+                terms.children[ c1 ] = ( c1._version , elements_version )
+        for c1 in children:
+            if c1 not in terms.children:
+                self._add_child_terms( terms , c1 , touched )
+        for n2 in touched:
+            m = terms.m[ n2 ]
+            if m == 0:
+                for sums in ( terms.m , terms.A , terms.B , terms.J , terms.R ):
+                    del sums[ n2 ]
+                terms.values.pop( n2 , None )
+            else:
+                terms.values[ n2 ] = math.log( m ) + ( terms.J[ n2 ] - terms.A[ n2 ] - terms.B[ n2 ] + terms.R[ n2 ] ) / m
+        terms.previous_version = terms.version
+        terms.changed = touched
+        terms.version = n1._version
+
+    def _child_counts( self , c1 , depth ):
+        """
+        Returns the intersections of c1 with the pairs ( n2 , c2 ) of nodes of the reference at depths "depth" and depth + 1, and with the nodes n2, which are kept until the elements of c1 change.
+        """
+        cached = self._counts.get( c1 )
+        if cached is not None and cached[ 0 ] == c1._elements_version and cached[ 1 ] == depth:
+            return cached[ 2 ] , cached[ 3 ]
+        counts = defaultdict( int )
+        for e in c1.iter_elements():
+            pairs = self._pairs.get( e )
+            if pairs is not None and len( pairs ) > depth:
+                counts[ pairs[ depth ] ] += 1
+        a = defaultdict( int )
+        parents = self._parents
+        for c2 , x in counts.iteritems():
+            a[ parents[ c2 ] ] += x
+        counts , a = dict( counts ) , dict( a )
+        self._counts[ c1 ] = ( c1._elements_version , depth , counts , a )
+        return counts , a
+
+    def _add_child_terms( self , terms , c1 , touched ):
+        counts , a = self._child_counts( c1 , terms.depth )
+        c1_values = {} if c1.is_leaf() else self._terms[ c1 ].values
+        parents , b , B , J , R = self._parents , terms.b , terms.B , terms.J , terms.R
+        used = {}
+        for c2 , x in counts.iteritems():
+            n2 = parents[ c2 ]
+            y = b[ c2 ]
+            B[ n2 ] += _count_nlnn( y + x ) - _count_nlnn( y )
+            b[ c2 ] = y + x
+            J[ n2 ] += _count_nlnn( x )
+            I = c1_values.get( c2 , 0. )
+            used[ c2 ] = I
+            R[ n2 ] += x * I
+        for n2 , x in a.iteritems():
+            terms.A[ n2 ] += _count_nlnn( x )
+            terms.m[ n2 ] += x
+            touched.add( n2 )
+        terms.used[ c1 ] = used
+        terms.counts[ c1 ] = counts
+        terms.a[ c1 ] = a
+        terms.children[ c1 ] = ( c1._version , c1._elements_version )
+
+    def _remove_child_terms( self , terms , c1 , touched ):
+        parents , b , B , J , R = self._parents , terms.b , terms.B , terms.J , terms.R
+        used = terms.used.pop( c1 )
+        for c2 , x in terms.counts.pop( c1 ).iteritems():
+            n2 = parents[ c2 ]
+            y = b[ c2 ]
+            B[ n2 ] += _count_nlnn( y - x ) - _count_nlnn( y )
+            if y == x:
+                del b[ c2 ]
+            else:
+                b[ c2 ] = y - x
+            J[ n2 ] -= _count_nlnn( x )
+            R[ n2 ] -= x * used[ c2 ]
+        for n2 , x in terms.a.pop( c1 ).iteritems():
+            terms.A[ n2 ] -= _count_nlnn( x )
+            terms.m[ n2 ] -= x
+            touched.add( n2 )
+        del terms.children[ c1 ]
+
+    def _forget( self , nsp ):
+        """
+        Drops the terms of the nodes of the branch spawned by nsp, which left the hierarchy.
+        """
+        stack = [ nsp ]
+        while stack:
+            n = stack.pop()
+            self._counts.pop( n , None )
+            self._entropies.pop( n , None )
+            if self._terms.pop( n , None ) is not None:
+                stack.extend( n._children )
+
+def _nsp_key( nsp ):
+    """
+    The key by which siblings are sorted. Siblings are disjoint, so ordering them by their smallest element is ordering them by their sorted elements, without sorting the elements of each one at every comparison.
+    """
+    if nsp._elements is not None:
+        return min( nsp._elements )
+    return min( min( n._elements ) for n in nsp._iter_owners() )
+
+def _intersection_size( elements1 , elements2 ):
+    """
+    Returns <int> : the size of the intersection of two sets of elements, either of which may be a bitsets.BitSet (see NestedPartition.interned).
+    """
+    if isinstance( elements1 , bitsets.BitSet ):
+        return elements1.intersection_size( elements2 )
+    if isinstance( elements2 , bitsets.BitSet ):
+        return elements2.intersection_size( elements1 )
+    return len( elements1 & elements2 )
+
+def _element_set_backend( backend ):
+    """
+    Returns the constructor of the sets of elements of the backend "backend", 'set' or 'bitset' (see NestedPartition.interned).
+    """
+    if backend == 'set':
+        return set
+    elif backend == 'bitset':
+        return bitsets.BitSet
+    else:
+        assert False , 'ERROR @ _element_set_backend(...) : "backend" specifies unknown backend.'
+
+def _newick( nsp , leaf_elements , sort ):
+    """
+    The nested lists of NestedPartition.newick and CompactNestedPartition.newick, built bottom-up on an explicit stack; leaf_elements( n ) gives the elements of leaf n. As in the recursive version, "sort" only applies to the top-level list, the nested ones are always sorted.
+    """
+    if nsp.is_leaf():
+        if sort:
+            return sorted( leaf_elements( nsp ) )
+        return list( leaf_elements( nsp ) )
+    stack = [ ( iter( nsp ) , [] ) ]
+    while True:
+        children , newicks = stack[ -1 ]
+        for c in children:
+            if c.is_leaf():
+                newicks.append( sorted( leaf_elements( c ) ) )
+            else:
+                stack.append( ( iter( c ) , [] ) )
+            break
+        else:
+            stack.pop()
+            if not stack:
+                if sort:
+                    return sorted( newicks )
+                return newicks
+            stack[ -1 ][ 1 ].append( sorted( newicks ) )
+
+def _leaf_hash( elements ):
+    return hashlib.sha1( 'leaf' + repr( sorted( elements ) ) ).hexdigest()
+
+def _internal_hash( children_hashes ):
+    return hashlib.sha1( 'node' + ''.join( sorted( children_hashes ) ) ).hexdigest()
+
+def _one_child_hash( child_hash , leaf_like ):
+    # A node with one child that is a leaf, or a chain of such nodes ending in a leaf ("leaf_like"), has the hash of the leaf (see NestedPartition.canonical_hash).
+    if leaf_like:
+        return child_hash
+    return _internal_hash( [ child_hash ] )
+        
+def _branch_paths( nsp ):
+    """
+    Indexes the nodes of the branch spawned by "nsp" and collects the path, from "nsp" down to its leaf, of every element. The nodes are indexed in pre-order, hence the index of a node is always larger than the index of its parent, and "nsp" has index 0.
+
+    Returns
+    -------
+    a tuple ( e2path , parents , leaves ) where:
+    e2path <dict> : maps each element to the <tuple> of indexes of the nodes in its path,
+    parents <list> : parents[ i ] is the index of the parent of the node of index i, or None if i == 0,
+    leaves <list> : leaves[ i ] is True if the node of index i is a leaf.
+
+    >>> nsp = old_toy_1()[ 'root' ]
+    >>> e2path , parents , leaves = _branch_paths( nsp )
+    >>> len( parents ) , sum( leaves )
+    (5, 3)
+    >>> len( e2path[ 'a' ] ) , len( e2path[ 'd' ] )
+    (3, 2)
+    """
+    e2path  = {}
+    parents = []
+    leaves  = []
+    stack = [ ( nsp , None , () ) ]
+    while stack:
+        n , p , path = stack.pop()
+        i = len( parents )
+        parents.append( p )
+        path = path + ( i , )
+        if n.is_leaf():
+            leaves.append( True )
+            for e in n.iter_elements():
+                e2path[ e ] = path
+        else:
+            leaves.append( False )
+            for c in n:
+                stack.append( ( c , i , path ) )
+    return e2path , parents , leaves
+
+def _contingency_hierarchical_mutual_information( nsp1 , nsp2 ):
+    """
+    Computes the same quantity than NestedPartition._recursive_hierarchical_mutual_information but, instead of intersecting the sets of elements of every pair of children at every level, it runs once over the elements and, following their root-to-leaf paths in both hierarchies, it builds a sparse contingency table with the following counts:
+
+        joint[ ( v1 , v2 ) ]  = | v1 int. v2 |
+        cross1[ ( u1 , v2 ) ] = | u1 int. v2 | , with u1 a child of v1
+        cross2[ ( v1 , u2 ) ] = | v1 int. u2 | , with u2 a child of v2
+
+    where v1 and v2 are nodes at the same depth of nsp1 and nsp2, respectively. Only the pairs of nodes with a non-empty intersection appear in the table. Then, the terms of the recursion are evaluated bottom-up from these counts.
+
+    >>> root1 = old_toy_1()[ 'root' ]
+    >>> root2 = old_toy_2()[ 'root' ]
+    >>> "%.7f" % _contingency_hierarchical_mutual_information( root1 , root2 )
+    '0.6931472'
+    >>> for i in xrange( 10 ):
+    ...     nsp1 = generate_random_hierarchy( 50 , seed = i )
+    ...     nsp2 = generate_random_hierarchy( 50 , seed = 100 + i )
+    ...     for _nsp1 , _nsp2 in [ ( nsp1 , nsp1 ) , ( nsp1 , nsp2 ) , ( nsp2 , nsp1 ) ]:
+    ...         HMI_c = _contingency_hierarchical_mutual_information( _nsp1 , _nsp2 )
+    ...         HMI_r = _nsp1._recursive_hierarchical_mutual_information( _nsp2 )
+    ...         assert _feq( HMI_c , HMI_r ) , ( i , HMI_c , HMI_r )
+    """
+    e2path1 , parents1 , leaves1 = _branch_paths( nsp1 )
+    if nsp2 is nsp1:
+        e2path2 , parents2 , leaves2 = e2path1 , parents1 , leaves1
+    else:
+        e2path2 , parents2 , leaves2 = _branch_paths( nsp2 )
+    path_pairs = ( ( path1 , e2path2[ e ] ) for e , path1 in e2path1.iteritems() if e in e2path2 )
+    HMI = _contingency_table_hierarchical_mutual_information( path_pairs , 0 , parents1 , leaves1 , parents2 , leaves2 )
+    return HMI.get( ( 0 , 0 ) , 0. )
+
+def _contingency_table_hierarchical_mutual_information( path_pairs , top1 , parents1 , leaves1 , parents2 , leaves2 ):
+    """
+    The core of _contingency_hierarchical_mutual_information. It runs once over "path_pairs", the pairs ( path1 , path2 ) of paths followed by each element in both hierarchies, aligned by depth, which start at node "top1" of the first hierarchy and at any node of the second one. The nodes are indexed so that the index of a child is always larger than the index of its parent; parents1 , leaves1 , parents2 and leaves2 are as in _branch_paths.
+
+    Returns <dict> : HMI[ ( v1 , v2 ) ] for every pair of nodes ( v1 , v2 ) with a non-empty intersection, at the same depth of the paths.
+    """
+    # The single pass over the elements.
+    joint  = defaultdict( int )
+    cross1 = defaultdict( int )
+    cross2 = defaultdict( int )
+    for path1 , path2 in path_pairs:
+        depth = min( len( path1 ) , len( path2 ) ) - 1
+        for d in xrange( depth ):
+            v1 = path1[ d ]
+            v2 = path2[ d ]
+            joint[ ( v1 , v2 ) ] += 1
+            cross1[ ( path1[ d + 1 ] , v2 ) ] += 1
+            cross2[ ( v1 , path2[ d + 1 ] ) ] += 1
+        joint[ ( path1[ depth ] , path2[ depth ] ) ] += 1
+
+    # Group the counts by the pair ( v1 , v2 ) to which they contribute.
+    children_pairs = defaultdict( list )
+    for ( u1 , u2 ) , n in joint.iteritems():
+        if u1 != top1:
+            children_pairs[ ( parents1[ u1 ] , parents2[ u2 ] ) ].append( ( u1 , u2 , n ) )
+    cross1_by_pair = defaultdict( list )
+    for ( u1 , v2 ) , n in cross1.iteritems():
+        cross1_by_pair[ ( parents1[ u1 ] , v2 ) ].append( n )
+    cross2_by_pair = defaultdict( list )
+    for ( v1 , u2 ) , n in cross2.iteritems():
+        cross2_by_pair[ ( v1 , parents2[ u2 ] ) ].append( n )
+
+    # Bottom-up evaluation. Since the index of a child is larger than that of its parent, the pairs of children are evaluated before the pairs of their parents.
+    HMI = {}
+    for pair in sorted( joint , reverse = True ):
+        v1 , v2 = pair
+        if leaves1[ v1 ] or leaves2[ v2 ]:
+            HMI[ pair ] = 0.
+            continue
+        children = [ ( nume , HMI[ ( u1 , u2 ) ] ) for u1 , u2 , nume in children_pairs[ pair ] ]
+        HMI[ pair ] = _pair_hierarchical_mutual_information( joint[ pair ] , cross1_by_pair[ pair ] , cross2_by_pair[ pair ] , children )
+    return HMI
+
+def _pair_hierarchical_mutual_information( deno , cross1 , cross2 , children ):
+    """
+    The term of the HMI recursion for a pair of nodes ( v1 , v2 ), from deno = | v1 int. v2 |, the non-zero counts cross1 = [ | u1 int. v2 | ] and cross2 = [ | v1 int. u2 | ], where u1 and u2 run over the children of v1 and v2, and the list "children" of ( | u1 int. u2 | , HMI( u1 , u2 ) ) over the pairs of children with a non-empty intersection. The sums are evaluated with math.fsum, so the result does not depend on the order of the terms, i.e. on how the nodes were indexed. This is what lets _parallel_hierarchical_mutual_information reproduce the sequential value exactly.
+    """
+    deno = float( deno )
+    cH1 = - math.fsum( _xlnx( nume / deno ) for nume in cross1 )
+    cH2 = - math.fsum( _xlnx( nume / deno ) for nume in cross2 )
+    cjH = - math.fsum( _xlnx( nume / deno ) for nume , _ in children )
+    crH = math.fsum( ( nume / deno ) * HMI12 for nume , HMI12 in children )
+    return cH1 + cH2 - cjH + crH
+
+def _compact_branch_paths( arrays ):
+    """
+    As _branch_paths, for the whole hierarchy stored in the _CompactArrays "arrays", whose nodes keep their own (pre-order) indexes.
+    """
+    parents = arrays.parent.tolist()
+    parents[ 0 ] = None
+    child_ptr = arrays.child_ptr.tolist()
+    leaves = [ child_ptr[ i ] == child_ptr[ i + 1 ] for i in xrange( arrays.num_nodes() ) ]
+    start = arrays.start.tolist()
+    end   = arrays.end.tolist()
+    values = arrays.perm if arrays.labels is None else arrays.labels[ arrays.perm ]
+    paths = [ ( 0 , ) ]
+    e2path = {}
+    for i in xrange( 1 , arrays.num_nodes() ):
+        paths.append( paths[ parents[ i ] ] + ( i , ) )
+        if leaves[ i ]:
+            for e in values[ start[ i ] : end[ i ] ].tolist():
+                e2path[ e ] = paths[ i ]
+    if leaves[ 0 ]:
+        for e in values.tolist():
+            e2path[ e ] = paths[ 0 ]
+    return e2path , parents , leaves
+
+# The branch paths (see _compact_branch_paths) of the two hierarchies compared by _parallel_hierarchical_mutual_information, and the storage of the first one, shared with the worker processes of the pool.
+_parallel_hmi_paths = None
+
+def _parallel_hmi_init( arrays1 , arrays2 ):
+    global _parallel_hmi_paths
+    if _parallel_hmi_paths is None: # Otherwise they were inherited from the parent process.
+        paths1 = _compact_branch_paths( arrays1 )
+        paths2 = paths1 if arrays2 is arrays1 else _compact_branch_paths( arrays2 )
+        _parallel_hmi_paths = ( paths1 , paths2 , arrays1 )
+
+def _parallel_hmi_row( i1 ):
+    """
+    Returns <dict> : HMI[ i2 ] for every node i2 of the second hierarchy, at the depth of node i1 of the first one, that intersects i1 (see _parallel_hierarchical_mutual_information). Only the elements of i1 are visited.
+    """
+    ( e2path1 , parents1 , leaves1 ) , ( e2path2 , parents2 , leaves2 ) , arrays1 = _parallel_hmi_paths
+    k = int( arrays1.depth[ i1 ] )
+    path_pairs = []
+    for e in CompactNestedPartition( arrays1 , i1 ).iter_elements():
+        path2 = e2path2.get( e )
+        if path2 is not None and len( path2 ) > k:
+            path_pairs.append( ( e2path1[ e ][ k: ] , path2[ k: ] ) )
+    HMI = _contingency_table_hierarchical_mutual_information( path_pairs , i1 , parents1 , leaves1 , parents2 , leaves2 )
+    return dict( ( v2 , HMI12 ) for ( v1 , v2 ) , HMI12 in HMI.iteritems() if v1 == i1 )
+
+def _parallel_hmi_plan( v1 , v2 , elements , level , depth , tasks ):
+    """
+    Returns the plan of the evaluation of the HMI of the pair of nodes ( v1 , v2 ), at depth "level" of both hierarchies, whose intersection is the list "elements". The plan is either a <float>, a <tuple> ( 'task' , v1 , v2 ) if "depth" is 0, in which case the pair is evaluated in the pool and v1 is added to the set "tasks", or a <tuple> ( 'pair' , deno , cross1 , cross2 , children ) with the arguments of _pair_hierarchical_mutual_information, where "children" holds the plans of the pairs of children. Each level costs a single pass over the elements.
+    """
+    ( e2path1 , parents1 , leaves1 ) , ( e2path2 , parents2 , leaves2 ) , _ = _parallel_hmi_paths
+    if leaves1[ v1 ] or leaves2[ v2 ]:
+        return 0.
+    if depth == 0:
+        tasks.add( v1 )
+        return ( 'task' , v1 , v2 )
+    joint  = defaultdict( list )
+    cross1 = defaultdict( int )
+    cross2 = defaultdict( int )
+    for e in elements:
+        u1 = e2path1[ e ][ level + 1 ]
+        u2 = e2path2[ e ][ level + 1 ]
+        joint[ ( u1 , u2 ) ].append( e )
+        cross1[ u1 ] += 1
+        cross2[ u2 ] += 1
+    children = [ ( len( u1Nu2 ) , _parallel_hmi_plan( u1 , u2 , u1Nu2 , level + 1 , depth - 1 , tasks ) ) for ( u1 , u2 ) , u1Nu2 in joint.iteritems() ]
+    return ( 'pair' , len( elements ) , cross1.values() , cross2.values() , children )
+
+def _parallel_hmi_reduce( plan , rows ):
+    if isinstance( plan , float ):
+        return plan
+    if plan[ 0 ] == 'task':
+        return rows[ plan[ 1 ] ][ plan[ 2 ] ]
+    _ , deno , cross1 , cross2 , children = plan
+    return _pair_hierarchical_mutual_information( deno , cross1 , cross2 , [ ( nume , _parallel_hmi_reduce( child , rows ) ) for nume , child in children ] )
+
+def _parallel_hierarchical_mutual_information( nsp1 , nsp2 , processes = None , depth = 1 ):
+    """
+    Computes the same quantity than _contingency_hierarchical_mutual_information, spreading its independent subproblems across a pool of processes. The branches are stored as CompactNestedPartitions, whose branch paths are shared with the workers. The first "depth" levels of both hierarchies are expanded here (see _parallel_hmi_plan), and the pairs of intersecting nodes at depth "depth" are evaluated in the pool, one node of nsp1 at a time (see _parallel_hmi_row), the largest nodes first. The results are then combined here, bottom-up, always with the same order-independent sums (see _pair_hierarchical_mutual_information). Hence the result is exactly the sequential one, whatever the number of processes and the scheduling.
+
+    processes <int=None> : the number of worker processes. If None, multiprocessing.cpu_count() processes are used.
+
+    >>> for i in xrange( 5 ):
+    ...     nsp1 = generate_random_hierarchy( 50 , seed = i )
+    ...     nsp2 = generate_random_hierarchy( 50 , seed = 100 + i )
+    ...     for depth in [ 1 , 2 ]:
+    ...         HMI_p = _parallel_hierarchical_mutual_information( nsp1 , nsp2 , processes = 2 , depth = depth )
+    ...         assert HMI_p == _contingency_hierarchical_mutual_information( nsp1 , nsp2 ) , ( i , depth )
+    """
+    import multiprocessing
+    global _parallel_hmi_paths
+    assert depth >= 1 , 'ERROR @ _parallel_hierarchical_mutual_information(...) : "depth" must be at least 1.'
+    cnsp1 = nsp1.compact()
+    cnsp2 = cnsp1 if nsp2 is nsp1 else nsp2.compact()
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    _parallel_hmi_paths = None
+    _parallel_hmi_init( cnsp1._arrays , cnsp2._arrays )
+    try:
+        e2path2 = _parallel_hmi_paths[ 1 ][ 0 ]
+        elements = [ e for e in _parallel_hmi_paths[ 0 ][ 0 ] if e in e2path2 ]
+        if len( elements ) == 0:
+            return 0.
+        tasks = set( [] )
+        plan = _parallel_hmi_plan( 0 , 0 , elements , 0 , depth , tasks )
+        tasks = sorted( tasks , key = lambda i1 : - cnsp1._node( i1 ).size() )
+        rows = {}
+        if len( tasks ) > 0:
+            pool = multiprocessing.Pool( min( processes , len( tasks ) ) , _parallel_hmi_init , ( cnsp1._arrays , cnsp2._arrays ) )
+            try:
+                for i1 , row in zip( tasks , pool.imap( _parallel_hmi_row , tasks , chunksize = max( 1 , len( tasks ) // ( 4 * processes ) ) ) ):
+                    rows[ i1 ] = row
+            finally:
+                pool.close()
+                pool.join()
+    finally:
+        _parallel_hmi_paths = None
+    return _parallel_hmi_reduce( plan , rows )
+
+# Compact Hierarchical Partition
+#-------------------------------
+
+class _CompactArrays:
+    """
+    The storage shared by all the nodes of a CompactNestedPartition. The nodes are indexed in pre-order, so the descendants of node i are the nodes i+1,...,stop[i]-1, and the elements of node i are perm[start[i]:end[i]].
+
+    parent <np.array> : parent[ i ] is the index of the parent of node i, or -1 for the root,
+    child_ptr , child_idx <np.array> : the children of node i are child_idx[ child_ptr[ i ] : child_ptr[ i + 1 ] ] (CSR),
+    start , end <np.array> : the slice of perm holding the elements of node i,
+    stop <np.array> : one plus the index of the last descendant of node i,
+    depth <np.array> : depth[ i ] is the depth of node i, being 0 for the root,
+    perm <np.array> : the permutation of the elements, or of their ids if labels is not None,
+    labels <np.array> or None : if not None, labels[ id ] is the element whose id is "id".
+    """
+    def __init__( self , parent , start , end , perm , labels = None , derived = None ):
+        self.parent = np.asarray( parent , dtype = np.int64 )
+        self.start  = np.asarray( start  , dtype = np.int64 )
+        self.end    = np.asarray( end    , dtype = np.int64 )
+        self.perm   = np.asarray( perm )
+        self.labels = labels
+        self.hashes = None # The canonical hash of every node (see CompactNestedPartition.canonical_hash), computed when first needed, and so is the strict one.
+        self.strict_hashes = None
+        M = len( self.parent )
+        assert M > 0 and self.parent[ 0 ] == -1
+        if derived is not None:
+            # The arrays depth, stop, child_ptr and child_idx are given, e.g. memory-mapped from a binary .nsp file.
+            self.depth , self.stop , self.child_ptr , self.child_idx = derived
+            return
+        self.depth = np.zeros( M , dtype = np.int64 )
+        for i in xrange( 1 , M ):
+            self.depth[ i ] = self.depth[ self.parent[ i ] ] + 1
+        self.stop = np.arange( 1 , M + 1 , dtype = np.int64 )
+        for i in xrange( M - 1 , 0 , -1 ):
+            p = self.parent[ i ]
+            if self.stop[ i ] > self.stop[ p ]:
+                self.stop[ p ] = self.stop[ i ]
+        # Children in CSR format. The stable sort keeps the siblings in pre-order.
+        self.child_idx = np.argsort( self.parent[ 1: ] , kind = 'mergesort' ) + 1
+        self.child_ptr = np.zeros( M + 1 , dtype = np.int64 )
+        self.child_ptr[ 1: ] = np.cumsum( np.bincount( self.parent[ 1: ] , minlength = M ) )
+
+    def num_nodes( self ):
+        return len( self.parent )
+
+    def derived( self ):
+        return self.depth , self.stop , self.child_ptr , self.child_idx
+
+def _compact_arrays( parent , start , end , perm , labels = None ):
+    """
+    Builds the _CompactArrays of a hierarchy whose nodes are given in pre-order by their parents, the start of their slice of the element permutation "perm" and, for the leaves, the end of their slice. The ends of the internal nodes are completed here. If not all the elements are integers, they are stored by id together with a table of labels. If "labels" is not None, the elements are already the ids of the lbls.Enumerate "labels" (see NestedPartition.interned), whose table is used.
+    """
+    for i in xrange( len( parent ) - 1 , 0 , -1 ):
+        p = parent[ i ]
+        if end[ i ] > end[ p ]:
+            end[ p ] = end[ i ]
+    if labels is not None:
+        enum = labels
+        ids = np.array( perm , dtype = np.int64 )
+    elif all( isinstance( e , ( int , long , np.integer ) ) for e in perm ):
+        return _CompactArrays( parent , start , end , np.array( perm , dtype = np.int64 ) )
+    else:
+        enum = lbls.Enumerate()
+        ids = np.array( [ enum[ e ] for e in perm ] , dtype = np.int64 )
+    labels = np.empty( len( enum ) , dtype = object )
+    labels[:] = enum.copy_i2l()
+    return _CompactArrays( parent , start , end , ids , labels )
+
+def _compact_from_leaf_paths( leaf_paths ):
+    """
+    Builds the _CompactArrays of a hierarchy given as a list of tuples ( path , elements ) where "path" is the <tuple> of <int> identifying a leaf, as in NestedPartition.iter_leaves_path, and "elements" are the elements of that leaf. Sorting the paths lexicographically lays out the nodes in pre-order, so no per-node set is ever built.
+    """
+    leaf_paths = sorted( leaf_paths , key = itemgetter( 0 ) )
+    prefix_2_i = {}
+    parent = []
+    start  = []
+    end    = []
+    perm   = []
+    for path , elements in leaf_paths:
+        for k in xrange( len( path ) + 1 ):
+            prefix = path[:k]
+            if prefix not in prefix_2_i:
+                prefix_2_i[ prefix ] = len( parent )
+                parent.append( prefix_2_i[ path[:k-1] ] if k > 0 else -1 )
+                start.append( len( perm ) )
+                end.append( len( perm ) )
+        perm.extend( elements )
+        end[ prefix_2_i[ path ] ] = len( perm )
+    return _compact_arrays( parent , start , end , perm )
+
+class CompactNestedPartition:
+    """
+    A read-only hierarchical partition stored as NumPy arrays (see _CompactArrays), instead of as a tree of NestedPartition objects each one holding its own set of elements. A CompactNestedPartition object is a light view of one node of the shared arrays; hence, elements() returns a slice of the element permutation, not a set.
+
+    >>> nsp = toy()[ 'root' ]
+    >>> cnsp = nsp.compact()
+    >>> cnsp
+    nsp[[3, 4, 5, 6], [[0, 1], [2]], [[7], [8, 9]]]
+    >>> cnsp.size() , cnsp.degree() , len( [ n for n in cnsp.DFS() ] )
+    (10, 3, 8)
+    >>> cnsp.expand()
+    nsp[[3, 4, 5, 6], [[0, 1], [2]], [[7], [8, 9]]]
+    """
+    def __init__( self , arrays , index = 0 ):
+        self._arrays = arrays
+        self._index  = index
+
+    def _node( self , index ):
+        return CompactNestedPartition( self._arrays , index )
+
+    def __eq__( self , cnsp ):
+        return isinstance( cnsp , CompactNestedPartition ) and self._arrays is cnsp._arrays and self._index == cnsp._index
+
+    def __ne__( self , cnsp ):
+        return not self.__eq__( cnsp )
+
+    def __hash__( self ):
+        return hash( ( id( self._arrays ) , self._index ) )
+
+    def check_consistency( self , assert_not_non_informative_branches = False ):
+        """
+        >>> toy()[ 'root' ].compact().check_consistency()
+        """
+        a = self._arrays
+        sizes = a.end - a.start
+        assert ( sizes > 0 ).all() , 'ERROR @ CompactNestedPartition.check_consistency() : the hierarchy contains empty community.'
+        degrees = np.diff( a.child_ptr )
+        if assert_not_non_informative_branches:
+            assert ( degrees != 1 ).all() , 'ERROR @ CompactNestedPartition.check_consistency() : the hierarchy contains a non-informative branch, i.e. a community with one child community, only.'
+        children_sizes = np.bincount( a.parent[ 1: ] , weights = sizes[ 1: ] , minlength = a.num_nodes() )
+        internal = degrees > 0
+        assert ( children_sizes[ internal ] == sizes[ internal ] ).all() , 'ERROR @ CompactNestedPartition.check_consistency() : the hierarchy contains a community with a set of elements different from the union of the set of elements of its children communities.'
+        assert len( np.unique( a.perm ) ) == len( a.perm ) , 'ERROR @ CompactNestedPartition.check_consistency() : the hierarchy contains repeated elements.'
+
+    def size( self ):
+        return int( self._arrays.end[ self._index ] - self._arrays.start[ self._index ] )
+
+    def degree( self ):
+        return int( self._arrays.child_ptr[ self._index + 1 ] - self._arrays.child_ptr[ self._index ] )
+
+    def is_root( self ):
+        return self._arrays.parent[ self._index ] == -1
+
+    def is_leaf( self ):
+        return self.degree() == 0
+
+    def ancestor( self ):
+        p = self._arrays.parent[ self._index ]
+        if p == -1:
+            return None
+        return self._node( p )
+
+    def root( self ):
+        return self._node( 0 )
+
+    def _element_values( self ):
+        a = self._arrays
+        values = a.perm[ a.start[ self._index ] : a.end[ self._index ] ]
+        if a.labels is None:
+            return values
+        return a.labels[ values ]
+
+    def elements( self ):
+        """
+        Returns <np.array> : the elements of self. If the elements are integers, this is a view of the element permutation, not a copy.
+        """
+        return self._element_values()
+
+    def iter_elements( self ):
+        for e in self._element_values().tolist():
+            yield e
+
+    def __iter__( self ):
+        a = self._arrays
+        for c in a.child_idx[ a.child_ptr[ self._index ] : a.child_ptr[ self._index + 1 ] ]:
+            yield self._node( c )
+
+    def iter_children( self , sort = False ):
+        if sort:
+            for c in sorted( self , key = _cnsp_key ):
+                yield c
+        else:
+            for c in self:
+                yield c
+
+    def enumerate_children( self ):
+        for i , c in enumerate( self.iter_children( sort = True ) ):
+            yield i , c
+
+    def DFS( self , sort = False ):
+        """
+        Yields the nodes of the branch spawned by self in post-order, as NestedPartition.DFS.
+
+        >>> cnsp = toy()[ 'root' ].compact()
+        >>> for node in cnsp.DFS( sort = True ):
+        ...     print node
+        ..nsp[0, 1]
+        ..nsp[2]
+        ..nsp[[0, 1], [2]]
+        ..nsp[3, 4, 5, 6]
+        ..nsp[7]
+        ..nsp[8, 9]
+        ..nsp[[7], [8, 9]]
+        nsp[[3, 4, 5, 6], [[0, 1], [2]], [[7], [8, 9]]]
+        """
+        stack = [ ( self , False ) ]
+        while stack:
+            n , expanded = stack.pop()
+            if expanded or n.is_leaf():
+                yield n
+            else:
+                stack.append( ( n , True ) )
+                for c in reversed( list( n.iter_children( sort = sort ) ) ):
+                    stack.append( ( c , False ) )
+
+    def newick( self , sort = True ):
+        return _newick( self , lambda n : n._element_values().tolist() , sort )
+
+    def canonical_hash( self , strict = False ):
+        """
+        Returns <str> : the canonical hash of the branch spawned by self, or its strict hash if "strict" is True, as NestedPartition.canonical_hash. The hashes of all the nodes are computed at once, in reverse pre-order (i.e. children first), the first time one of them is needed.
+
+        >>> cnsp = toy()[ 'root' ].compact()
+        >>> [ c.canonical_hash() == c.expand().canonical_hash() for c in cnsp ]
+        [True, True, True]
+        >>> [ c.canonical_hash( strict = True ) == c.expand().canonical_hash( strict = True ) for c in cnsp ]
+        [True, True, True]
+        """
+        a = self._arrays
+        if a.hashes is None:
+            child_ptr = a.child_ptr.tolist()
+            child_idx = a.child_idx.tolist()
+            hashes = [ None ] * a.num_nodes()
+            strict_hashes = [ None ] * a.num_nodes()
+            one_child_nodes = [ 0 ] * a.num_nodes()
+            for i in xrange( a.num_nodes() - 1 , -1 , -1 ):
+                children = child_idx[ child_ptr[ i ] : child_ptr[ i + 1 ] ]
+                if len( children ) == 0:
+                    hashes[ i ] = strict_hashes[ i ] = _leaf_hash( self._node( i )._element_values().tolist() )
+                    continue
+                if len( children ) == 1:
+                    c = children[ 0 ]
+                    hashes[ i ] = _one_child_hash( hashes[ c ] , child_ptr[ c ] == child_ptr[ c + 1 ] or ( child_ptr[ c + 1 ] - child_ptr[ c ] == 1 and hashes[ c ] == hashes[ child_idx[ child_ptr[ c ] ] ] ) )
+                else:
+                    hashes[ i ] = _internal_hash( [ hashes[ c ] for c in children ] )
+                one_child_nodes[ i ] = ( len( children ) == 1 ) + sum( [ one_child_nodes[ c ] for c in children ] )
+                if one_child_nodes[ i ] == 0:
+                    strict_hashes[ i ] = hashes[ i ]
+                else:
+                    strict_hashes[ i ] = _internal_hash( [ strict_hashes[ c ] for c in children ] )
+            a.hashes = hashes
+            a.strict_hashes = strict_hashes
+        if strict:
+            return a.strict_hashes[ self._index ]
+        return a.hashes[ self._index ]
+
+    def equivalent( self , nsp ):
+        """
+        Returns <bool> : True if the branches spawned by self and nsp, a NestedPartition or a CompactNestedPartition, are the same nested partition (see NestedPartition.equivalent).
+
+        >>> cnsp = toy()[ 'root' ].compact()
+        >>> cnsp.equivalent( toy()[ 'root' ] ) , cnsp.equivalent( toy2()[ 'root' ].compact() )
+        (True, False)
+        """
+        assert isinstance( nsp , ( NestedPartition , CompactNestedPartition ) )
+        if self == nsp:
+            return True
+        if self.size() != nsp.size():
+            return False
+        return self.canonical_hash() == nsp.canonical_hash()
+
+    def __repr__( self ):
+        if self.is_root():
+            return 'nsp' + str( self.newick() )
+        return '..nsp' + str( self.newick() )
+
+    def __str__( self ):
+        return self.__repr__()
+
+    def iter_leaves_path( self ):
+        """
+        >>> cnsp = toy()[ 'root' ].compact()
+        >>> for path_elem in cnsp.iter_leaves_path():
+        ...     print path_elem[:-1] , sorted( path_elem[-1] )
+        [0, 0] [0, 1]
+        [0, 1] [2]
+        [1] [3, 4, 5, 6]
+        [2, 0] [7]
+        [2, 1] [8, 9]
+        """
+        stack = [ ( self , [] ) ]
+        while stack:
+            n , path = stack.pop()
+            if n.is_leaf():
+                yield path + [ n.elements() ]
+            else:
+                for i , c in reversed( list( n.enumerate_children() ) ):
+                    stack.append( ( c , path + [ i ] ) )
+
+    def save( self , filename = None ):
+        """
+        Saves the hierarchy using the same .nsp file-format than NestedPartition.save.
+
+        >>> toy()[ 'root' ].compact().save( 'ctoy.nsp' )
+        >>> load_NestedPartition( 'ctoy.nsp' , nodes_as_int = True )
+        nsp[[3, 4, 5, 6], [[0, 1], [2]], [[7], [8, 9]]]
+        """
+        if not self.is_root( ):
+            self.root().save( filename )
+        else:
+            with smart_streamout( filename ) as fhw:
+                for path_elem in self.iter_leaves_path():
+                    print >>fhw , ':'.join( [ str( p ) for p in path_elem[:-1] ] ) + ' #%$ ' + ','.join( [ '"' + str(e) + '"' for e in path_elem[-1] ] )
+
+    def save_binary( self , filename ):
+        """
+        Saves the hierarchy in the binary .nspb file-format (see load_binary_NestedPartition).
+
+        >>> toy()[ 'root' ].compact().save_binary( 'toy.nspb' )
+        >>> load_binary_NestedPartition( 'toy.nspb' )
+        nsp[[3, 4, 5, 6], [[0, 1], [2]], [[7], [8, 9]]]
+        """
+        if not self.is_root( ):
+            self.root().save_binary( filename )
+        else:
+            _save_binary_arrays( self._arrays , filename )
+
+    def expand( self , labels = None , backend = 'set' , lazy = False ):
+        """
+        Returns <NestedPartition> : a copy of the branch spawned by self as a NestedPartition with the storage mode "lazy" (see NestedPartition.copy). If "labels" is not None, its elements are interned with the lbls.Enumerate "labels" and stored with the backend "backend" (see NestedPartition.interned).
+
+        >>> labels = lbls.Enumerate()
+        >>> nsp = old_toy_1()[ 'root' ].compact().expand( labels )
+        >>> nsp.labels() is labels , nsp
+        (True, nsp[[['a'], ['b', 'c']], ['d', 'e', 'f']])
+        >>> nsp.compact()
+        nsp[[['a'], ['b', 'c']], ['d', 'e', 'f']]
+        """
+        if labels is None:
+            element_set = set
+            values = lambda cn : cn._element_values().tolist()
+        else:
+            element_set = _element_set_backend( backend )
+            values = lambda cn : element_set( [ labels[ e ] for e in cn._element_values().tolist() ] )
+        def node( cn ):
+            if lazy and not cn.is_leaf():
+                return NestedPartition( None , labels , lazy , element_set )
+            return NestedPartition( values( cn ) , labels , lazy )
+        nsp = node( self )
+        stack = [ ( self , nsp ) ]
+        while stack:
+            cn , n = stack.pop()
+            for cc in cn:
+                c = node( cc )
+                n._add_child( c )
+                stack.append( ( cc , c ) )
+        return nsp
+
+    def _layers( self , ids , num_ids ):
+        """
+        Returns <np.array> : the matrix A of shape ( D , num_ids ) such that A[ d , ids[ k ] ] is the index of the node, at depth d of the branch spawned by self, containing the k-th element of self, or -1 if that element is in a leaf of depth smaller than d.
+        """
+        a = self._arrays
+        i0 = self._index
+        i1 = a.stop[ i0 ]
+        nodes = np.arange( i0 , i1 )
+        depth = a.depth[ i0:i1 ] - a.depth[ i0 ]
+        D = int( depth.max() ) + 1
+        A = np.empty( ( D , num_ids ) , dtype = np.int64 )
+        A.fill( -1 )
+        offset = a.start[ i0 ]
+        for d in xrange( D ):
+            nodes_d = nodes[ depth == d ]
+            starts = a.start[ nodes_d ]
+            ends   = a.end[ nodes_d ]
+            A[ d , ids[ _concatenated_ranges( starts , ends ) - offset ] ] = np.repeat( nodes_d , ends - starts )
+        return A
+
+    def _shared_layers( self , cnsp ):
+        """
+        Returns the _layers of self and cnsp over a common index of their elements.
+        """
+        values1 = self._element_values()
+        if cnsp == self:
+            _ , ids1 = np.unique( values1 , return_inverse = True )
+            A1 = self._layers( ids1 , len( values1 ) )
+            return A1 , A1
+        values2 = cnsp._element_values()
+        uniq , ids = np.unique( np.concatenate( [ values1 , values2 ] ) , return_inverse = True )
+        ids1 = ids[ : len( values1 ) ]
+        ids2 = ids[ len( values1 ) : ]
+        return self._layers( ids1 , len( uniq ) ) , cnsp._layers( ids2 , len( uniq ) )
+
+    @_cached_measure( 'HMI' )
+    def hierarchical_mutual_information( self , nsp , run_checks = True ):
+        """
+        Same as NestedPartition.hierarchical_mutual_information. nsp may be either a CompactNestedPartition or a NestedPartition.
+
+        >>> root1 = old_toy_1()[ 'root' ].compact()
+        >>> root2 = old_toy_2()[ 'root' ].compact()
+        >>> "%.7f" % root1.hierarchical_mutual_information( root1 )
+        '1.0114043'
+        >>> "%.7f" % root1.hierarchical_mutual_information( root2 )
+        '0.6931472'
+        >>> for i in xrange( 10 ):
+        ...     nsp1 = generate_random_hierarchy( 50 , seed = i )
+        ...     nsp2 = generate_random_hierarchy( 50 , seed = 100 + i )
+        ...     HMI_c = nsp1.compact().hierarchical_mutual_information( nsp2 )
+        ...     HMI_r = nsp1.hierarchical_mutual_information( nsp2 , engine = 'recursive' )
+        ...     assert _feq( HMI_c , HMI_r ) , ( i , HMI_c , HMI_r )
+        """
+        if isinstance( nsp , NestedPartition ):
+            nsp = nsp.compact()
+        assert isinstance( nsp , CompactNestedPartition )
+        if run_checks:
+            self.check_consistency()
+            nsp.check_consistency()
+        A1 , A2 = self._shared_layers( nsp )
+        return _layered_hierarchical_mutual_information( A1 , A2 )
+
+    def hierarchical_entropy( self , run_checks = True ):
+        return self.hierarchical_mutual_information( self , run_checks = run_checks )
+
+    @_cached_measure( 'NHMI' )
+    def normalized_hierarchical_mutual_information( self , nsp , calc_NMI = 'arithmetic' , run_checks = True ):
+        if calc_NMI == 'arithmetic':
+            calc_NMI = _arithmetic_NMI
+        elif calc_NMI == 'geometric':
+            calc_NMI = _geometric_NMI
+        elif calc_NMI == 'max':
+            calc_NMI = _max_NMI
+        else:
+            assert False , 'ERROR @ CompactNestedPartition.normalized_hierarchical_mutual_information(...) : "calc_NMI" specifies unknown normalization method.'
+        if isinstance( nsp , NestedPartition ):
+            nsp = nsp.compact()
+        HMI1  = self.hierarchical_entropy( run_checks = run_checks )
+        HMI2  = nsp.hierarchical_entropy( run_checks = run_checks )
+        HMI12 = self.hierarchical_mutual_information( nsp , run_checks = run_checks )
+        return calc_NMI( HMI1 , HMI2 , HMI12 )
+
+    def _root_entropies( self , nsp , run_checks ):
+        if isinstance( nsp , NestedPartition ):
+            nsp = nsp.compact()
+        assert isinstance( nsp , CompactNestedPartition )
+        assert( self.is_root() ) , 'ERROR @ CompactNestedPartition : assert( self.is_root() )'
+        assert( nsp.is_root() ) , 'ERROR @ CompactNestedPartition : assert( nsp.is_root() )'
+        if run_checks:
+            self.check_consistency()
+            nsp.check_consistency()
+        S1 = _counts_entropy( self._children_sizes() )
+        S2 = _counts_entropy( nsp._children_sizes() )
+        S12 = 0.
+        if not ( self.is_leaf() or nsp.is_leaf() ):
+            A1 , A2 = self._shared_layers( nsp )
+            S12 = _labels_joint_entropy( A1[ 1 ] , A2[ 1 ] )
+        return S1 , S2 , S12
+
+    def _children_sizes( self ):
+        a = self._arrays
+        children = a.child_idx[ a.child_ptr[ self._index ] : a.child_ptr[ self._index + 1 ] ]
+        return a.end[ children ] - a.start[ children ]
+
+    def root_mutual_information( self , nsp , run_checks = True ):
+        """
+        >>> root1 = toy()[ 'root' ].compact()
+        >>> root3 = toy3()[ 'root' ].compact()
+        >>> "%.7f" % root1.root_mutual_information( root3 )
+        '0.6730117'
+        """
+        S1 , S2 , S12 = self._root_entropies( nsp , run_checks )
+        return S1 + S2 - S12
+
+    def root_normalized_mutual_information( self , nsp , calc_NMI = 'arithmetic' , run_checks = True ):
+        """
+        >>> root1 = toy()[ 'root' ].compact()
+        >>> root3 = toy3()[ 'root' ].compact()
+        >>> "%.7f" % root1.root_normalized_mutual_information( root3 )
+        '0.6180656'
+        """
+        if calc_NMI == 'arithmetic':
+            calc_NMI = _arithmetic_NMI
+        elif calc_NMI == 'geometric':
+            calc_NMI = _geometric_NMI
+        elif calc_NMI == 'max':
+            calc_NMI = _max_NMI
+        else:
+            assert False , 'ERROR @ CompactNestedPartition.root_normalized_mutual_information : "calc_NMI" specifies unknown normalization method.'
+        S1 , S2 , S12 = self._root_entropies( nsp , run_checks )
+        return calc_NMI( S1 , S2 , S1 + S2 - S12 )
+
+    @_cached_measure( 'layer_MI' )
+    def iter_layer_mutual_information( self , nsp , calc_NMI = 'arithmetic' , run_checks = True ):
+        """
+        Same as NestedPartition.iter_layer_mutual_information.
+
+        >>> root4 = toy4()[ 'root' ].compact()
+        >>> root5 = toy5()[ 'root' ].compact()
+        >>> for l , mi , nmi in root4.iter_layer_mutual_information( root5 ):
+        ...     print l , mi , nmi
+        0 0.0 0.0
+        1 1.02965301406 1.0
+        2 1.41848366195 0.910970220285
+        3 1.47080847632 0.841391195565
+        """
+        if isinstance( nsp , NestedPartition ):
+            nsp = nsp.compact()
+        assert isinstance( nsp , CompactNestedPartition )
+        assert( self.is_root() ) , 'ERROR @ CompactNestedPartition.iter_layer_mutual_information : assert( self.is_root() )'
+        assert( nsp.is_root() ) , 'ERROR @ CompactNestedPartition.iter_layer_mutual_information : assert( nsp.is_root() )'
+        if calc_NMI == 'arithmetic':
+            calc_NMI = _arithmetic_NMI
+        elif calc_NMI == 'geometric':
+            calc_NMI = _geometric_NMI
+        elif calc_NMI == 'max':
+            calc_NMI = _max_NMI
+        else:
+            assert False , 'ERROR @ CompactNestedPartition.iter_layer_mutual_information : "calc_NMI" specifies unknown normalization method.'
+        if run_checks:
+            self.check_consistency()
+            nsp.check_consistency()
+        A1 , A2 = self._shared_layers( nsp )
+        for layer , MI , NMI in _iter_filled_layers_mutual_information( _fill_layers( A1 ) , _fill_layers( A2 ) , calc_NMI ):
+            yield layer , MI , NMI
+
+def _cnsp_key( cnsp ):
+    return min( cnsp._element_values() )
+
+def _concatenated_ranges( starts , ends ):
+    """
+    >>> _concatenated_ranges( np.array( [ 2 , 7 ] ) , np.array( [ 4 , 10 ] ) )
+    array([2, 3, 7, 8, 9])
+    """
+    sizes = ends - starts
+    offsets = np.repeat( starts - np.cumsum( sizes ) + sizes , sizes )
+    return offsets + np.arange( sizes.sum() )
+
+def _vxlnx( x ):
+    return x * np.log( x )
+
+def _counts_entropy( counts ):
+    if len( counts ) == 0:
+        return 0.
+    N = float( np.sum( counts ) )
+    return - float( np.sum( _vxlnx( counts / N ) ) )
+
+def _labels_joint_entropy( labels1 , labels2 ):
+    mask = ( labels1 >= 0 ) & ( labels2 >= 0 )
+    codes = labels1[ mask ] * ( int( labels2.max() ) + 1 ) + labels2[ mask ]
+    _ , counts = np.unique( codes , return_counts = True )
+    return _counts_entropy( counts )
+
+def _fill_layers( A ):
+    """
+    Returns a copy of the layers A where every element of a leaf of depth d is also assigned to that leaf at the depths larger than d.
+    """
+    F = A.copy()
+    for d in xrange( 1 , len( F ) ):
+        missing = F[ d ] < 0
+        F[ d , missing ] = F[ d - 1 , missing ]
+    return F
+
+def _iter_filled_layers_mutual_information( F1 , F2 , calc_NMI ):
+    """
+    Yields ( layer , MI , NMI ) from the filled layers of two hierarchies, following the conventions of NestedPartition.iter_layer_mutual_information.
+    """
+    yield 0 , 0. , 0.
+    for layer in xrange( 1 , max( len( F1 ) , len( F2 ) ) ):
+        l1 = F1[ min( layer , len( F1 ) - 1 ) ]
+        l2 = F2[ min( layer , len( F2 ) - 1 ) ]
+        H1 = _layer_labels_entropy( l1 )
+        H2 = _layer_labels_entropy( l2 )
+        MI = H1 + H2 - _layer_labels_joint_entropy( l1 , l2 )
+        yield layer , MI , calc_NMI( H1 , H2 , MI )
+
+def _layer_labels_entropy( labels ):
+    _ , counts = np.unique( labels[ labels >= 0 ] , return_counts = True )
+    N = counts.sum()
+    return _ln( N ) - np.sum( counts * np.log( counts ) ) / float( N )
+
+def _layer_labels_joint_entropy( labels1 , labels2 ):
+    mask = ( labels1 >= 0 ) & ( labels2 >= 0 )
+    codes = labels1[ mask ] * ( int( labels2.max() ) + 1 ) + labels2[ mask ]
+    _ , counts = np.unique( codes , return_counts = True )
+    N = counts.sum()
+    return _ln( N ) - np.sum( counts * np.log( counts ) ) / float( N )
+
+def _layered_hierarchical_mutual_information( A1 , A2 ):
+    """
+    Computes the HMI from the layers of two hierarchies over a common index of elements (see CompactNestedPartition._layers). This is the vectorized version of _contingency_hierarchical_mutual_information: at each depth, the pairs of nodes with a non-empty intersection are obtained by np.unique over combined node codes, and the terms of the recursion are accumulated from the deepest layer up with np.bincount.
+    """
+    D = min( len( A1 ) , len( A2 ) )
+    M2 = int( A2.max() ) + 1
+    HMI_next = None
+    for d in xrange( D - 1 , -1 , -1 ):
+        mask = ( A1[ d ] >= 0 ) & ( A2[ d ] >= 0 )
+        pair_of_e = np.empty( A1.shape[ 1 ] , dtype = np.int64 )
+        pair_of_e.fill( -1 )
+        _ , pair_of_e[ mask ] , counts = np.unique( A1[ d , mask ] * M2 + A2[ d , mask ] , return_inverse = True , return_counts = True )
+        P = len( counts )
+        HMI = np.zeros( P )
+        if HMI_next is not None and len( counts_next ) > 0:
+            # Since a node at depth d+1 is always inside a node at depth d, the pairs at depth d+1 are those of the elements in mask_next.
+            parents = pair_of_e[ mask_next ]
+            child_parent = np.empty( len( counts_next ) , dtype = np.int64 )
+            child_parent[ pair_of_e_next[ mask_next ] ] = parents
+            frac = counts_next / counts[ child_parent ].astype( float )
+            cjH = - np.bincount( child_parent , weights = _vxlnx( frac ) , minlength = P )
+            crH = np.bincount( child_parent , weights = frac * HMI_next , minlength = P )
+            cH = []
+            for codes in [ A1[ d + 1 , mask_next ] * M2 + A2[ d , mask_next ] , A1[ d , mask_next ] * M2 + A2[ d + 1 , mask_next ] ]:
+                _ , inv , cross_counts = np.unique( codes , return_inverse = True , return_counts = True )
+                cross_parent = np.empty( len( cross_counts ) , dtype = np.int64 )
+                cross_parent[ inv ] = parents
+                cH.append( - np.bincount( cross_parent , weights = _vxlnx( cross_counts / counts[ cross_parent ].astype( float ) ) , minlength = P ) )
+            HMI = cH[ 0 ] + cH[ 1 ] - cjH + crH
+        HMI_next = HMI
+        counts_next = counts
+        pair_of_e_next = pair_of_e
+        mask_next = mask
+    if HMI_next is None or len( HMI_next ) == 0:
+        return 0.
+    return float( HMI_next[ 0 ] )
+
+def load_NestedPartition( filename , nodes_as_int = False , run_checks = True , labels = None , backend = 'set' , lazy = False ):
+    """
+    The .nsp file-format is how a Hierarchical Partition is saved into a file. An example of how a .nsp file looks like is:
+
+    0:0 #%$ "0"
+    0:1 #%$ "1","2","3"
+    1:0 #%$ "4","5"
+    1:1:0 #%$ "6"
+    1:1:1 #%$ "7","8","9"
+
+    which corresponds to the tree whose root contains the elemtns "0","1",...,"9" and whose hierarchy is formed by the tree:
+
+    root ---> 0 ---> 0 : "0"
+        |      \---> 1 : "1","2","3"
+        |
+        \---> 1 ---> 0 : "4","5"
+               \---> 1 ---> 0 : "6"
+                      \---> 1 : "7","8","9"
+
+    filename <str> : the path and filename of the .nsp file that should be loaded.
+
+    node_as_int <bool=False> : If true, all nodes names (i.e. the names of the elements inside the communities of the hierarchical partition) are considered to be integers instead of strings. This option is provided because, for some network packages, nodes are not represented as integers---which is usually computationally faster---but as strings. For safety reasons, the default is set to False.
+
+    check <bool=False> : If True, it checks for consistency.
+
+    If "filename" is a binary .nspb file (see load_binary_NestedPartition), it is loaded as such and expanded into a NestedPartition; in that case "nodes_as_int" is ignored, since the type of the elements is stored in the file.
+
+    labels <lbls.Enumerate=None> : if not None, the elements are interned while loading, i.e. replaced by their ids in "labels" (see NestedPartition.interned). Hierarchies to be compared are loaded with the same "labels".
+
+    backend <str='set'> : the backend of the sets of elements of an interned hierarchy, 'set' or 'bitset' (see NestedPartition.interned).
+
+    lazy <bool|str=False> : the storage mode of the hierarchy (see NestedPartition.copy). If not False, only the sets of elements of the leaves are built.
+
+    >>> lnsp = load_NestedPartition( 'toy.nsp' , nodes_as_int = True , lazy = True )
+    >>> lnsp , lnsp._elements , lnsp.size()
+    (nsp[[3, 4, 5, 6], [[0, 1], [2]], [[7], [8, 9]]], None, 10)
+
+    >>> nsp = load_NestedPartition( 'toy.nsp' , nodes_as_int = True )
+    >>> nsp
+    nsp[[3, 4, 5, 6], [[0, 1], [2]], [[7], [8, 9]]]
+    >>> labels = lbls.Enumerate()
+    >>> nsp1 = load_NestedPartition( 'toy.nsp' , labels = labels )
+    >>> nsp1.save( 'toy_interned.nsp' )
+    >>> nsp2 = load_NestedPartition( 'toy_interned.nsp' , labels = labels )
+    >>> len( labels ) , nsp1.labels() is nsp2.labels() , "%.7f" % nsp1.hierarchical_mutual_information( nsp2 )
+    (10, True, '1.4708085')
+    >>> k2n = toy()
+    >>> nsp = k2n[ 'root' ]
+    >>> nsp
+    nsp[[3, 4, 5, 6], [[0, 1], [2]], [[7], [8, 9]]]
+    """
+    if _is_binary_nsp( filename ):
+        return load_binary_NestedPartition( filename , run_checks = run_checks ).expand( labels , backend , lazy )
+
+    if _cache is not None:
+        key = cache_key( 'load_NestedPartition' , file_digest( [ filename ] ) , nodes_as_int )
+        cnsp = _cache.get_nsp( key )
+        if cnsp is not None:
+            root = cnsp.expand( labels , backend , lazy )
+            if run_checks:
+                root.check_consistency()
+            return root
 
     def iter_subpaths( path ):
         """
@@ -1510,11 +3567,14 @@ def load_NestedPartition( filename , nodes_as_int = False , run_checks = True ):
                 elements = set([ int( e ) for e in elements[1:-2].split( '","' ) ])
             else:
                 elements = set([ e for e in elements[1:-2].split( '","' ) ])
+            if labels is not None:
+                elements = set([ labels[ e ] for e in elements ])
             # Here the path is iterated over its sub-paths and the sub-paths are correspondingly populated by the network nodes and "linked" as some being the parents/children of the others.
             psp = None
             for sp in iter_subpaths( path ):
-                for e in elements:
-                    sp_2_elements[ sp ].add( e )
+                if not lazy or sp == path:
+                    for e in elements:
+                        sp_2_elements[ sp ].add( e )
                 if psp is not None:
                     sp_2_children_sp[ psp ].add( sp )
                 else:
@@ -1523,8 +3583,17 @@ def load_NestedPartition( filename , nodes_as_int = False , run_checks = True ):
 
     # Now the one-to-one relation between sub-paths and NestedPartitions is stablished.
     sp_2_nsp = {}
+    element_set = set
+    if labels is not None:
+        element_set = _element_set_backend( backend )
     for sp , elements in sp_2_elements.items():
-        sp_2_nsp[ sp ] = NestedPartition( elements )
+        if labels is not None:
+            elements = element_set( elements )
+        sp_2_nsp[ sp ] = NestedPartition( elements , labels , lazy )
+    # In a lazy hierarchy, the internal nodes hold no elements.
+    for sp in sp_2_children_sp.keys():
+        if sp not in sp_2_nsp:
+            sp_2_nsp[ sp ] = NestedPartition( None , labels , lazy , element_set )
 
     # Now, the NestedPartitions are properly linked in order to form the Hierarchical Partition.
     for sp in sp_2_children_sp.keys():
@@ -1537,17 +3606,481 @@ def load_NestedPartition( filename , nodes_as_int = False , run_checks = True ):
     if run_checks:
         root.check_consistency()
 
+    if _cache is not None:
+        _cache.put_nsp( key , root )
+
+    return root
+
+def load_CompactNestedPartition( filename , nodes_as_int = False , run_checks = True ):
+    """
+    Loads a .nsp file (see load_NestedPartition) directly into a CompactNestedPartition, without building the set of elements of every node.
+
+    >>> toy()[ 'root' ].save( 'toy.nsp' )
+    >>> load_CompactNestedPartition( 'toy.nsp' , nodes_as_int = True )
+    nsp[[3, 4, 5, 6], [[0, 1], [2]], [[7], [8, 9]]]
+    >>> load_CompactNestedPartition( 'toy.nsp' )
+    nsp[[['0', '1'], ['2']], [['7'], ['8', '9']], ['3', '4', '5', '6']]
+    """
+    leaf_paths = []
+    with open( filename , 'r' ) as fh:
+        for line in fh:
+            path , elements = line.split( ' #%$ ' )
+            if path == '':
+                path = ()
+            else:
+                path = tuple( [ int( p ) for p in path.split( ':' ) ] )
+            elements = elements[1:-2].split( '","' )
+            if nodes_as_int:
+                elements = [ int( e ) for e in elements ]
+            leaf_paths.append( ( path , elements ) )
+    root = CompactNestedPartition( _compact_from_leaf_paths( leaf_paths ) )
+    if run_checks:
+        root.check_consistency()
+    return root
+
+# The binary .nspb file-format. After a header of _NSPB_HEADER_SIZE bytes, it holds the little-endian int64 arrays parent, start, end, depth, stop, child_ptr, child_idx and perm of the _CompactArrays, one after the other. If the elements are not integers, perm holds their ids and it is followed by the int64 offsets of the labels inside the string table, and by the string table itself.
+_NSPB_MAGIC       = 'NSPB\x00\x00\x00\x01'
+_NSPB_HEADER      = '<8sQQQQ'
+_NSPB_HEADER_SIZE = 64
+
+def _save_binary_arrays( arrays , filename ):
+    a = arrays
+    M = a.num_nodes()
+    N = len( a.perm )
+    if a.labels is None:
+        labels = []
+        table = ''
+    else:
+        labels = [ str( l ) for l in a.labels ]
+        table = ''.join( labels )
+    header = struct.pack( _NSPB_HEADER , _NSPB_MAGIC , M , N , len( labels ) , len( table ) )
+    with open( filename , 'wb' ) as fhw:
+        fhw.write( header.ljust( _NSPB_HEADER_SIZE , '\x00' ) )
+        for array in [ a.parent , a.start , a.end ] + list( a.derived() ) + [ a.perm ]:
+            fhw.write( np.asarray( array , dtype = '<i8' ).tostring() )
+        if len( labels ) > 0:
+            offsets = np.zeros( len( labels ) + 1 , dtype = '<i8' )
+            offsets[ 1: ] = np.cumsum( [ len( l ) for l in labels ] )
+            fhw.write( offsets.tostring() )
+            fhw.write( table )
+
+def _is_binary_nsp( filename ):
+    with open( filename , 'rb' ) as fh:
+        return fh.read( len( _NSPB_MAGIC ) ) == _NSPB_MAGIC
+
+def load_binary_NestedPartition( filename , mmap = True , run_checks = True ):
+    """
+    Loads a binary .nspb file as a CompactNestedPartition. If "mmap" is True the arrays are memory-mapped with np.memmap, so nothing but the header (and the string table, if any) is parsed.
+
+    filename <str> : the path and filename of the .nspb file that should be loaded.
+
+    mmap <bool=True> : if False, the arrays are read into memory instead.
+
+    run_checks <bool=True> : If True, it checks for consistency.
+
+    >>> nsp = old_toy_1()[ 'root' ]
+    >>> nsp.save_binary( 'old_toy_1.nspb' )
+    >>> load_binary_NestedPartition( 'old_toy_1.nspb' )
+    nsp[[['a'], ['b', 'c']], ['d', 'e', 'f']]
+    >>> load_binary_NestedPartition( 'old_toy_1.nspb' , mmap = False ).hierarchical_entropy() == nsp.hierarchical_entropy()
+    True
+    """
+    with open( filename , 'rb' ) as fh:
+        header = fh.read( _NSPB_HEADER_SIZE )
+    magic , M , N , L , table_size = struct.unpack( _NSPB_HEADER , header[ : struct.calcsize( _NSPB_HEADER ) ] )
+    assert magic == _NSPB_MAGIC , 'ERROR @ load_binary_NestedPartition(...) : "' + filename + '" is not a binary .nsp file.'
+    sizes = [ M , M , M , M , M , M + 1 , M - 1 , N ]
+    if L > 0:
+        sizes.append( L + 1 )
+    count = sum( sizes )
+    if mmap:
+        block = np.memmap( filename , dtype = '<i8' , mode = 'r' , offset = _NSPB_HEADER_SIZE , shape = ( count , ) )
+    else:
+        with open( filename , 'rb' ) as fh:
+            fh.seek( _NSPB_HEADER_SIZE )
+            block = np.fromfile( fh , dtype = '<i8' , count = count )
+    arrays = []
+    offset = 0
+    for size in sizes:
+        arrays.append( block[ offset : offset + size ] )
+        offset += size
+    labels = None
+    if L > 0:
+        with open( filename , 'rb' ) as fh:
+            fh.seek( _NSPB_HEADER_SIZE + 8 * count )
+            table = fh.read( table_size )
+        offsets = arrays[ 8 ]
+        labels = np.empty( L , dtype = object )
+        labels[:] = [ table[ offsets[ i ] : offsets[ i + 1 ] ] for i in xrange( L ) ]
+    parent , start , end , depth , stop , child_ptr , child_idx , perm = arrays[ : 8 ]
+    root = CompactNestedPartition( _CompactArrays( parent , start , end , perm , labels , derived = ( depth , stop , child_ptr , child_idx ) ) )
+    if run_checks:
+        root.check_consistency()
     return root
 
-def generate_random_hierarchy( num_elements , num_iterations = None , seed = None ):
+def convert_nsp_to_binary( filename , filename_out = None , nodes_as_int = False ):
+    """
+    Converts a text .nsp file into a binary .nspb file. If "filename_out" is None, the extension of "filename" is replaced by ".nspb". Returns the name of the written file.
+
+    >>> toy()[ 'root' ].save( 'toy.nsp' )
+    >>> convert_nsp_to_binary( 'toy.nsp' , nodes_as_int = True )
+    'toy.nspb'
+    >>> load_NestedPartition( 'toy.nspb' ).equivalent( load_NestedPartition( 'toy.nsp' , nodes_as_int = True ) )
+    True
+    >>> convert_nsp_to_binary( 'toy.nsp' , 'toy_str.nspb' )
+    'toy_str.nspb'
+    >>> load_NestedPartition( 'toy_str.nspb' ).equivalent( load_NestedPartition( 'toy.nsp' ) )
+    True
+    """
+    if filename_out is None:
+        filename_out = os.path.splitext( filename )[ 0 ] + '.nspb'
+    load_CompactNestedPartition( filename , nodes_as_int = nodes_as_int , run_checks = False ).save_binary( filename_out )
+    return filename_out
+
+def load_any_CompactNestedPartition( filename , nodes_as_int = False , run_checks = True ):
+    """
+    Loads either a text .nsp file or a binary .nspb file (see load_binary_NestedPartition) as a CompactNestedPartition.
+    """
+    if _is_binary_nsp( filename ):
+        return load_binary_NestedPartition( filename , run_checks = run_checks )
+    return load_CompactNestedPartition( filename , nodes_as_int = nodes_as_int , run_checks = run_checks )
+
+# The hierarchies compared by hierarchical_mutual_information_matrix, shared with the worker processes of the pool.
+_hmi_matrix_hierarchies = None
+
+def _hmi_matrix_init( filenames , nodes_as_int ):
+    global _hmi_matrix_hierarchies
+    if _hmi_matrix_hierarchies is None: # Otherwise they were inherited from the parent process.
+        _hmi_matrix_hierarchies = [ load_any_CompactNestedPartition( f , nodes_as_int = nodes_as_int , run_checks = False ) for f in filenames ]
+
+def _hmi_matrix_pair( pair ):
+    i , j = pair
+    return i , j , _hmi_matrix_hierarchies[ i ].hierarchical_mutual_information( _hmi_matrix_hierarchies[ j ] , run_checks = False )
+
+def unique_hierarchies( hierarchies ):
+    """
+    Groups the equal hierarchies, e.g. the identical replicas of an ensemble, by their canonical hashes (see NestedPartition.canonical_hash), in linear time.
+
+    hierarchies <list> : NestedPartitions or CompactNestedPartitions.
+
+    Returns <tuple> : ( unique , inverse ) where "unique" is the <list> of the indexes of the first occurrence of each distinct hierarchy, and inverse[ i ] is the position in "unique" of the hierarchy equal to hierarchies[ i ], as in np.unique.
+
+    >>> unique_hierarchies( [ toy()[ 'root' ] , toy2()[ 'root' ] , toy()[ 'root' ].compact() ] )
+    ([0, 1], [0, 1, 0])
+    """
+    hash_2_u = {}
+    unique   = []
+    inverse  = []
+    for i , nsp in enumerate( hierarchies ):
+        h = nsp.canonical_hash()
+        if h not in hash_2_u:
+            hash_2_u[ h ] = len( unique )
+            unique.append( i )
+        inverse.append( hash_2_u[ h ] )
+    return unique , inverse
+
+def hierarchical_mutual_information_matrix( filenames , calc_NMI = 'arithmetic' , nodes_as_int = False , processes = 1 , run_checks = True ):
+    """
+    Computes the HMI and the NHMI between every pair of the hierarchies saved in "filenames". Each file is loaded (and checked) once, the hierarchical entropy of each hierarchy is computed once, and the pairs are spread across a pool of processes. Equal hierarchies (see unique_hierarchies) are compared only once.
+
+    filenames <list of str> : the .nsp or .nspb files of the hierarchies.
+
+    calc_NMI <str='arithmetic'> : the normalization, as in NestedPartition.normalized_hierarchical_mutual_information.
+
+    nodes_as_int <bool=False> : as in load_NestedPartition, for the text .nsp files.
+
+    processes <int=1> : the number of worker processes. If 1, everything is computed in the current process. If None, multiprocessing.cpu_count() processes are used.
+
+    run_checks <bool=True> : If True, each hierarchy is checked for consistency once, when loaded.
+
+    Returns <tuple> : the np.arrays HMI and NHMI, of shape ( n , n ) where n = len( filenames ). The diagonal of HMI holds the hierarchical entropies.
+
+    >>> old_toy_1()[ 'root' ].save( 'old_toy_1.nsp' )
+    >>> old_toy_2()[ 'root' ].save( 'old_toy_2.nsp' )
+    >>> old_toy_1()[ 'root' ].save_binary( 'old_toy_1.nspb' )
+    >>> filenames = [ 'old_toy_1.nsp' , 'old_toy_2.nsp' , 'old_toy_1.nspb' ]
+    >>> HMI , NHMI = hierarchical_mutual_information_matrix( filenames )
+    >>> print np.round( HMI , 7 )
+    [[ 1.0114043  0.6931472  1.0114043]
+     [ 0.6931472  1.0114043  0.6931472]
+     [ 1.0114043  0.6931472  1.0114043]]
+    >>> nsp1 = load_NestedPartition( 'old_toy_1.nsp' )
+    >>> nsp2 = load_NestedPartition( 'old_toy_2.nsp' )
+    >>> _feq( NHMI[ 0 , 1 ] , nsp1.normalized_hierarchical_mutual_information( nsp2 ) )
+    True
+    >>> HMI_p , NHMI_p = hierarchical_mutual_information_matrix( filenames , processes = 2 )
+    >>> np.array_equal( HMI , HMI_p ) and np.array_equal( NHMI , NHMI_p )
+    True
+    """
+    global _hmi_matrix_hierarchies
+    if calc_NMI == 'arithmetic':
+        calc_NMI = _arithmetic_NMI
+    elif calc_NMI == 'geometric':
+        calc_NMI = _geometric_NMI
+    elif calc_NMI == 'max':
+        calc_NMI = _max_NMI
+    else:
+        assert False , 'ERROR @ hierarchical_mutual_information_matrix(...) : "calc_NMI" specifies unknown normalization method.'
+    n = len( filenames )
+    hierarchies = [ load_any_CompactNestedPartition( f , nodes_as_int = nodes_as_int , run_checks = run_checks ) for f in filenames ]
+    unique , inverse = unique_hierarchies( hierarchies )
+    m = len( unique )
+    pairs = [ ( i , j ) for i in xrange( m ) for j in xrange( i , m ) ]
+    _hmi_matrix_hierarchies = [ hierarchies[ k ] for k in unique ]
+    try:
+        if processes == 1:
+            results = map( _hmi_matrix_pair , pairs )
+        else:
+            import multiprocessing
+            if processes is None:
+                processes = multiprocessing.cpu_count()
+            pool = multiprocessing.Pool( processes , _hmi_matrix_init , ( [ filenames[ k ] for k in unique ] , nodes_as_int ) )
+            try:
+                results = pool.map( _hmi_matrix_pair , pairs , chunksize = max( 1 , len( pairs ) // ( 4 * processes ) ) )
+            finally:
+                pool.close()
+                pool.join()
+    finally:
+        _hmi_matrix_hierarchies = None
+    unique_HMI = np.zeros( ( m , m ) )
+    for i , j , HMI12 in results:
+        unique_HMI[ i , j ] = unique_HMI[ j , i ] = HMI12
+    HMI = unique_HMI[ np.ix_( inverse , inverse ) ]
+    NHMI = np.zeros( ( n , n ) )
+    for i in xrange( n ):
+        for j in xrange( i , n ):
+            NHMI[ i , j ] = NHMI[ j , i ] = calc_NMI( HMI[ i , i ] , HMI[ j , j ] , HMI[ i , j ] )
+    return HMI , NHMI
+
+# On-disk cache
+#--------------
+
+class NSPCache:
+    """
+    An on-disk cache of hierarchies and of measures between them, stored in "folder" under content-addressed keys (see cache_key, file_digest and nsp_digest). Hierarchies are stored as binary .nspb files and measures as pickles. Whenever the total size of the folder exceeds "max_bytes", the least recently used entries are evicted until it is at most low_water * max_bytes; an entry is used when it is written or read. The total size is scanned once, and then kept up to date by the writes, so that a write only scans the folder when it triggers an eviction; the writes of other processes sharing the folder are counted at that scan.
+
+    >>> cache = NSPCache( 'doctest_cache' , max_bytes = 1 << 20 )
+    >>> cache.clear()
+    >>> cache.get( cache_key( 'a' ) ) is None
+    True
+    >>> cache.put( cache_key( 'a' ) , [ 1.0 , 2.0 ] )
+    >>> cache.get( cache_key( 'a' ) )
+    [1.0, 2.0]
+    >>> cache.put_nsp( cache_key( 'toy' ) , toy()[ 'root' ] )
+    >>> cache.get_nsp( cache_key( 'toy' ) )
+    nsp[[3, 4, 5, 6], [[0, 1], [2]], [[7], [8, 9]]]
+    >>> cache.put( cache_key( 'c' ) , [ 1.0 , 2.0 , 3.0 ] )
+    >>> cache._total_bytes == cache.size() == NSPCache( 'doctest_cache' )._total_bytes
+    True
+    >>> cache.max_bytes = cache.size() - 1
+    >>> cache.put( cache_key( 'b' ) , 3.0 )
+    >>> cache.get( cache_key( 'a' ) ) is None , cache.get( cache_key( 'b' ) )
+    (True, 3.0)
+    """
+    def __init__( self , folder , max_bytes = 1 << 30 , low_water = 0.8 ):
+        if not os.path.exists( folder ):
+            os.makedirs( folder )
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.low_water = low_water
+        self._total_bytes = self.size()
+
+    def _filename( self , key , extension ):
+        return os.path.join( self.folder , key + extension )
+
+    def _touch( self , filename ):
+        try:
+            os.utime( filename , None )
+        except OSError:
+            pass
+
+    def _commit( self , tmp_filename , filename ):
+        # Entries are written to a temporary file and renamed, so that concurrent processes never read a partial entry.
+        size = os.path.getsize( tmp_filename )
+        if os.path.exists( filename ):
+            size -= os.path.getsize( filename )
+        os.rename( tmp_filename , filename )
+        self._total_bytes += size
+        if self._total_bytes > self.max_bytes:
+            self.evict()
+
+    def _tmp_filename( self , filename ):
+        return filename + '.' + str( os.getpid() ) + '.tmp'
+
+    def get( self , key ):
+        """
+        Returns the measure stored under "key", or None.
+        """
+        filename = self._filename( key , '.pkl' )
+        try:
+            with open( filename , 'rb' ) as fh:
+                value = cPickle.load( fh )
+        except ( IOError , EOFError , cPickle.UnpicklingError ):
+            return None
+        self._touch( filename )
+        return value
+
+    def put( self , key , value ):
+        filename = self._filename( key , '.pkl' )
+        tmp_filename = self._tmp_filename( filename )
+        with open( tmp_filename , 'wb' ) as fhw:
+            cPickle.dump( value , fhw , 2 )
+        self._commit( tmp_filename , filename )
+
+    def get_nsp( self , key ):
+        """
+        Returns the hierarchy stored under "key", as a CompactNestedPartition, or None.
+        """
+        filename = self._filename( key , '.nspb' )
+        if not os.path.exists( filename ):
+            return None
+        try:
+            cnsp = load_binary_NestedPartition( filename , mmap = False , run_checks = False )
+        except ( IOError , AssertionError , struct.error , ValueError ):
+            return None
+        self._touch( filename )
+        return cnsp
+
+    def put_nsp( self , key , nsp ):
+        filename = self._filename( key , '.nspb' )
+        tmp_filename = self._tmp_filename( filename )
+        nsp.save_binary( tmp_filename )
+        self._commit( tmp_filename , filename )
+
+    def _entries( self ):
+        entries = []
+        for name in os.listdir( self.folder ):
+            if name.endswith( '.tmp' ):
+                continue
+            filename = os.path.join( self.folder , name )
+            try:
+                st = os.stat( filename )
+            except OSError:
+                continue
+            entries.append( ( st.st_mtime , st.st_size , filename ) )
+        return entries
+
+    def size( self ):
+        """
+        Returns <int> : the total size, in bytes, of the entries.
+        """
+        return sum( [ size for _ , size , _ in self._entries() ] )
+
+    def evict( self ):
+        """
+        Removes the least recently used entries, if their total size exceeds max_bytes, until it is at most low_water * max_bytes, so that the next eviction is some writes away.
+        """
+        entries = sorted( self._entries() )
+        total = sum( [ size for _ , size , _ in entries ] )
+        if total > self.max_bytes:
+            for _ , size , filename in entries:
+                if total <= self.low_water * self.max_bytes:
+                    break
+                try:
+                    os.remove( filename )
+                except OSError:
+                    pass
+                total -= size
+        self._total_bytes = total
+
+    def clear( self ):
+        for _ , _ , filename in self._entries():
+            os.remove( filename )
+        self._total_bytes = 0
+
+# The cache in use, if any.
+_cache = None
+
+def enable_cache( folder , max_bytes = 1 << 30 , low_water = 0.8 ):
+    """
+    Enables the on-disk cache (see NSPCache). From then on, load_NestedPartition, the HMI, NHMI and per-layer MI measures and oslom2hierpart.oslom2nestedpartition go through it.
+
+    >>> nsp1 = old_toy_1()[ 'root' ]
+    >>> nsp2 = old_toy_2()[ 'root' ]
+    >>> cache = enable_cache( 'doctest_cache' )
+    >>> cache.clear()
+    >>> NHMI = nsp1.normalized_hierarchical_mutual_information( nsp2 )
+    >>> len( cache._entries() ) > 0
+    True
+    >>> nsp1.normalized_hierarchical_mutual_information( nsp2 ) == NHMI
+    True
+    >>> num_entries = len( cache._entries() )
+    >>> NHMI_max = nsp1.normalized_hierarchical_mutual_information( nsp2 , calc_NMI = 'max' )
+    >>> len( cache._entries() ) == num_entries + 1
+    True
+    >>> cache.get( cache_key( 'NHMI' , nsp_digest( nsp1 ) , nsp_digest( nsp2 ) , 'arithmetic' ) ) == NHMI
+    True
+    >>> A = NestedPartition( range( 6 ) )
+    >>> A._add_child( NestedPartition( [ 0 , 1 , 2 ] ) )
+    >>> A._add_child( NestedPartition( [ 3 , 4 , 5 ] ) )
+    >>> B = A.copy()
+    >>> [ c for c in B if 0 in c.elements() ][ 0 ]._add_child( NestedPartition( [ 0 , 1 , 2 ] ) )
+    >>> B.equivalent( A ) , [ len( list( nsp.iter_layer_mutual_information( A ) ) ) for nsp in ( A , B ) ]
+    (True, [2, 3])
+    >>> disable_cache()
+    """
+    global _cache
+    _cache = NSPCache( folder , max_bytes = max_bytes , low_water = low_water )
+    return _cache
+
+def disable_cache():
+    global _cache
+    _cache = None
+
+def get_cache():
+    """
+    Returns <NSPCache> : the cache in use, or None if it is disabled.
+    """
+    return _cache
+
+def cache_key( *parts ):
+    """
+    Returns <str> : the key of the cache entry identified by "parts", the hexadecimal SHA-1 digest of their repr.
+    """
+    return hashlib.sha1( repr( parts ) ).hexdigest()
+
+def file_digest( filenames ):
+    """
+    Returns <str> : the SHA-1 digest of the contents of the files "filenames" (in the given order).
+    """
+    sha1 = hashlib.sha1()
+    for filename in filenames:
+        with open( filename , 'rb' ) as fh:
+            while True:
+                chunk = fh.read( 1 << 20 )
+                if not chunk:
+                    break
+                sha1.update( chunk )
+        sha1.update( '\x00' + str( os.path.getsize( filename ) ) + '\x00' )
+    return sha1.hexdigest()
+
+def nsp_digest( nsp ):
+    """
+    Returns <str> : the strict canonical hash of the branch spawned by nsp (see NestedPartition.canonical_hash), so that equal hierarchies, either NestedPartitions or CompactNestedPartitions, have the same digest. It is the key of the hierarchies in the cache (see enable_cache), hence it tells apart the chains of nodes with one child, which change the per-layer MI, although equivalent does not.
+
+    >>> nsp = toy()[ 'root' ]
+    >>> nsp_digest( nsp ) == nsp_digest( nsp.copy() ) == nsp_digest( nsp.compact() )
+    True
+    >>> nsp_digest( nsp ) == nsp_digest( toy2()[ 'root' ] )
+    False
+    """
+    assert isinstance( nsp , ( NestedPartition , CompactNestedPartition ) )
+    return nsp.canonical_hash( strict = True )
+
+def generate_random_hierarchy( num_elements , num_iterations = None , seed = None , engine = 'nested' ):
     """This function generates a random hierarchy. 
 
+    engine <str='nested'> : one of 'nested' or 'flat'. The 'nested' engine is the original one, which splits random nodes of a NestedPartition with split_here_inplace and extend_here. The 'flat' engine runs a similar process on a flat registry of nodes instead (see generate_random_compact_hierarchy), which is orders of magnitude faster for large hierarchies; the hierarchies are not drawn from the same distribution.
+
     For the developers. Please, uncoment the docstring below to test the function's code. The docstring's test is currently commented since it is not fully deterministic but vary depending on the machine due to differences in the inbuilt random number generator."""
     #>>> nsp = generate_random_hierarchy( 10 , seed = 5 )
     #>>> nsp
     #nsp[[[0, 1, 8], [3, 6]], [[2, 4, 7], [5, 9]]]
     #"""
     #nsp[[1, 8, 9], [[[0, 4, 7], [3]], [[2, 5], [6]]]]
+    if engine == 'flat':
+        return generate_random_compact_hierarchy( num_elements , num_iterations = num_iterations , seed = seed ).expand()
+    assert engine == 'nested' , 'ERROR @ generate_random_hierarchy(...) : "engine" specifies unknown engine.'
     def generate_random_splitter_set( elements ):
         p = random.random()
         splitter_set = set( [] )
@@ -1573,9 +4106,148 @@ def generate_random_hierarchy( num_elements , num_iterations = None , seed = Non
         else:
             if _nsp.is_root():
                 continue
-            _nsp.split_here( _splitter_set )                
+            _nsp.split_here_inplace( _splitter_set )
     return nsp
 
+def _compact_from_children( children , members ):
+    """
+    Builds the _CompactArrays of a hierarchy whose node 0 is the root, children[ v ] is the list of children of node v and members[ v ] is the np.array of elements of leaf v. The nodes are laid out in pre-order, so the slices of the element permutation of the leaves come out contiguous.
+    """
+    parent = []
+    start  = []
+    end    = []
+    perm   = []
+    size   = 0
+    stack = [ ( 0 , -1 ) ]
+    while stack:
+        v , p = stack.pop()
+        parent.append( p )
+        start.append( size )
+        if v in members:
+            perm.append( members[ v ] )
+            size += len( members[ v ] )
+        else:
+            i = len( parent ) - 1
+            for c in reversed( children[ v ] ):
+                stack.append( ( c , i ) )
+        end.append( size )
+    return _compact_arrays( parent , start , end , np.concatenate( perm ).astype( np.int64 ) )
+
+def generate_random_compact_hierarchy( num_elements , num_iterations = None , seed = None ):
+    """
+    Generates a random hierarchy of the elements 0,...,num_elements-1 with a process similar to that of generate_random_hierarchy, but on a flat registry of nodes: a parent array, the lists of children and the elements of the leaves. At each iteration, a node is picked uniformly at random, in O(1), and a fraction p of its parts, with p uniform in [0,1), is drawn. If the node is a leaf, these parts are its elements, and they become a new child while the rest become another one. If the node is internal (and not the root), these parts are its children, which are moved to a new sibling of the node, by relabelling their parent; the split is skipped if either side would get less than two children, so that no community ends up with only one child. The random numbers come from np.random.RandomState( seed ).
+
+    Returns <CompactNestedPartition>
+
+    >>> cnsp = generate_random_compact_hierarchy( 10 , seed = 5 )
+    >>> cnsp
+    nsp[[[1], [8, 9]], [[4], [[0, 6], [2, 3, 5, 7]]]]
+    >>> cnsp.check_consistency( assert_not_non_informative_branches = True )
+    >>> cnsp = generate_random_compact_hierarchy( 10 ** 5 , seed = 1 )
+    >>> cnsp.size() , cnsp.check_consistency()
+    (100000, None)
+    """
+    rng = np.random.RandomState( seed )
+    num_elements = int( num_elements )
+    assert num_elements > 0
+    if num_iterations is None:
+        num_iterations = num_elements
+    parent   = [ -1 ]
+    children = [ [] ]
+    members  = { 0 : np.arange( num_elements ) } # The elements of the leaves.
+    for i in xrange( num_iterations ):
+        v = rng.randint( len( parent ) )
+        p = rng.random_sample()
+        if v in members:
+            elements = members[ v ]
+            mask = rng.random_sample( len( elements ) ) < p
+            k = int( mask.sum() )
+            if k == 0 or k == len( elements ):
+                continue
+            del members[ v ]
+            for part in ( elements[ mask ] , elements[ ~mask ] ):
+                u = len( parent )
+                parent.append( v )
+                children.append( [] )
+                children[ v ].append( u )
+                members[ u ] = part
+        elif v != 0:
+            mask = rng.random_sample( len( children[ v ] ) ) < p
+            k = int( mask.sum() )
+            if k < 2 or len( children[ v ] ) - k < 2:
+                continue
+            u = len( parent )
+            parent.append( parent[ v ] )
+            children[ parent[ v ] ].append( u )
+            children.append( [ c for c , m in zip( children[ v ] , mask ) if m ] )
+            children[ v ] = [ c for c , m in zip( children[ v ] , mask ) if not m ]
+            for c in children[ u ]:
+                parent[ c ] = u
+    return CompactNestedPartition( _compact_from_children( children , members ) )
+
+def generate_shaped_hierarchy( num_elements , depth , branching = 2 , sizes = 'balanced' , exponent = 2.5 , seed = None ):
+    """
+    Generates a random hierarchy of the elements 0,...,num_elements-1 with a controlled shape. The elements are shuffled and every community above depth "depth" is split into consecutive runs of them, its children, so that all the leaves are at depth "depth" unless they are too small to be split. The random numbers come from np.random.RandomState( seed ).
+
+    depth <int> : the depth of the leaves.
+
+    branching <int> or <tuple> : the number of children of each community, or a pair ( low , high ) from which it is drawn uniformly at random (both included). A community never gets more children than elements, and one that would get less than two children is a leaf.
+
+    sizes <str='balanced'> : one of 'balanced' or 'powerlaw'. With 'balanced', siblings differ in size by one element at most. With 'powerlaw', each child gets one element plus a multinomial share of the rest, with weights drawn from a power-law (Pareto) distribution of exponent "exponent".
+
+    exponent <float=2.5> : the exponent of the distribution of the weights, for sizes = 'powerlaw'. It must be larger than 1.
+
+    Returns <CompactNestedPartition>
+
+    >>> cnsp = generate_shaped_hierarchy( 12 , 2 , branching = 3 , seed = 0 )
+    >>> cnsp
+    nsp[[[0, 5], [3], [9]], [[1, 7], [2], [8]], [[4, 10], [6], [11]]]
+    >>> [ c.size() for c in cnsp ]
+    [4, 4, 4]
+    >>> cnsp = generate_shaped_hierarchy( 10 ** 5 , 3 , branching = ( 2 , 20 ) , sizes = 'powerlaw' , seed = 0 )
+    >>> cnsp.size() , cnsp.check_consistency( assert_not_non_informative_branches = True )
+    (100000, None)
+    >>> np.bincount( cnsp._arrays.depth )[ 0 ]
+    1
+    """
+    rng = np.random.RandomState( seed )
+    num_elements = int( num_elements )
+    assert num_elements > 0
+    if isinstance( branching , tuple ):
+        low , high = branching
+    else:
+        low = high = branching
+    assert 2 <= low <= high , 'ERROR @ generate_shaped_hierarchy(...) : "branching" must be at least 2.'
+    if sizes == 'powerlaw':
+        assert exponent > 1. , 'ERROR @ generate_shaped_hierarchy(...) : "exponent" must be larger than 1.'
+    else:
+        assert sizes == 'balanced' , 'ERROR @ generate_shaped_hierarchy(...) : "sizes" specifies unknown distribution.'
+    perm   = rng.permutation( num_elements )
+    parent = []
+    start  = []
+    end    = []
+    stack = [ ( 0 , num_elements , -1 , 0 ) ]
+    while stack:
+        a , b , p , d = stack.pop()
+        i = len( parent )
+        parent.append( p )
+        start.append( a )
+        end.append( b )
+        n = b - a
+        if d == depth:
+            continue
+        k = min( rng.randint( low , high + 1 ) , n )
+        if k < 2:
+            continue
+        if sizes == 'balanced':
+            cuts = a + ( n * np.arange( k + 1 ) ) // k
+        else:
+            weights = rng.pareto( exponent - 1. , k ) + 1.
+            cuts = a + np.concatenate( ( [ 0 ] , np.cumsum( 1 + rng.multinomial( n - k , weights / weights.sum() ) ) ) )
+        for j in xrange( k - 1 , -1 , -1 ):
+            stack.append( ( int( cuts[ j ] ) , int( cuts[ j + 1 ] ) , i , d + 1 ) )
+    return CompactNestedPartition( _compact_arrays( parent , start , end , perm.astype( np.int64 ) ) )
+
 ################################################################################       
 # Tools
 ################################################################################
@@ -1718,6 +4390,12 @@ def _nlnn( n ):
         return 0.
     return n * np.log( n )
 
+def _count_nlnn( n ):
+    # The same as _nlnn for an integer count, with math.log, which is much faster than np.log on a scalar.
+    if n == 0:
+        return 0.
+    return n * math.log( n )
+
 def _feq( x , y , eps = 1.e-10 ):
     if abs( x - y ) < eps:
         return True
@@ -1727,6 +4405,8 @@ def avrg( a ):
     return sum( a ) / float( len( a ) )
         
 _newid = itertools.count().next
+
+_newversion = itertools.count().next
            
 def _merge_dicts(*dict_args):
     """
@@ -1765,6 +4445,33 @@ def _max_NMI( H1 , H2 , H12 ):
         return 0.
     return H12 / _max
 
+# Profiling
+#----------
+
+# The hot paths instrumented while profiling is enabled (see profiling.py), with the size of the problem of each call where it is meaningful: the size of the intersection of the pair of nodes for the HMI terms, and the size of the branch for the tree mutations.
+profiling.register( NestedPartition ,
+                    [ 'check_consistency' , 'create_children' , '_add_child' , '_release_child' , '_shrink' , 'copy' , 'compact' , 'canonical_hash' ,
+                      'split_branch' , 'split_here' , 'extend_here' , 'merge_branchs' , 'merge_siblings_here' , 'split_here_inplace' , 'merge_siblings_here_inplace' ,
+                      'node_entropy' , 'node_conditional_entropy' , 'node_conditional_joint_entropy' ,
+                      'hierarchical_mutual_information' , '_recursive_hierarchical_mutual_information' , 'hierarchical_entropy' , 'normalized_hierarchical_mutual_information' ,
+                      'root_mutual_information' , 'iter_layer_mutual_information' , 'save' ] ,
+                    sizes = { '_recursive_hierarchical_mutual_information' : lambda args , kwargs : _intersection_size( args[ 0 ].elements() , args[ 1 ].elements() ) ,
+                              'split_branch'  : lambda args , kwargs : args[ 0 ].size() ,
+                              'split_here_inplace' : lambda args , kwargs : args[ 0 ].size() ,
+                              'merge_branchs' : lambda args , kwargs : args[ 1 ].size() + args[ 2 ].size() ,
+                              '_add_child'    : lambda args , kwargs : args[ 1 ].size() } )
+profiling.register( CompactNestedPartition ,
+                    [ 'check_consistency' , 'expand' , 'canonical_hash' , 'hierarchical_mutual_information' , 'normalized_hierarchical_mutual_information' ,
+                      'root_mutual_information' , 'iter_layer_mutual_information' , 'save' , 'save_binary' ] )
+profiling.register( IncrementalHMI ,
+                    [ 'hierarchical_mutual_information' , 'normalized_hierarchical_mutual_information' , '_entropy' , '_update' , '_child_counts' ] ,
+                    sizes = { '_update' : lambda args , kwargs : args[ 1 ].degree() } )
+profiling.register( sys.modules[ __name__ ] ,
+                    [ '_branch_paths' , '_contingency_hierarchical_mutual_information' , '_contingency_table_hierarchical_mutual_information' , '_pair_hierarchical_mutual_information' ,
+                      '_parallel_hierarchical_mutual_information' , '_layered_hierarchical_mutual_information' , '_xlnx' ,
+                      'load_NestedPartition' , 'load_CompactNestedPartition' , 'load_binary_NestedPartition' , 'nsp_digest' ] ,
+                    sizes = { '_pair_hierarchical_mutual_information' : lambda args , kwargs : args[ 0 ] } )
+
 ###############################################################################                
 # Test code
 ###############################################################################
@@ -1795,6 +4502,11 @@ if __name__=='__main__':
         print 'doctesting hierpart.py ...'
         doctest.testmod()
         print 'doctest success.'        
+
+    elif clo[ 'nsp2nspb' ] is not None:
+
+        # Convert a text .nsp file into a binary .nspb file.
+        print convert_nsp_to_binary( clo[ 'nsp2nspb' ] , clo[ 'output' ] , nodes_as_int = clo.letstry( 'nodes_as_int' , False ) )
     
     else:
 
@@ -1,49 +1,63 @@
+from collections import defaultdict
+import numpy as np
 import hierpart as hp
 import argutils
 
 output_fname,list_filenames=argutils.get_arguments()
 
+# the layer files are read into numpy arrays, and each layer is built in one pass:
+#   the nodes are grouped by label with a (stable) argsort, so each module comes out with its nodes in ascending order,
+#   and the parent of each module of the next layer is read off the (thislayer label, nextlayer label) pairs of its nodes
+# (instead of filtering the whole list of nodes once per label, and then testing every module of the next layer against every module of this layer)
+
 # we start from the start 
 index_thislayer=0
 # and go through all layers
 while (index_thislayer < len(list_filenames)):
     # (layer zero, a.k.a. root, is not among the input files)
     filename_nextlayer=list_filenames[index_thislayer]
-    with open(filename_nextlayer,'r') as f:
-        list_nextlayer=map(int,f.readlines())
+    array_nextlayer=np.fromfile(filename_nextlayer,dtype=np.int64,sep=' ')
 
     # if we are just getting started, we want to retrieve N (network size),
-    # define the nodes list (range(N)), root layer (list of zeros of size N)
+    # define the root layer (array of zeros of size N)
     # and create the root partition
     if (index_thislayer == 0):
-        N=len(list_nextlayer)
-        list_nodes=range(N)
-        list_thislayer=[0 for i in range(N)]
-        partition={(0,0):hp.NestedPartition(list_nodes)}
-    # if not, list_thislayer should be already defined (see below)
+        N=len(array_nextlayer)
+        array_thislayer=np.zeros(N,dtype=np.int64)
+        partition={(0,0):hp.NestedPartition(range(N))}
+    # if not, array_thislayer should be already defined (see below)
+    assert len(array_nextlayer)==N, "There's a problem with the input: "+filename_nextlayer+" does not have "+str(N)+" lines"
+
+    # the modules of the next layer: nextlayer_index[node] is the index of the module of node in nextlayer_labels,
+    # and the nodes of the k-th module are order[bounds[k]:bounds[k+1]]
+    order=np.argsort(array_nextlayer,kind='mergesort')
+    sorted_labels=array_nextlayer[order]
+    bounds=np.flatnonzero(np.concatenate(([True],sorted_labels[1:]!=sorted_labels[:-1],[True])))
+    nextlayer_labels=sorted_labels[bounds[:-1]]
+    nextlayer_index=np.empty(N,dtype=np.int64)
+    nextlayer_index[order]=np.repeat(np.arange(len(nextlayer_labels)),np.diff(bounds))
 
-    # so now we create dictionaries for 2 consecutive layers (this and next)
+    # the (label of the) parent of each module of the next layer, taken from any of its nodes... and then we make sure all of them agree
+    parent_labels=np.empty(len(nextlayer_labels),dtype=np.int64)
+    parent_labels[nextlayer_index]=array_thislayer
+    assert np.array_equal(parent_labels[nextlayer_index],array_thislayer), "There's a problem with the input: the modules of "+filename_nextlayer+" are not nested in those of the previous layer"
+
+    # so now, for each partition (label) in 'thislayer', the dictionary of its children (in 'nextlayer')
     #   whose keys are a tuple: (layerindex,partitionlabel)
     #   and whose associated values are the nodes contained in these partitions
-    # for this, we'll be needing the labels:
-    thislayer_labels=set(list_thislayer)
-    nextlayer_labels=set(list_nextlayer)
-    # and some filter functions (they return the list of nodes with a given label)
-    filter_thislayer_bylabel = lambda x: filter(lambda y: list_thislayer[y]==x,list_nodes)
-    filter_nextlayer_bylabel = lambda x: filter(lambda y: list_nextlayer[y]==x,list_nodes)
-    # now we're ready for the dictionaries for the 2 consecutive layers!
-    dict_thislayer=dict([((index_thislayer,label),filter_thislayer_bylabel(label)) for label in thislayer_labels])
-    dict_nextlayer=dict([((index_thislayer+1,label),filter_nextlayer_bylabel(label)) for label in nextlayer_labels])
-
-    # alright. we'll be doing some more filtering. this time, for each partition (label) in 'thislayer'
-    # we want to present it to it's children (in 'nextlayer'). so, we'll be filtering dictionaries 
-    for label,elements in dict_thislayer.iteritems():
-        filtered_dictionary=dict(filter(lambda x: set(elements).issuperset(x[1]),dict_nextlayer.iteritems()))
+    children=defaultdict(dict)
+    for k in xrange(len(nextlayer_labels)):
+        children[int(parent_labels[k])][(index_thislayer+1,int(nextlayer_labels[k]))]=order[bounds[k]:bounds[k+1]].tolist()
+
+    for label in sorted(children):
+        filtered_dictionary=children[label]
         if (len(filtered_dictionary) > 1): # we don't let them have just one child!
-            partition.update(partition[label].create_children(filtered_dictionary))
+            partition.update(partition[(index_thislayer,label)].create_children(filtered_dictionary))
+        else: # ... the only child is the parent itself, in the next layer
+            partition[filtered_dictionary.keys()[0]]=partition[(index_thislayer,label)]
 
     index_thislayer+=1
-    list_thislayer=list_nextlayer
+    array_thislayer=array_nextlayer
 
 partition[(0,0)].save(output_fname)
 
@@ -0,0 +1,190 @@
+###############################################################################
+# profiling.py - Opt-in instrumentation of registered functions and methods.
+###############################################################################
+#
+# The functions and methods to instrument are registered once (see register),
+# and they are replaced by instrumented wrappers only while profiling is
+# enabled, either with enable() / disable() or with the context manager
+# profile(). Hence, when profiling is off, there is no overhead at all. The
+# summary is reported to the glog handle (see glog.py).
+#
+###############################################################################
+
+import time
+import inspect
+import functools
+import contextlib
+import glog
+
+class _Stats:
+    """
+    The statistics of one instrumented function: the number of calls, the time spent in it (not counting twice the time of recursive calls), the current and the maximum depth of recursion, and the count, sum and maximum of the sizes reported by its size function, if any.
+    """
+    def __init__( self ):
+        self.calls     = 0
+        self.seconds   = 0.
+        self.depth     = 0
+        self.max_depth = 0
+        self.size_count = 0
+        self.size_sum   = 0
+        self.size_max   = 0
+
+# The registered functions: a list of ( owner , name , size ) where "owner" is a class or a module, "name" is the name of the function in it, and "size" is None or a function of ( args , kwargs ) returning the size of the problem of a call.
+_registry = []
+# The original functions, while profiling is enabled.
+_originals = []
+# The statistics by qualified name.
+_stats = {}
+
+def register( owner , names , sizes = None ):
+    """
+    Registers the functions "names" of the class or module "owner" for instrumentation. "sizes" is an optional dict, from names to functions of ( args , kwargs ), giving the size of the problem of each call, e.g. the size of an intersection.
+    """
+    if sizes is None:
+        sizes = {}
+    for name in names:
+        assert name in owner.__dict__ , 'ERROR @ profiling.register(...) : ' + str( name ) + ' not found.'
+        _registry.append( ( owner , name , sizes.get( name ) ) )
+
+def _qualified_name( owner , name ):
+    return owner.__name__ + '.' + name
+
+def _instrument( qualified_name , function , size ):
+    stats = _stats.setdefault( qualified_name , _Stats() )
+    def enter( args , kwargs ):
+        stats.calls += 1
+        stats.depth += 1
+        if stats.depth > stats.max_depth:
+            stats.max_depth = stats.depth
+        if size is not None:
+            s = size( args , kwargs )
+            stats.size_count += 1
+            stats.size_sum += s
+            if s > stats.size_max:
+                stats.size_max = s
+        return time.time()
+    def leave( start ):
+        stats.depth -= 1
+        if stats.depth == 0:
+            stats.seconds += time.time() - start
+    if inspect.isgeneratorfunction( function ):
+        # The time is the one spent producing the items, not the one spent by the caller between them.
+        @functools.wraps( function )
+        def wrapper( *args , **kwargs ):
+            start = enter( args , kwargs )
+            iterator = function( *args , **kwargs )
+            try:
+                while True:
+                    try:
+                        item = iterator.next()
+                    finally:
+                        stats.seconds += time.time() - start
+                    yield item
+                    start = time.time()
+            except StopIteration:
+                return
+            finally:
+                stats.depth -= 1
+        return wrapper
+    @functools.wraps( function )
+    def wrapper( *args , **kwargs ):
+        start = enter( args , kwargs )
+        try:
+            return function( *args , **kwargs )
+        finally:
+            leave( start )
+    return wrapper
+
+def enabled():
+    """
+    Returns <bool> : True if profiling is enabled.
+    """
+    return len( _originals ) > 0
+
+def enable():
+    """
+    Replaces every registered function by its instrumented wrapper.
+
+    >>> class Foo:
+    ...     def fib( self , n ):
+    ...         return n if n < 2 else self.fib( n - 1 ) + self.fib( n - 2 )
+    >>> register( Foo , [ 'fib' ] , sizes = { 'fib' : lambda args , kwargs : args[ 1 ] } )
+    >>> reset()
+    >>> enable()
+    >>> Foo().fib( 10 )
+    55
+    >>> disable()
+    >>> s = _stats[ 'Foo.fib' ]
+    >>> s.calls , s.max_depth , s.size_max , s.depth
+    (177, 10, 10, 0)
+    >>> Foo().fib( 10 ) , _stats[ 'Foo.fib' ].calls
+    (55, 177)
+    """
+    if enabled():
+        return
+    for owner , name , size in _registry:
+        function = owner.__dict__[ name ]
+        _originals.append( ( owner , name , function ) )
+        setattr( owner , name , _instrument( _qualified_name( owner , name ) , function , size ) )
+
+def disable():
+    """
+    Restores the original functions.
+    """
+    while _originals:
+        owner , name , function = _originals.pop()
+        setattr( owner , name , function )
+
+def reset():
+    """
+    Clears the statistics (in place, since the wrappers of an enabled profiling hold them).
+    """
+    for stats in _stats.values():
+        depth = stats.depth
+        stats.__init__()
+        stats.depth = depth
+
+def report( fhw = None ):
+    """
+    Prints the statistics, sorted by time, to "fhw" (by default, the glog handle).
+    """
+    if fhw is None:
+        fhw = glog.glog
+    print >>fhw , '# %-60s %10s %12s %12s %9s %12s %12s' % ( 'function' , 'calls' , 'seconds' , 'us/call' , 'max_depth' , 'mean_size' , 'max_size' )
+    for name , stats in sorted( _stats.items() , key = lambda item : - item[ 1 ].seconds ):
+        if stats.calls == 0:
+            continue
+        if stats.size_count > 0:
+            mean_size = '%12.1f' % ( float( stats.size_sum ) / stats.size_count )
+            max_size  = '%12d' % stats.size_max
+        else:
+            mean_size = max_size = '%12s' % '-'
+        print >>fhw , '  %-60s %10d %12.6f %12.3f %9d %s %s' % ( name , stats.calls , stats.seconds , 1e6 * stats.seconds / stats.calls , stats.max_depth , mean_size , max_size )
+
+@contextlib.contextmanager
+def profile( fhw = None , summary = True ):
+    """
+    Profiles the enclosed code: the statistics are reset, profiling is enabled and, at the end, disabled, and the summary is reported to "fhw" (by default, the glog handle) if "summary" is True.
+
+    >>> import StringIO
+    >>> import hierpart as hp
+    >>> copy = hp.NestedPartition.__dict__[ 'copy' ]
+    >>> fhw = StringIO.StringIO()
+    >>> with profile( fhw ):
+    ...     HMI = hp.old_toy_1()[ 'root' ].hierarchical_mutual_information( hp.old_toy_2()[ 'root' ] , engine = 'recursive' )
+    >>> s = _stats[ 'NestedPartition._recursive_hierarchical_mutual_information' ]
+    >>> s.calls , s.max_depth , s.size_max
+    (1, 1, 6)
+    >>> 'hierpart._xlnx' in fhw.getvalue()
+    True
+    >>> hp.NestedPartition.__dict__[ 'copy' ] is copy , enabled()
+    (True, False)
+    """
+    reset()
+    enable()
+    try:
+        yield
+    finally:
+        disable()
+        if summary:
+            report( fhw )
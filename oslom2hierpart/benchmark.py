@@ -0,0 +1,281 @@
+import os, os.path, sys
+import glob
+import json
+import time
+import shutil
+import tempfile
+import resource
+import platform
+import argparse
+import traceback
+import subprocess
+import random
+import numpy as np
+import hierpart as hp
+from utils import getNneighbors
+
+# benchmark suite of the hierpart measures and of the oslom/modbp converters: wall time and peak memory of each case, for each size, are written to a JSON results file,
+# which can be compared against a stored baseline (another results file) to flag the regressions
+# every case runs in a forked process, so that the peak memory (max RSS) it reports is its own:
+#   for the cases that run in python, peak_rss_kb is the peak of that process (including the setup: building the input hierarchies) and setup_rss_kb the peak before the timed part,
+#   for the converters, which run as scripts, peak_rss_kb is the peak of the script process
+# the inputs are synthetic hierarchies (hp.generate_shaped_hierarchy), except for oslom2modbp, which runs on the networks of the tests folder that have _oslo_files (their size is their number of nodes)
+
+DEFAULT_SIZES=[100,1000,10000,100000,1000000]
+SCRIPTFOLDER=os.path.dirname(os.path.abspath(__file__))
+
+def makehierarchies(N):
+    # the two (different) input hierarchies of N elements, as NestedPartitions
+    shape=dict(branching=(2,10),sizes='powerlaw')
+    return hp.generate_shaped_hierarchy(N,3,seed=0,**shape).expand(),hp.generate_shaped_hierarchy(N,3,seed=1,**shape).expand()
+
+def runscript(args):
+    # runs a python script of this folder (quietly) and returns the peak memory (KB) of its process
+    devnull=open(os.devnull,'w')
+    p=subprocess.Popen([sys.executable]+args,cwd=SCRIPTFOLDER,stdout=devnull)
+    pid,status,rusage=os.wait4(p.pid,0)
+    devnull.close()
+    assert status==0, "script "+args[0]+" failed"
+    return rusage.ru_maxrss
+
+# each case is set up by a function of (N,workdir), which returns the function to be timed
+#   (if the latter returns a number, it is the peak memory of the script it ran)
+
+def case_HMI(N,workdir):
+    nsp1,nsp2=makehierarchies(N)
+    return lambda: nsp1.hierarchical_mutual_information(nsp2,run_checks=False)
+
+def case_NHMI(N,workdir):
+    nsp1,nsp2=makehierarchies(N)
+    return lambda: nsp1.normalized_hierarchical_mutual_information(nsp2,run_checks=False)
+
+def case_layer_MI(N,workdir):
+    nsp1,nsp2=makehierarchies(N)
+    return lambda: list(nsp1.iter_layer_mutual_information(nsp2,run_checks=False))
+
+def case_save(N,workdir):
+    nsp1,nsp2=makehierarchies(N)
+    return lambda: nsp1.save(os.path.join(workdir,'h.nsp'))
+
+def case_load(N,workdir):
+    nsp1,nsp2=makehierarchies(N)
+    filename=os.path.join(workdir,'h.nsp')
+    nsp1.save(filename)
+    del nsp1,nsp2
+    return lambda: hp.load_NestedPartition(filename,nodes_as_int=True,run_checks=False)
+
+def case_copy(N,workdir):
+    nsp1,nsp2=makehierarchies(N)
+    return lambda: nsp1.copy()
+
+def case_split_merge(N,workdir):
+    # split_branch of the whole hierarchy by a random half of the elements, and merge_branchs of the two halves back
+    nsp1,nsp2=makehierarchies(N)
+    rng=random.Random(0)
+    splitter_set=set(e for e in nsp1.elements() if rng.random()<0.5)
+    def run():
+        half1,half2=nsp1.split_branch(splitter_set)
+        nsp1.merge_branchs(half1,half2)
+    return run
+
+def makemoves(nsp):
+    # the moves of a local search on nsp: 1000 in-place splits of random nodes by a random half of their elements, or in-place merges of random siblings, as (method,args)
+    rng=random.Random(0)
+    nodes=[n for n in nsp.DFS() if not n.is_root()]
+    parents=[n for n in nsp.DFS() if n.degree()>=2]
+    moves=[]
+    for i in xrange(1000):
+        if rng.random()<0.5:
+            n=rng.choice(nodes)
+            moves.append((n.split_here_inplace,(set(e for e in n.elements() if rng.random()<0.5),)))
+        else:
+            n=rng.choice(parents)
+            moves.append((n.merge_siblings_here_inplace,tuple(rng.sample(sorted(n,key=hp._nsp_key),2))))
+    return moves
+
+def case_inplace_moves(N,workdir):
+    # the moves of makemoves, each of them undone
+    nsp1,nsp2=makehierarchies(N)
+    moves=makemoves(nsp1)
+    def run():
+        for move,args in moves:
+            move(*args).undo()
+    return run
+
+def case_incremental_NHMI(N,workdir):
+    # the NHMI against the second input hierarchy after each move of makemoves, from the terms kept by hp.IncrementalHMI (its first evaluation is part of the setup), each move being undone
+    nsp1,nsp2=makehierarchies(N)
+    evaluator=hp.IncrementalHMI(nsp1,nsp2,run_checks=False)
+    evaluator.normalized_hierarchical_mutual_information()
+    moves=makemoves(nsp1)
+    def run():
+        for move,args in moves:
+            m=move(*args)
+            evaluator.normalized_hierarchical_mutual_information()
+            m.undo()
+    return run
+
+def case_modbp2hierpart(N,workdir):
+    # the layer files of the first input hierarchy: the label of each element (node) in layer d is the index of its ancestor at depth d (or of its leaf, if that is not as deep)
+    a=hp.generate_shaped_hierarchy(N,3,branching=(2,10),sizes='powerlaw',seed=0)._arrays
+    leaf=np.empty(N,dtype=np.int64)
+    leaves=np.flatnonzero(np.diff(a.child_ptr)==0)
+    for i in leaves:
+        leaf[a.perm[a.start[i]:a.end[i]]]=i
+    layerfiles=[]
+    for d in xrange(1,int(a.depth.max())+1):
+        node=leaf.copy()
+        while True:
+            up=a.depth[node]>d
+            if not up.any():
+                break
+            node[up]=a.parent[node[up]]
+        layerfiles.append(os.path.join(workdir,'layer.'+str(d)))
+        np.savetxt(layerfiles[-1],node,fmt='%d')
+    return lambda: runscript(['modbp2hierpart.py','-o',os.path.join(workdir,'h.nsp')]+layerfiles)
+
+def case_oslom2modbp(network,workdir):
+    # 'network' is an edges file whose _oslo_files are copied to workdir, since oslom2modbp.py writes its output next to them
+    edgesfilename=os.path.join(workdir,os.path.basename(network))
+    shutil.copy(network,edgesfilename)
+    shutil.copytree(network+'_oslo_files',edgesfilename+'_oslo_files')
+    return lambda: runscript(['oslom2modbp.py',edgesfilename])
+
+CASES=[('HMI',case_HMI),('NHMI',case_NHMI),('layer_MI',case_layer_MI),('save',case_save),('load',case_load),('copy',case_copy),
+       ('split_merge',case_split_merge),('inplace_moves',case_inplace_moves),('incremental_NHMI',case_incremental_NHMI),('modbp2hierpart',case_modbp2hierpart),('oslom2modbp',case_oslom2modbp)]
+
+def measure(setup,N,repeat):
+    # sets up and times a case (the best of 'repeat' runs) in a forked process; returns its results as a dict
+    readfd,writefd=os.pipe()
+    pid=os.fork()
+    if pid==0:
+        os.close(readfd)
+        row={}
+        workdir=tempfile.mkdtemp(prefix='hierpart_benchmark_')
+        try:
+            run=setup(N,workdir)
+            row['setup_rss_kb']=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            seconds=[]
+            script_rss_kb=0
+            for r in xrange(repeat):
+                start=time.time()
+                out=run()
+                seconds.append(time.time()-start)
+                if isinstance(out,(int,long)):
+                    script_rss_kb=max(script_rss_kb,out)
+            row['seconds']=min(seconds)
+            if script_rss_kb>0:
+                row['setup_rss_kb']=0
+                row['peak_rss_kb']=script_rss_kb
+            else:
+                row['peak_rss_kb']=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            row['status']='ok'
+        except Exception:
+            row={'status':'error: '+traceback.format_exc().strip().split('\n')[-1]}
+        shutil.rmtree(workdir,ignore_errors=True)
+        f=os.fdopen(writefd,'w')
+        f.write(json.dumps(row))
+        f.close()
+        os._exit(0)
+    os.close(writefd)
+    f=os.fdopen(readfd)
+    out=f.read()
+    f.close()
+    os.waitpid(pid,0)
+    if out=='':
+        return {'status':'error: the benchmark process died'}
+    return json.loads(out)
+
+def runbenchmarks(cases,sizes,repeat,networks,verbose=True):
+    results=[]
+    for name,setup in CASES:
+        if name not in cases:
+            continue
+        if name=='oslom2modbp':
+            instances=[(network,getNneighbors(network)[0]) for network in networks]
+        else:
+            instances=[(N,N) for N in sizes]
+        for instance,N in instances:
+            row=measure(setup,instance,repeat)
+            row['case']=name
+            row['size']=N
+            if name=='oslom2modbp':
+                row['network']=os.path.basename(instance)
+            results.append(row)
+            if verbose:
+                print name,N,row['status'],row.get('seconds',''),row.get('peak_rss_kb','')
+                sys.stdout.flush()
+    return results
+
+def resultkey(row):
+    return (row['case'],row['size'],row.get('network'))
+
+def compare(results,baseline,time_tolerance=0.25,memory_tolerance=0.25,min_seconds=0.05):
+    # compares the results against the baseline results; returns a list of (result, baseline result, list of regressions) for the cases found in both
+    # a regression is a time more than time_tolerance (a fraction) above the baseline (and by more than min_seconds, to ignore noise), or a peak memory more than memory_tolerance above
+    base=dict((resultkey(row),row) for row in baseline if row['status']=='ok')
+    comparison=[]
+    for row in results:
+        b=base.get(resultkey(row))
+        if b is None or row['status']!='ok':
+            continue
+        regressions=[]
+        if row['seconds']>b['seconds']*(1.+time_tolerance) and row['seconds']-b['seconds']>min_seconds:
+            regressions.append('time')
+        if row['peak_rss_kb']>b['peak_rss_kb']*(1.+memory_tolerance):
+            regressions.append('memory')
+        comparison.append((row,b,regressions))
+    return comparison
+
+def printcomparison(comparison):
+    print "%-15s %9s %12s %12s %8s %12s %12s %8s  %s" % ('case','size','seconds','base','ratio','peak_kb','base','ratio','')
+    for row,b,regressions in comparison:
+        print "%-15s %9d %12.4f %12.4f %8.2f %12d %12d %8.2f  %s" % (row['case'],row['size'],row['seconds'],b['seconds'],row['seconds']/max(b['seconds'],1e-9),
+                                                                    row['peak_rss_kb'],b['peak_rss_kb'],float(row['peak_rss_kb'])/max(b['peak_rss_kb'],1),
+                                                                    'REGRESSION ('+','.join(regressions)+')' if regressions else '')
+
+def loadresults(filename):
+    f=open(filename)
+    results=json.load(f)['results']
+    f.close()
+    return results
+
+def saveresults(results,filename):
+    meta={'date':time.strftime('%Y-%m-%d %H:%M:%S'),'host':platform.node(),'python':platform.python_version(),'numpy':np.__version__}
+    f=open(filename,'w')
+    json.dump({'meta':meta,'results':results},f,indent=1,sort_keys=True)
+    f.close()
+
+if __name__=='__main__':
+
+    parser=argparse.ArgumentParser()
+    parser.add_argument('-o','--output', type=str, default='benchmark_results.json',help="JSON results file (default: benchmark_results.json)")
+    parser.add_argument('-b','--baseline', type=str, default=None,help="JSON results file of a previous run to compare against")
+    parser.add_argument('--update_baseline', action='store_true',help="also write the results to the baseline file (instead of comparing against it)")
+    parser.add_argument('-s','--sizes', type=str, default=','.join(map(str,DEFAULT_SIZES)),help="comma separated numbers of elements (default: "+','.join(map(str,DEFAULT_SIZES))+")")
+    parser.add_argument('-c','--cases', type=str, default=','.join(name for name,setup in CASES),help="comma separated cases (default: all of them, "+','.join(name for name,setup in CASES)+")")
+    parser.add_argument('-r','--repeat', type=int, default=3,help="runs of each case, the best one is kept (default: 3)")
+    parser.add_argument('-n','--networks', type=str, default=os.path.join(SCRIPTFOLDER,'tests'),help="folder of the networks (with _oslo_files) for oslom2modbp (default: the tests folder)")
+    parser.add_argument('--time_tolerance', type=float, default=0.25,help="relative increase of the time flagged as a regression (default: 0.25)")
+    parser.add_argument('--memory_tolerance', type=float, default=0.25,help="relative increase of the peak memory flagged as a regression (default: 0.25)")
+    args=parser.parse_args()
+
+    cases=args.cases.split(',')
+    for name in cases:
+        assert name in dict(CASES), "unknown case "+name
+    sizes=[int(N) for N in args.sizes.split(',')]
+    networks=sorted(folder[:-len('_oslo_files')] for folder in glob.glob(os.path.join(args.networks,'*_oslo_files')))
+
+    results=runbenchmarks(cases,sizes,args.repeat,networks)
+    saveresults(results,args.output)
+    print args.output
+
+    if args.baseline is not None:
+        if args.update_baseline:
+            saveresults(results,args.baseline)
+            print args.baseline
+        else:
+            comparison=compare(results,loadresults(args.baseline),args.time_tolerance,args.memory_tolerance)
+            printcomparison(comparison)
+            if any(regressions for row,b,regressions in comparison):
+                sys.exit(1)
@@ -0,0 +1,31 @@
+import argparse
+import numpy as np
+import hierpart as hp
+
+# all-against-all comparison of many hierarchies (.nsp or .nspb files): writes the HMI and NHMI matrices
+#   (each hierarchy is loaded and checked once, its hierarchical entropy is computed once, and the pairs are spread across a pool of processes; see hp.hierarchical_mutual_information_matrix)
+
+parser=argparse.ArgumentParser()
+parser.add_argument('-o','--output', type=str, required=True,help="output basename: the matrices are saved to <output>_HMI.<format> and <output>_NHMI.<format>")
+parser.add_argument('-f','--format', type=str, default='npy', choices=['npy','csv'],help="output format (default: npy)")
+parser.add_argument('-n','--calc_NMI', type=str, default='arithmetic', choices=['arithmetic','geometric','max'],help="normalization of the NHMI (default: arithmetic)")
+parser.add_argument('-p','--processes', type=int, default=None,help="number of worker processes (default: one per cpu)")
+parser.add_argument('--nodes_as_int', action='store_true',help="read the elements of the text .nsp files as integers")
+parser.add_argument('--no_checks', action='store_true',help="skip the consistency checks of the hierarchies")
+parser.add_argument('--cache', type=str, default=None,help="folder of the on-disk cache of measures (see hierpart.enable_cache)")
+parser.add_argument('input',nargs='+', help="list of hierarchy files (.nsp or .nspb)")
+args=parser.parse_args()
+
+if args.cache is not None:
+    hp.enable_cache(args.cache)
+
+HMI,NHMI=hp.hierarchical_mutual_information_matrix(args.input,calc_NMI=args.calc_NMI,nodes_as_int=args.nodes_as_int,processes=args.processes,run_checks=not args.no_checks)
+
+for name,matrix in [('HMI',HMI),('NHMI',NHMI)]:
+    filename=args.output+"_"+name+"."+args.format
+    if args.format=='npy':
+        np.save(filename,matrix)
+    else:
+        # the header line (a comment, skipped by np.loadtxt) lists the input files, in the order of the rows/columns
+        np.savetxt(filename,matrix,delimiter=',',header=','.join(args.input))
+    print filename
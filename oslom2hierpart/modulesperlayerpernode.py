@@ -24,44 +24,17 @@ N,neighbors=getNneighbors(edgesfilename)
 layerbasefilename=edgesfilename+"_oslom2modbp_files/l"
 #arreglar esto despues!
 
-tpfolder=edgesfilename+"_oslo_files"
-assert os.path.exists(tpfolder)
-number_of_tp_files=len(glob.glob(tpfolder+"/tp*"))
-number_of_layers=number_of_tp_files
-
-# this is the list of layers, as generated by OSLOM2/oslo_undir
-tpfiles=[tpfolder+'/tp']+[tpfolder+'/tp'+str(n) for n in range(1,number_of_tp_files)]
+# all tp files are parsed once, here (see TPModuleIndex in utils.py)
+tpindex=gettpmoduleindex(edgesfilename)
+number_of_layers=tpindex.number_of_layers
 
 # create folder where outputs will be saved (in modbp format, to make use of the code we have already written, that takes it to nsp format)
 layerfolder=edgesfilename+"_oslom2modbp_files"
 if not os.path.exists(layerfolder):
     os.makedirs(layerfolder)
 
-modulesperlayerpernode=[[] for i in range(N)] # a list for each node
-# now we go layer by layer
-tpfiles.reverse() # hago esto asi queda en el orden adecuado, empezando por el layer 1 (convencion modbp), que tendria index zero
-for tpindex in range(number_of_tp_files):
-    tpfilename=tpfiles[tpindex]
-
-    # open file with module information
-    f=open(tpfilename,"r")
-    lines=f.readlines()
-    # these files contan an even number of lines: for each pair, the first line indicates module number (which is ordered, from 0) and the second one shows the list of nodes... so we need to take the second line and jump every two lines
-    filteredlines=lines[1::2]
-    listnodespermodule=[]
-    for l in filteredlines:
-        q=l.split(" ")[:-1]
-        s=map(int,q) # s is a list of node labels (integers)
-        listnodespermodule.append(s) 
-
-    listmodulespernode=[[] for i_node in range(N)]
-    for i_module in range(len(listnodespermodule)): 
-        for i_node in listnodespermodule[i_module]:
-            listmodulespernode[i_node].append(i_module)
+# for each node, tpindex.modulesperlayer(node) is the list (one item per layer) of the modules containing it (layer index zero is layer 1, modbp convention): we call it modulesperlayerpernode[node] below, but it is taken from the index one node at a time (instead of keeping the nested lists of all nodes)
 
-    for i_node in range(N):
-        modulesperlayerpernode[i_node].append(listmodulespernode[i_node])
-       
 # so now, by the end, we must have a full 'modulesperlayerpernode' list (of lists of lists)
 
 # what we're gonna do now, to decide on non-overlapping partitions for each layer, is to get a little bit dirty, a little bit into bruteforce
@@ -74,26 +47,18 @@ for tpindex in range(number_of_tp_files):
 
 finalpath=[]
 
-def filter_allowed_paths(path):
-    for layer_index in range(number_of_layers-1):
-        if not set(getnodesperlayermodule(edgesfilename,layer_index,path[layer_index])).issuperset(getnodesperlayermodule(edgesfilename,layer_index+1,path[layer_index+1])):
-            return False
-    if len(set(finalpath))>0:
-        #i'm adding one more thing to check: if the final module already exists in finalpath (as a final module), then it should follow the same path
-        for previous_path in set(finalpath):
-            for x in range(number_of_layers):
-                if previous_path[x] == path[x]: # if last element is same
-                    if previous_path[:x] != path[:x] :# if any of the other elements is different
-                        return False
-    return True
+# the filtering is done by a PathResolver (see utils.py), that builds only the allowed paths, with a depth-first walk over the modules of the node, instead of filtering the whole cartesian product
+#   (the old filter_allowed_paths checked, for each candidate path, consecutive-layer containment and, against every previous path in finalpath, that a shared module comes with the same path above it)
+pathresolver=PathResolver(tpindex)
 
 for i in range(N):
-    paths=[p for p in itertools.product(*modulesperlayerpernode[i])]
-    if len(paths)==1:
-        assert len(paths[0])==number_of_layers # just to make sure that foreach node, every layer has an associated module
-        finalpath.append(paths[0])
+    modulesperlayer=tpindex.modulesperlayer(i) # (this is modulesperlayerpernode[i])
+    if all(len(modules)==1 for modules in modulesperlayer): # (a single path, the cartesian product has just one element)
+        assert len(modulesperlayer)==number_of_layers # just to make sure that foreach node, every layer has an associated module
+        finalpath.append(tuple(modules[0] for modules in modulesperlayer))
     else:
-        finalpath.append(random.choice(filter(filter_allowed_paths, paths)))
+        finalpath.append(random.choice(pathresolver.allowedpaths(modulesperlayer)))
+    pathresolver.commit(finalpath[-1])
     print i,"::",finalpath[-1]
 
 for l in range(number_of_layers):
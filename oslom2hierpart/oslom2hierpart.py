@@ -0,0 +1,131 @@
+import os, os.path
+import glob
+import random
+import argparse
+from collections import defaultdict
+import numpy as np
+import hierpart as hp
+from utils import * # some utils, contained in this folder
+
+# single-process version of oslom2hierpart.sh (after oslom_undir has run): it goes from the tp files in <edges file>_oslo_files straight to the nested partition (and the .nsp file)
+# without writing the modbp layer files (oslom2modbp.py) and parsing them again (modbp2hierpart.py)... unless they are asked for, for debugging
+
+def layers2nestedpartition(layers,verbose=False):
+    # the NestedPartition whose layers (layer zero, a.k.a. root, is not among them) are given by 'layers', a list of arrays (one per layer, from the top) with the module label of each node
+    # each layer is built in one pass:
+    #   the nodes are grouped by label with a (stable) argsort, so each module comes out with its nodes in ascending order,
+    #   and the parent of each module of the next layer is read off the (thislayer label, nextlayer label) pairs of its nodes
+    # (this is what modbp2hierpart.py does with the layer files)
+
+    # we start from the start
+    index_thislayer=0
+    # and go through all layers
+    while (index_thislayer < len(layers)):
+        array_nextlayer=np.asarray(layers[index_thislayer],dtype=np.int64)
+
+        # if we are just getting started, we want to retrieve N (network size),
+        # define the root layer (array of zeros of size N)
+        # and create the root partition
+        if (index_thislayer == 0):
+            N=len(array_nextlayer)
+            if verbose: print "N=",N
+            array_thislayer=np.zeros(N,dtype=np.int64)
+            partition={(0,0):hp.NestedPartition(range(N))}
+            members={(0,0):range(N)} # the nodes of each module of this layer
+        # if not, array_thislayer should be already defined (see below)
+        assert len(array_nextlayer)==N, "There's a problem with the input: layer "+str(index_thislayer+1)+" does not have "+str(N)+" nodes"
+
+        # the modules of the next layer: nextlayer_index[node] is the index of the module of node in nextlayer_labels,
+        # and the nodes of the k-th module are order[bounds[k]:bounds[k+1]]
+        order=np.argsort(array_nextlayer,kind='mergesort')
+        sorted_labels=array_nextlayer[order]
+        bounds=np.flatnonzero(np.concatenate(([True],sorted_labels[1:]!=sorted_labels[:-1],[True])))
+        nextlayer_labels=sorted_labels[bounds[:-1]]
+        nextlayer_index=np.empty(N,dtype=np.int64)
+        nextlayer_index[order]=np.repeat(np.arange(len(nextlayer_labels)),np.diff(bounds))
+
+        # the (label of the) parent of each module of the next layer, taken from any of its nodes... and then we make sure all of them agree
+        parent_labels=np.empty(len(nextlayer_labels),dtype=np.int64)
+        parent_labels[nextlayer_index]=array_thislayer
+        assert np.array_equal(parent_labels[nextlayer_index],array_thislayer), "There's a problem with the input: the modules of layer "+str(index_thislayer+1)+" are not nested in those of the previous layer"
+
+        # so now, for each partition (label) in 'thislayer', the dictionary of its children (in 'nextlayer')
+        #   whose keys are a tuple: (layerindex,partitionlabel)
+        #   and whose associated values are the nodes contained in these partitions
+        children=defaultdict(dict)
+        nextmembers={}
+        for k in xrange(len(nextlayer_labels)):
+            key=(index_thislayer+1,int(nextlayer_labels[k]))
+            nextmembers[key]=order[bounds[k]:bounds[k+1]].tolist()
+            children[int(parent_labels[k])][key]=nextmembers[key]
+
+        for label in sorted(children):
+            filtered_dictionary=children[label]
+            #if (len(filtered_dictionary) > 1): # we don't let them have just one child!
+            if verbose: print (index_thislayer,label),members[(index_thislayer,label)]
+            partition.update(partition[(index_thislayer,label)].create_children(filtered_dictionary))
+
+        index_thislayer+=1
+        array_thislayer=array_nextlayer
+        members=nextmembers
+
+    return partition[(0,0)]
+
+def oslom2nestedpartition(edgesfilename,layerbasefilename=None):
+    # the NestedPartition of the (already generated) <edgesfilename>_oslo_files: the paths are chosen as in oslom2modbp.py (see choosepaths in utils.py), and the layers are taken straight from them
+    # if layerbasefilename is given, the modbp layer files are also written (layerbasefilename.1, layerbasefilename.2, ..., as oslom2modbp.py does)
+    # if the cache is enabled (see hp.enable_cache), the result is stored under the digest of the edges and tp files and of the state of random (the path choices are random), together with the state of random after the conversion, so that a hit leaves random exactly as the conversion would
+    #   (not when the layer files are asked for, since they come from the paths)
+    cache=hp.get_cache()
+    if cache is not None and layerbasefilename is None:
+        tpfiles=sorted(glob.glob(edgesfilename+"_oslo_files/tp*"))
+        key=hp.cache_key('oslom2nestedpartition',hp.file_digest([edgesfilename]+tpfiles),random.getstate())
+        cnsp=cache.get_nsp(key)
+        state=cache.get(key)
+        if cnsp is not None and state is not None:
+            random.setstate(state)
+            return cnsp.expand()
+
+    N,neighbors=getNneighbors(edgesfilename)
+    finalpath=choosepaths(edgesfilename,N,neighbors)
+    if layerbasefilename is not None:
+        layerfolder=os.path.dirname(layerbasefilename)
+        if layerfolder!='' and not os.path.exists(layerfolder):
+            os.makedirs(layerfolder)
+        writelayerfiles(finalpath,layerbasefilename)
+    layers=list(np.array(finalpath,dtype=np.int64).T)
+    nsp=layers2nestedpartition(layers)
+    if cache is not None and layerbasefilename is None:
+        cache.put_nsp(key,nsp)
+        cache.put(key,random.getstate())
+    return nsp
+
+if __name__=='__main__':
+
+    parser=argparse.ArgumentParser()
+    parser.add_argument('-o','--output', type=str, default=None,help="nested partition output file (.nsp); default: the edges file with .edges replaced by _oslom.nsp")
+    parser.add_argument('--modbp_files', action='store_true',help="also write the intermediate modbp layer files to <edges file>_oslom2modbp_files/layer.N (for debugging)")
+    parser.add_argument('--cache', type=str, default=None,help="folder of the on-disk cache of converted hierarchies (see hierpart.enable_cache)")
+    parser.add_argument('input', help="edges file, or its _oslo_files folder (already generated by oslom_undir)")
+    args=parser.parse_args()
+
+    if args.cache is not None:
+        hp.enable_cache(args.cache)
+
+    edgesfilename=args.input.rstrip('/')
+    if edgesfilename.endswith('_oslo_files'):
+        edgesfilename=edgesfilename[:-len('_oslo_files')]
+
+    output_fname=args.output
+    if output_fname is None:
+        if edgesfilename.endswith('.edges'):
+            output_fname=edgesfilename[:-len('.edges')]+'_oslom.nsp'
+        else:
+            output_fname=edgesfilename+'_oslom.nsp'
+
+    layerbasefilename=None
+    if args.modbp_files:
+        layerbasefilename=edgesfilename+"_oslom2modbp_files/layer"
+
+    oslom2nestedpartition(edgesfilename,layerbasefilename).save(output_fname)
+    print output_fname
@@ -27,8 +27,8 @@ if [[ $1 != "" ]]; then
 
 	cd $(dirname $0)
 	$oslom_undir_executable -f $edgesfile -uw
-	python oslom2modbp.py $edgesfile
-	python modbp2hierpart.py -o $nspfile $edgesfile"_oslom2modbp_files/layer."*
+	python oslom2hierpart.py -o $nspfile $edgesfile
+	# (add --modbp_files to also get the intermediate layer files, as the two-step version below does)
 	#python oslom2modbp.py $edgesfile
 	#python modbp2hierpart.py -o $nspfile $edgesfile"_oslom2modbp_files/layer."*
 	#python oslom2modbp.py $edgesfile &&  python modbp2hierpart.py -o $nspfile $edgesfile"_oslom2modbp_files/layer."*
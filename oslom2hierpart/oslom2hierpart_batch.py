@@ -0,0 +1,120 @@
+import os, os.path
+import glob
+import time
+import random
+import argparse
+import traceback
+import multiprocessing
+import numpy as np
+import hierpart as hp
+from oslom2hierpart import oslom2nestedpartition
+
+# batch version of oslom2hierpart.py: finds every <edges file>_oslo_files folder under a root folder and converts them all (oslom -> modbp -> nsp), in a pool of worker processes
+# an .nsp that is newer than all the tp files it comes from is not converted again (unless --force)
+# a manifest, with one line per network (N, number of layers, modules per layer, wall time, status), is written at the end
+
+MANIFEST_COLUMNS=['edges','nsp','status','N','layers','modules_per_layer','seconds']
+
+def findoslofolders(rootfolder):
+    # the _oslo_files folders under rootfolder (sorted, so that the order of the manifest doesn't depend on the filesystem)
+    oslofolders=[]
+    for dirpath,dirnames,filenames in os.walk(rootfolder):
+        for dirname in dirnames:
+            if dirname.endswith('_oslo_files'):
+                oslofolders.append(os.path.join(dirpath,dirname))
+        dirnames[:]=[d for d in dirnames if not d.endswith('_oslo_files')] # (no need to look inside them)
+    return sorted(oslofolders)
+
+def nspfilename(edgesfilename,destfolder=None):
+    # same naming as oslom2hierpart.sh: <edges file without .edges>_oslom.nsp, next to the edges file unless destfolder is given
+    basename=os.path.basename(edgesfilename)
+    if basename.endswith('.edges'):
+        basename=basename[:-len('.edges')]
+    if destfolder is None:
+        destfolder=os.path.dirname(edgesfilename)
+    return os.path.join(destfolder,basename+'_oslom.nsp')
+
+def uptodate(oslofolder,nspfile):
+    # True if nspfile exists and is newer than every tp file of oslofolder
+    if not os.path.exists(nspfile):
+        return False
+    tpfiles=glob.glob(os.path.join(oslofolder,'tp*'))
+    if len(tpfiles)==0:
+        return False
+    return os.path.getmtime(nspfile)>max(os.path.getmtime(f) for f in tpfiles)
+
+def nspsummary(nsp):
+    # N, number of layers and number of modules per layer (layer 1 is the first below the root) of a NestedPartition or CompactNestedPartition
+    if isinstance(nsp,hp.NestedPartition):
+        nsp=nsp.compact()
+    depth=np.asarray(nsp._arrays.depth)
+    modules_per_layer=np.bincount(depth)[1:].tolist()
+    return nsp.size(),len(modules_per_layer),modules_per_layer
+
+def convert(task):
+    # converts one network; returns its line of the manifest (as a dict)
+    oslofolder,nspfile,force,seed,cachefolder=task
+    if cachefolder is not None:
+        hp.enable_cache(cachefolder)
+    edgesfilename=oslofolder[:-len('_oslo_files')]
+    row={'edges':edgesfilename,'nsp':nspfile,'status':'','N':'','layers':'','modules_per_layer':'','seconds':''}
+    start=time.time()
+    try:
+        if not force and uptodate(oslofolder,nspfile):
+            row['status']='skipped'
+            nsp=hp.load_CompactNestedPartition(nspfile,nodes_as_int=True,run_checks=False)
+        else:
+            if seed is not None:
+                random.seed(seed) # (the same seed for every network, so that the result of each one does not depend on the scheduling of the pool)
+            nsp=oslom2nestedpartition(edgesfilename)
+            nsp.save(nspfile)
+            row['status']='converted'
+        row['N'],row['layers'],modules_per_layer=nspsummary(nsp)
+        row['modules_per_layer']=','.join(map(str,modules_per_layer))
+    except Exception:
+        row['status']='error: '+traceback.format_exc().strip().split('\n')[-1]
+    row['seconds']='%.3f' % (time.time()-start)
+    return row
+
+def writemanifest(rows,manifestfilename):
+    f=open(manifestfilename,'w')
+    f.write('#'+'\t'.join(MANIFEST_COLUMNS)+'\n')
+    for row in rows:
+        f.write('\t'.join(str(row[c]) for c in MANIFEST_COLUMNS)+'\n')
+    f.close()
+
+if __name__=='__main__':
+
+    parser=argparse.ArgumentParser()
+    parser.add_argument('root', help="folder where to look (recursively) for <edges file>_oslo_files folders")
+    parser.add_argument('-d','--destfolder', type=str, default=None,help="folder for the .nsp files (default: next to each edges file)")
+    parser.add_argument('-w','--workers', type=int, default=None,help="number of worker processes (default: one per cpu)")
+    parser.add_argument('-m','--manifest', type=str, default=None,help="manifest file (default: <root>/oslom2hierpart_manifest.tsv)")
+    parser.add_argument('-s','--seed', type=int, default=None,help="seed of the random choices among overlapping modules, set before each network")
+    parser.add_argument('-c','--cache', type=str, default=None,help="folder of the on-disk cache of converted hierarchies (see hierpart.enable_cache)")
+    parser.add_argument('-f','--force', action='store_true',help="convert even the networks whose .nsp is newer than their tp files")
+    args=parser.parse_args()
+
+    if args.destfolder is not None and not os.path.exists(args.destfolder):
+        os.makedirs(args.destfolder)
+    manifestfilename=args.manifest
+    if manifestfilename is None:
+        manifestfilename=os.path.join(args.root,'oslom2hierpart_manifest.tsv')
+
+    tasks=[(oslofolder,nspfilename(oslofolder[:-len('_oslo_files')],args.destfolder),args.force,args.seed,args.cache) for oslofolder in findoslofolders(args.root)]
+    print len(tasks),"_oslo_files folders found under",args.root
+
+    if args.workers==1:
+        results=map(convert,tasks)
+    else:
+        pool=multiprocessing.Pool(args.workers)
+        try:
+            results=pool.map(convert,tasks,chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+
+    for row in results:
+        print row['status'],row['nsp'],row['seconds']
+    writemanifest(results,manifestfilename)
+    print manifestfilename
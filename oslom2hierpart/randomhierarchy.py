@@ -0,0 +1,31 @@
+import argparse
+import hierpart as hp
+
+# synthetic hierarchies for benchmarking: writes a random hierarchy of N elements (0,...,N-1) to an .nsp or .nspb file (chosen by the extension of the output)
+#   without --depth, it comes from the split/extend process of hp.generate_random_compact_hierarchy
+#   with --depth, it has a controlled shape (see hp.generate_shaped_hierarchy)
+
+parser=argparse.ArgumentParser()
+parser.add_argument('-o','--output', type=str, required=True,help="output file (.nsp or .nspb)")
+parser.add_argument('-N','--num_elements', type=int, required=True,help="number of elements")
+parser.add_argument('-s','--seed', type=int, default=None,help="seed of the numpy random number generator")
+parser.add_argument('-i','--iterations', type=int, default=None,help="number of split/extend iterations, without --depth (default: N)")
+parser.add_argument('-d','--depth', type=int, default=None,help="depth of the leaves of a shaped hierarchy")
+parser.add_argument('-b','--branching', type=str, default='2',help="number of children per community of a shaped hierarchy, either a number or low:high (default: 2)")
+parser.add_argument('--sizes', type=str, default='balanced', choices=['balanced','powerlaw'],help="sizes of the sibling communities of a shaped hierarchy (default: balanced)")
+parser.add_argument('--exponent', type=float, default=2.5,help="exponent of the power-law weights, with --sizes powerlaw (default: 2.5)")
+args=parser.parse_args()
+
+if args.depth is None:
+    cnsp=hp.generate_random_compact_hierarchy(args.num_elements,num_iterations=args.iterations,seed=args.seed)
+else:
+    branching=tuple(int(b) for b in args.branching.split(':'))
+    if len(branching)==1:
+        branching=branching[0]
+    cnsp=hp.generate_shaped_hierarchy(args.num_elements,args.depth,branching=branching,sizes=args.sizes,exponent=args.exponent,seed=args.seed)
+
+if args.output.endswith('.nspb'):
+    cnsp.save_binary(args.output)
+else:
+    cnsp.save(args.output)
+print args.output
@@ -22,29 +22,201 @@ def getNneighbors(edgesfilename):
 
 import os,os.path
 import glob
+import numpy as np
+import random
 
 # tomamos como input el archivo en cuestion (asi sabemos donde buscar los tp), el numero de label (usando el orden de modbp) y el numero de modulo
 # o sea:
 # parameters: edgesfilename, layernumber, modulenumber
 
 def getnodesperlayermodule(edgesfilename,layer_index,modulenumber):
-    tpfolder=edgesfilename+"_oslo_files"
-    assert os.path.exists(tpfolder)
-    number_of_tp_files=len(glob.glob(tpfolder+"/tp*"))
-    tpfiles=[tpfolder+'/tp']+[tpfolder+'/tp'+str(n) for n in range(1,number_of_tp_files)]
-    tpindex=number_of_tp_files-1-layer_index
-    tpfilename=tpfiles[tpindex]
-
-    # open file with module information
+    # (the tp files are now parsed just once, see TPModuleIndex below)
+    return gettpmoduleindex(edgesfilename).nodes(layer_index,modulenumber)
+
+# streaming parser of an OSLOM tp file: for each module, the tp file has a line '#module <module_id> size: <size> bs: <bs>' followed by the line with its nodes
+# it yields (module_id,size,bs,nodes) for each module, nodes being an int32 array, reading the file one line at a time (instead of readlines() plus map(int,...) of the whole file)
+def itertpmodules(tpfilename):
     f=open(tpfilename,"r")
-    lines=f.readlines()
-    # these files contan an even number of lines: for each pair, the first line indicates module number (which is ordered, from 0) and the second one shows the list of nodes... so we need to take the second line and jump every two lines
-    filteredlines=lines[1::2]
-    #listnodespermodule=[]
-    #for l in filteredlines:
-    l=filteredlines[modulenumber]
-    q=l.split(" ")[:-1]
-    s=map(int,q) # s is a list of node labels (integers)
-    #listnodespermodule.append(s) 
-    return s
+    try:
+        for header in f:
+            if header.strip()=='': continue # (empty lines at the end, if any)
+            fields=header.split()
+            nodes=np.fromstring(f.next(),dtype=np.int32,sep=' ')
+            yield int(fields[1]),int(fields[3]),float(fields[5]),nodes
+    finally:
+        f.close()
+
+# one tp file (one layer) in compact (CSR) form, as numpy arrays:
+#   the nodes of module m are nodeids[moduleoffsets[m]:moduleoffsets[m+1]] (in the order of the tp file),
+#   and the other way around, the modules of node i are modulesofnode[nodeoffsets[i]:nodeoffsets[i+1]] (in ascending order)
+# (the module number is the position of the module in the tp file, as getnodesperlayermodule always did)
+# so the memory goes with the number of memberships, without the overhead of python lists of ints
+class TPLayer:
+    def __init__(self,tpfilename):
+        chunks=[]
+        self.sizes=[]
+        self.bs=[]
+        for module_id,size,bs,nodes in itertpmodules(tpfilename):
+            assert size==len(nodes), "size of module "+str(module_id)+" in "+tpfilename+" does not match its number of nodes"
+            chunks.append(nodes)
+            self.sizes.append(size)
+            self.bs.append(bs)
+        self.sizes=np.array(self.sizes,dtype=np.int64)
+        self.bs=np.array(self.bs)
+        self.number_of_modules=len(self.sizes)
+        self.moduleoffsets=np.zeros(self.number_of_modules+1,dtype=np.int64)
+        np.cumsum(self.sizes,out=self.moduleoffsets[1:])
+        if len(chunks)>0:
+            self.nodeids=np.concatenate(chunks)
+        else:
+            self.nodeids=np.zeros(0,dtype=np.int32)
+        del chunks
+        # (a stable sort of the memberships by node keeps the modules of each node in ascending order)
+        order=np.argsort(self.nodeids,kind='mergesort')
+        self.modulesofnode=np.repeat(np.arange(self.number_of_modules,dtype=np.int32),self.sizes)[order]
+        self.nodeoffsets=np.zeros(self.nodeids.max()+2 if len(self.nodeids)>0 else 1,dtype=np.int64)
+        np.cumsum(np.bincount(self.nodeids,minlength=len(self.nodeoffsets)-1),out=self.nodeoffsets[1:])
+
+    def nodes(self,modulenumber):
+        return self.nodeids[self.moduleoffsets[modulenumber]:self.moduleoffsets[modulenumber+1]]
+
+    def modules(self,node):
+        if node+1>=len(self.nodeoffsets):
+            return self.modulesofnode[:0]
+        return self.modulesofnode[self.nodeoffsets[node]:self.nodeoffsets[node+1]]
+
+# module index: every tp file (tp, tp1, tp2, ...) of the _oslo_files folder is parsed only once, into a TPLayer, keeping, for each layer (modbp convention: layer_index 0 is the top layer, i.e. the last tp file), the nodes of each module and the modules of each node
+# (getnodesperlayermodule used to glob the folder and re-read the whole tp file on every call, and it's called for every candidate path of every overlapping node...)
+class TPModuleIndex:
+    def __init__(self,edgesfilename):
+        tpfolder=edgesfilename+"_oslo_files"
+        assert os.path.exists(tpfolder)
+        self.number_of_layers=len(glob.glob(tpfolder+"/tp*"))
+        tpfiles=[tpfolder+'/tp']+[tpfolder+'/tp'+str(n) for n in range(1,self.number_of_layers)]
+        tpfiles.reverse() # so that the index of the list is the layer_index (see getnodesperlayermodule)
+        self.layers=[TPLayer(tpfilename) for tpfilename in tpfiles]
+        self.setnodespermodule=[{} for tpfilename in tpfiles] # setnodespermodule[layer_index][modulenumber] is the frozenset of nodes of the module, for the set operations (only for the modules that were asked for)
+
+    def nodes(self,layer_index,modulenumber):
+        # the list of nodes of the module (in the order of the tp file)
+        return self.layers[layer_index].nodes(modulenumber).tolist()
+
+    def nodeset(self,layer_index,modulenumber):
+        if modulenumber not in self.setnodespermodule[layer_index]:
+            self.setnodespermodule[layer_index][modulenumber]=frozenset(self.nodes(layer_index,modulenumber))
+        return self.setnodespermodule[layer_index][modulenumber]
+
+    def modules(self,layer_index,node):
+        # the (ordered) list of modules containing the node
+        return self.layers[layer_index].modules(node).tolist()
+
+    def modulesperlayer(self,node):
+        # the list (one item per layer) of lists of modules containing the node, as in modulesperlayerpernode[node]
+        return [self.modules(layer_index,node) for layer_index in range(self.number_of_layers)]
+
+# one index per edges file, so that the folder is parsed only once per run
+_tpmoduleindexes={}
+
+def gettpmoduleindex(edgesfilename):
+    if edgesfilename not in _tpmoduleindexes:
+        _tpmoduleindexes[edgesfilename]=TPModuleIndex(edgesfilename)
+    return _tpmoduleindexes[edgesfilename]
+
+# path resolution for overlapping nodes: instead of building the whole cartesian product of modules (one factor per layer) and then filtering it against every previously chosen path, we walk the module containment DAG depth-first, layer by layer, and prune a branch as soon as
+#   (a) the module at layer_index+1 is not contained in the module chosen at layer_index, or
+#   (b) the module was already committed (in a previously chosen path) under a different parent
+# (b) is the same as asking that, whenever a previous path shares the module at some layer, it also shares the whole path above it (as filter_allowed_paths used to do): sharing the parent at each such layer implies sharing the entire prefix, by induction
+# the surviving paths come out in the same order as in itertools.product, so the random choices made afterwards are the same as before
+class PathResolver:
+    def __init__(self,tpindex):
+        self.tpindex=tpindex
+        self.number_of_layers=tpindex.number_of_layers
+        self.containment={} # (layer_index,parentmodule,childmodule) -> bool, each superset check is done only once
+        self.committedparents={} # (layer_index,module) -> set of parent modules (at layer_index-1) used by the committed paths
+
+    def contains(self,layer_index,parentmodule,childmodule):
+        key=(layer_index,parentmodule,childmodule)
+        if key not in self.containment:
+            self.containment[key]=self.tpindex.nodeset(layer_index,parentmodule).issuperset(self.tpindex.nodeset(layer_index+1,childmodule))
+        return self.containment[key]
+
+    def compatible(self,layer_index,module,parentmodule):
+        parents=self.committedparents.get((layer_index,module))
+        return parents is None or (len(parents)==1 and parentmodule in parents)
+
+    def allowedpaths(self,modulesperlayer):
+        # modulesperlayer is modulesperlayerpernode[node] (one list of modules per layer)
+        allowed_paths=[]
+        if self.number_of_layers==0:
+            return allowed_paths
+        path=[]
+        stack=[(0,m) for m in reversed(modulesperlayer[0])] # (layer_index,module), popped in the order of the cartesian product
+        while len(stack)>0:
+            layer_index,module=stack.pop()
+            del path[layer_index:]
+            if layer_index>0 and not (self.contains(layer_index-1,path[-1],module) and self.compatible(layer_index,module,path[-1])):
+                continue
+            path.append(module)
+            if layer_index==self.number_of_layers-1:
+                allowed_paths.append(tuple(path))
+            else:
+                for m in reversed(modulesperlayer[layer_index+1]):
+                    stack.append((layer_index+1,m))
+        return allowed_paths
+
+    def commit(self,path):
+        # register a chosen path (to be called for every path appended to finalpath)
+        for layer_index in range(1,self.number_of_layers):
+            self.committedparents.setdefault((layer_index,path[layer_index]),set()).add(path[layer_index-1])
+
+# the path of modules (one per layer) chosen for each node, so that the layers become non-overlapping partitions: finalpath[i][layer_index] is the module of node i at layer_index
+# (this is the core of oslom2modbp.py, see the comments there; it is shared with the oslom2hierpart.py pipeline)
+def choosepaths(edgesfilename,N,neighbors):
+    tpindex=gettpmoduleindex(edgesfilename)
+    number_of_layers=tpindex.number_of_layers
+
+    finalpath=[]
+
+    # the filtering is done by a PathResolver (see above), that builds only the allowed paths, with a depth-first walk over the modules of the node, instead of filtering the whole cartesian product
+    #   (the old filter_allowed_paths checked, for each candidate path, consecutive-layer containment and, against every previous path in finalpath, that a shared module comes with the same path above it)
+    pathresolver=PathResolver(tpindex)
+
+    for i in range(N):
+        modulesperlayer=tpindex.modulesperlayer(i) # (this is modulesperlayerpernode[i])
+        if all(len(modules)==1 for modules in modulesperlayer): # (a single path, the cartesian product has just one element)
+            assert len(modulesperlayer)==number_of_layers # just to make sure that foreach node, every layer has an associated module
+            finalpath.append(tuple(modules[0] for modules in modulesperlayer))
+        else:
+            allowed_paths=pathresolver.allowedpaths(modulesperlayer)
+            # aca es donde nos queda hacer lo del scoring...
+            # y, al final, el ganador es el que metemos a la lista finalpath
+
+            # so what we do now is to take a score, going from the first layer to the last... we will end up selecting the node that contains the highest amount of neighbors of node i; hence, we will delete from the list paths all other paths in which this condition is not fulfilled... and keep on doing this for the next path, until we get to the final layer OR until we end up with only one path
+            for layer_index in range(number_of_layers): # vamos haciendolo por layer, siempre que len(allowed_paths)>1
+                possible_modules=list(set([p[layer_index] for p in allowed_paths]))
+                if len(possible_modules)==1: # if there's just one possible module in this layer, then just skip to the next layer
+                    continue
+                # this is the score we'll be using: the size of the intersection between a given module and the set of neighbors of node i
+                list_size_intersection=[len(tpindex.nodeset(layer_index,module).intersection(neighbors[i])) for module in possible_modules]
+                max_size_intersection=max(list_size_intersection)
+                indices=range(len(list_size_intersection))
+                best_modules_indices=filter(lambda x: list_size_intersection[x]==max_size_intersection,indices)
+                chosen_module_index=random.choice(best_modules_indices)
+                chosen_module=possible_modules[chosen_module_index]
+                # and now that we have chosen a module, let's eliminate all paths not having that module at this layer (with index 'layer_index')
+                allowed_paths=filter(lambda p: p[layer_index]==chosen_module, allowed_paths)
+
+            finalpath.append(random.choice(allowed_paths))
+        pathresolver.commit(finalpath[-1])
+        #print i,"::",finalpath[-1]
+
+    return finalpath
 
+# the modbp layer files: layerbasefilename.1, layerbasefilename.2, ..., with the module of each node (one line per node) at each layer
+def writelayerfiles(finalpath,layerbasefilename):
+    number_of_layers=len(finalpath[0]) if len(finalpath)>0 else 0
+    for l in range(number_of_layers):
+        f=open(layerbasefilename+"."+str(l+1),'w')
+        for i in range(len(finalpath)):
+            f.write(str(finalpath[i][l])+"\n")
+        f.close()